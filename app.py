@@ -9,7 +9,8 @@ import time
 from datetime import datetime, timedelta
 
 # Importamos ÚNICAMENTE el motor de Vertex (eliminamos la función vieja)
-from src.services.vertex_service import procesar_guia_ia_vertex
+from src.services.vertex_service import procesar_documentos_guia
+from src.services.planificador_ocr import CARRIL_INTERACTIVO, CARRIL_MASIVO, texto_estado_cola
 
 # --- MEJORA: Añadimos leer_sheet_seguro a la lista de importaciones ---
 from src.services.google_service import (
@@ -19,8 +20,11 @@ from src.services.google_service import (
     leer_sheet_seguro,
     obtener_catalogo_guias, buscar_guias_repositorio, descargar_guias_drive, actualizar_bitacora_guias, buscar_actualizar_guia
 )
+from src.services.cola_escritura import EN_COLA
 
 from src.config.settings import PLANTILLAS, CARPETAS_DESTINO # <-- Añade esto
+from src.utils.gre_xml_utils import expandir_archivos_guia
+from src.utils.pdf_utils import separar_guias_multipagina
 from src.utils.document_utils import inyectar_tabla_en_docx
 from src.utils.format_utils import (
     limpiar_monto, formato_inteligente, normalizar_fecha, 
@@ -147,6 +151,8 @@ st.session_state['usuario_nombre'] = bd_usuarios[correo_actual].get('Nombre', co
 
 with st.sidebar:
     st.info(f"👤 Conectado como: **{st.session_state['usuario_nombre']}**")
+    from src.services.cola_escritura import render_estado_cola
+    render_estado_cola()
     st.divider()
 
 if 'datos_extraidos' not in st.session_state:
@@ -282,7 +288,7 @@ if modulo_actual == "📄 Generador de Certificados":
 
         if not repositorio_masivo:
             # Verifica que tu línea sea así (usa uploader_key):
-            archivos = st.file_uploader("Sube tus guías", type=["pdf"], accept_multiple_files=True, key=f"uploader_{st.session_state.get('uploader_key', 0)}")
+            archivos = st.file_uploader("Sube tus guías (PDF, XML SUNAT o ZIP)", type=["pdf", "xml", "zip"], accept_multiple_files=True, key=f"uploader_{st.session_state.get('uploader_key', 0)}")
         else:
             archivos = st.session_state.get('archivos_mock', None)
 
@@ -302,11 +308,26 @@ if modulo_actual == "📄 Generador de Certificados":
                 prog = st.progress(0)
                 items, grl = [], None
                 errores = 0
-                total = len(archivos)
-                st.session_state['total_pdfs_leidos'] = total
                 
-                for i, arc in enumerate(archivos):
-                    d = procesar_guia_ia_vertex(arc.read())
+                # XML SUNAT (sueltos o dentro de ZIP) ya vienen estructurados: solo los PDF pasan por OCR
+                # Un PDF con varias guías se parte por cabecera y cada guía se lee en paralelo por separado
+                # Los documentos se consumen por ventanas: en memoria solo los PDFs de la ventana en curso
+                documentos = separar_guias_multipagina(expandir_archivos_guia(archivos))
+                
+                # Lectura concurrente: el orden de 'resultados' es el mismo que el de los documentos
+                # El planificador del proceso da prioridad a la subida manual sobre el Repositorio Masivo
+                aviso_cola = st.empty()
+                resultados = procesar_documentos_guia(
+                    documentos,
+                    al_avanzar=lambda hechos, vistos: prog.progress(min(1.0, hechos / max(vistos, len(archivos)))),
+                    usuario=st.session_state.get('usuario_email'),
+                    carril=CARRIL_MASIVO if repositorio_masivo else CARRIL_INTERACTIVO,
+                    al_esperar=lambda info: aviso_cola.caption(texto_estado_cola(info))
+                )
+                aviso_cola.empty()
+                st.session_state['total_pdfs_leidos'] = len(resultados)
+                
+                for d in resultados:
                     if d:
                         if not grl: grl = d 
                         s, f, p = d.get('serie','S/N'), d.get('fecha',''), d.get('vehiculo','')
@@ -320,7 +341,6 @@ if modulo_actual == "📄 Generador de Certificados":
                             })
                             items.append(it)
                     else: errores += 1
-                    prog.progress((i+1)/total)
                 
                 time.sleep(0.5); prog.empty()
                 
@@ -338,17 +358,7 @@ if modulo_actual == "📄 Generador de Certificados":
                     df['um'] = df['um'].apply(lambda x: 'KG' if 'KILO' in str(x).upper() else 'GLN' if 'GALO' in str(x).upper() else 'UNID' if 'UNIDA' in str(x).upper() else str(x).upper())
                     df['desc'] = df['desc'].apply(limpiar_descripcion)
                     
-                    def forzar_limpieza_guia(guia_str):
-                        s = str(guia_str).strip()
-                        if '-' in s:
-                            partes = s.split('-', 1)
-                            prefijo = partes[0].strip()
-                            numeros = ''.join(filter(str.isdigit, partes[1]))
-                            if numeros:
-                                return f"{prefijo}-{int(numeros)}"
-                        return s
-                    
-                    df['guia_origen'] = df['guia_origen'].apply(forzar_limpieza_guia)
+                    df['guia_origen'] = df['guia_origen'].apply(lambda g: formatear_guia(str(g).strip()))
                     df['fecha_origen'] = df['fecha_origen'].apply(normalizar_fecha)
 
                     def fecha_a_entero(fecha_str):
@@ -410,10 +420,10 @@ if modulo_actual == "📄 Generador de Certificados":
         # --- MEJORA: CÁLCULO INTELIGENTE DEL CORRELATIVO DESDE SHEETS ---
         siguiente_corr = "001" # Valor por defecto si la hoja está vacía
         try:
-            from src.services.google_service import leer_sheet_seguro
+            from src.services.google_service import leer_historial
             import pandas as pd
             
-            df_historial = leer_sheet_seguro("Historial")
+            df_historial = leer_historial()
             
             if not df_historial.empty and "Correlativo" in df_historial.columns:
                 # BIFURCACIÓN PARA BÚSQUEDA INDEPENDIENTE
@@ -607,46 +617,21 @@ if modulo_actual == "📄 Generador de Certificados":
     # ====================================================================
     st.divider()
 
-    def inyectar_estado_sheets_robusto(numero_de_guia):
-        # Actualización robusta de estado en Sheets
+    def inyectar_estado_sheets_robusto(numeros_de_guia):
+        # Marca todas las guías generadas en una sola escritura (batchUpdate) usando el índice por número canónico
         try:
-            from zoneinfo import ZoneInfo
-            from src.config.settings import ID_SHEET_REPOSITORIO
-            from src.services.google_service import obtener_servicios
+            from src.services.google_service import obtener_servicios, marcar_guias_procesadas
             
             _, sht_drv = obtener_servicios()
-            target_ws_title = "Guias_recibidas"
-            
-            r = sht_drv.spreadsheets().values().get(spreadsheetId=ID_SHEET_REPOSITORIO, range=f"'{target_ws_title}'!B:B").execute()
-            col_guias = r.get('values', [])
+            ok, faltantes = marcar_guias_procesadas(sht_drv, numeros_de_guia, parcial=True)
             
-            fila_encontrada = None
-            import re
-            
-            def norm_g(s):
-                t = re.sub(r'(?i)[nº°\s_]', '', str(s)).lower()
-                return "".join([p.lstrip('0') if p.isdigit() else p for p in re.findall(r'[a-z]+|[0-9]+', t)])
-
-            guia_clean = norm_g(numero_de_guia)
-            
-            for i, val in enumerate(col_guias):
-                if val and len(val) > 0:
-                    celda_clean = norm_g(val[0])
-                    if celda_clean == guia_clean or (len(guia_clean) >= 4 and guia_clean in celda_clean):
-                        fila_encontrada = i + 1
-                        break
-                    
-            if fila_encontrada:
-                body = {"values": [[f"✅ Nuevo: {datetime.now(ZoneInfo('America/Lima')).strftime('%d/%m/%Y')}"]]}
-                sht_drv.spreadsheets().values().update(
-                    spreadsheetId=ID_SHEET_REPOSITORIO, range=f"'{target_ws_title}'!H{fila_encontrada}",
-                    valueInputOption="USER_ENTERED", body=body
-                ).execute()
-            else:
-                st.warning(f"⚠️ Sheets: No se encontró la guía '{numero_de_guia}' en la columna B de '{target_ws_title}'.")
+            for numero in faltantes:
+                st.warning(f"⚠️ Sheets: No se encontró la guía '{numero}' en la columna B de 'Guias_recibidas'.")
+            if not ok:
+                st.error(f"❌ Error API Sheets marcando las guías: {', '.join(map(str, numeros_de_guia))}")
                 
         except Exception as e:
-            st.error(f"❌ Error API Sheets con guía {numero_de_guia}: {str(e)}")
+            st.error(f"❌ Error API Sheets con guías {', '.join(map(str, numeros_de_guia))}: {str(e)}")
 
     if 'msg_generado' not in st.session_state: st.session_state.msg_generado = False
     if 'msg_descargado' not in st.session_state: st.session_state.msg_descargado = False
@@ -690,6 +675,7 @@ if modulo_actual == "📄 Generador de Certificados":
                         
                         exitosos = []
                         fallidos = []
+                        guias_a_marcar = []
                         
                         for idx, archivo in enumerate(guias_unicas):
                             st.toast(f"Procesando guía {archivo}...")
@@ -777,7 +763,7 @@ if modulo_actual == "📄 Generador de Certificados":
                                 
                                 if link_drive:
                                     st.markdown(f"📄 **Certificado Generado:** [Ver Documento]({link_drive})")
-                                    inyectar_estado_sheets_robusto(str(archivo).upper())
+                                    guias_a_marcar.append(str(archivo).upper())
                                 
                             except Exception as e:
                                 fallidos.append((archivo, str(e)))
@@ -786,6 +772,9 @@ if modulo_actual == "📄 Generador de Certificados":
                             finally:
                                 progreso.progress((idx + 1) / len(guias_unicas))
                                 
+                        if guias_a_marcar:
+                            inyectar_estado_sheets_robusto(guias_a_marcar)
+                            
                         if exitosos:
                             st.success(f"✅ Se generaron {len(exitosos)} certificados exitosamente.")
                             st.balloons()
@@ -969,7 +958,8 @@ if modulo_actual == "📄 Generador de Certificados":
                     num_certificadas = len(guias_lista)
                 else:
                     val_guia_completa = str(v_guia).strip().upper()
-                    num_certificadas = 1 if val_guia_completa else 0
+                    guias_lista = [val_guia_completa] if val_guia_completa else []
+                    num_certificadas = len(guias_lista)
 
                 # --- NUEVO: Inyección del Registro de Auditoría Control ---
                 modo_audio = "Modelo" if es_modelo else ("Manual" if modo_manual else ("OCR Masivo" if repositorio_masivo else "OCR PDF"))
@@ -986,20 +976,21 @@ if modulo_actual == "📄 Generador de Certificados":
                 fecha_registro = (datetime.utcnow() - timedelta(hours=5)).strftime("%d/%m/%Y")
                 datos_log = [fecha_registro, val_empresa, val_fundo, v_corr, val_cert, val_guia_completa, "", link_final, "", ""]
                             
-                if registrar_en_control(datos_log):
+                resultado_registro = registrar_en_control(datos_log)
+                if resultado_registro:
                     if link_drive:
                         st.session_state['msg_generado'] = False
                         st.session_state['msg_descargado'] = False
                         st.session_state['metricas_exitosos'] += 1
                         
-                        st.success("✅ ¡Operación Exitosa! Documento en Drive y base de datos actualizada.")
+                        if resultado_registro == EN_COLA:
+                            st.success("✅ ¡Operación Exitosa! Documento en Drive; el registro quedó en cola y llegará a la base de datos en segundos (la barra lateral avisa si falla).")
+                        else:
+                            st.success("✅ ¡Operación Exitosa! Documento en Drive y base de datos actualizada.")
                         
                         # --- NUEVO: Actualizar bitácora del repositorio masivo si aplica ---
-                        if num_certificadas > 0:
-                            for g_str in guias_lista:
-                                inyectar_estado_sheets_robusto(g_str)
-                        elif val_guia_completa:
-                            inyectar_estado_sheets_robusto(val_guia_completa)
+                        if guias_lista:
+                            inyectar_estado_sheets_robusto(guias_lista)
                         
                         if locals().get('repositorio_masivo', False) and 'guias_repo' in st.session_state:
                             del st.session_state['guias_repo'] # Limpiar sesión
@@ -1008,7 +999,8 @@ if modulo_actual == "📄 Generador de Certificados":
                         
                         st.cache_data.clear() 
                     else:
-                        st.warning("⚠️ El registro se guardó en el Excel, pero Drive rechazó el archivo.")
+                        st.warning("⚠️ El registro se guardó en el Excel, pero Drive rechazó el archivo." if resultado_registro is True
+                                   else "⚠️ El registro quedó en cola hacia el Excel, pero Drive rechazó el archivo.")
                 else:
                     st.error("❌ Falló la conexión con Sheets.")
 
@@ -1032,9 +1024,30 @@ elif modulo_actual == "🏢 Sigersol":
                 col1.metric(label="Certificados", value=st.session_state.get('metricas_exitosos', 0), delta="Esta sesión")
                 col2.metric(label="Errores", value=st.session_state.get('metricas_errores', 0), delta="Alertas", delta_color="inverse")
                 st.divider()
+                from src.services.metricas_service import render_metricas_vertex
+                render_metricas_vertex()
+                st.divider()
+                from src.services.vertex_batch import render_lotes_vertex
+                render_lotes_vertex()
+                st.divider()
+                from src.services.cola_escritura import render_cola_escritura
+                render_cola_escritura()
+                st.divider()
                 if st.button("Forzar Purga de Caché GCP", use_container_width=True):
                     st.cache_data.clear()
-                    st.success("Toda la Memoria RAM del entorno purgó Sheets y Drive.")
+                    from src.services.vertex_client import reiniciar_clientes_vertex
+                    reiniciar_clientes_vertex()
+                    from src.services.guias_recibidas import invalidar_instantanea
+                    invalidar_instantanea()
+                    from src.services.sheets_incremental import reiniciar_sincronizacion
+                    reiniciar_sincronizacion()
+                    from src.services.datos_maestros import invalidar_datos_maestros
+                    invalidar_datos_maestros()
+                    from src.services.cache_service import purgar_cache_extraccion
+                    if purgar_cache_extraccion():
+                        st.success("Toda la Memoria RAM del entorno purgó Sheets y Drive, y la caché OCR quedó vacía.")
+                    else:
+                        st.warning("Sheets y Drive purgados, pero no se pudo vaciar la caché OCR (ver logs).")
                     
     from src.modules.sigersol import render_sigersol
     render_sigersol()
\ No newline at end of file
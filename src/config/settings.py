@@ -13,6 +13,7 @@ load_dotenv()
 # Google IDs
 ID_SHEET_REPOSITORIO = "14As5bCpZi56V5Nq1DRs0xl6R1LuOXLvRRoV26nI50NU"
 ID_SHEET_CONTROL = "14As5bCpZi56V5Nq1DRs0xl6R1LuOXLvRRoV26nI50NU"
+ID_SHEET_RBAC = "1OglcHUuRkD6LErUMevr-tOmAsLZpQEk2OKn8NyJN8mo" # Usuario_Roles y pestaña de auditoría Control
 
 CARPETAS_DESTINO = {
     "EPMI S.A.C.": {
@@ -63,3 +64,130 @@ if not GCP_PROJECT and "gcp_service_account" in st.secrets:
     GCP_PROJECT = st.secrets["gcp_service_account"].get("project_id")
 
 GCP_LOCATION = os.getenv("GCP_LOCATION", "us-central1")
+
+# ====================================================================
+# --- BLOQUE 4: Rendimiento del Motor OCR (Caché y Concurrencia) ---
+# ====================================================================
+import tempfile
+
+# Caché en disco de extracciones Vertex (compartida entre sesiones y procesos)
+OCR_CACHE_DIR = os.getenv("OCR_CACHE_DIR", os.path.join(tempfile.gettempdir(), "certificados_ocr_cache"))
+OCR_CACHE_MAX_MB = int(os.getenv("OCR_CACHE_MAX_MB", "200"))
+
+# Número de guías que una sesión procesaría en paralelo (base del planificador compartido)
+OCR_MAX_CONCURRENCIA = int(os.getenv("OCR_MAX_CONCURRENCIA", "4"))
+
+# Planificador OCR del proceso: hilos compartidos por todas las sesiones y turno reservado al carril masivo
+OCR_PLANIFICADOR_HILOS = int(os.getenv("OCR_PLANIFICADOR_HILOS", str(OCR_MAX_CONCURRENCIA * 2)))
+OCR_TURNO_MASIVO = int(os.getenv("OCR_TURNO_MASIVO", "4")) # 1 de cada N despachos va al carril masivo
+
+# Empaquetado de guías pequeñas en una sola llamada a Gemini (K adaptativo según bytes)
+OCR_EMPAQUETAR = os.getenv("OCR_EMPAQUETAR", "1") == "1"
+OCR_EMPAQUE_MAX_DOCS = int(os.getenv("OCR_EMPAQUE_MAX_DOCS", "5"))
+OCR_EMPAQUE_MAX_BYTES = int(os.getenv("OCR_EMPAQUE_MAX_BYTES", str(8 * 1024 * 1024)))
+OCR_EMPAQUE_DOC_MAX_BYTES = int(os.getenv("OCR_EMPAQUE_DOC_MAX_BYTES", str(1024 * 1024)))
+# Documentos por ventana al procesar una subida: acota la memoria (PDFs vivos a la vez) sin importar el tamaño del lote
+OCR_VENTANA_DOCUMENTOS = int(os.getenv("OCR_VENTANA_DOCUMENTOS", "32"))
+
+# Optimización del payload antes del OCR (páginas en blanco/duplicadas, imágenes reducidas)
+OCR_OPTIMIZAR_PAYLOAD = os.getenv("OCR_OPTIMIZAR_PAYLOAD", "1") == "1"
+OCR_IMAGEN_MAX_PX = int(os.getenv("OCR_IMAGEN_MAX_PX", "2000")) # Lado mayor suficiente para leer una guía A4 (~200 dpi)
+OCR_IMAGEN_CALIDAD_JPEG = int(os.getenv("OCR_IMAGEN_CALIDAD_JPEG", "80"))
+
+# PDFs con varias guías: se parten por cabecera (serie / 'Página 1 de N') y cada guía se extrae por separado
+OCR_DIVIDIR_MULTIGUIA = os.getenv("OCR_DIVIDIR_MULTIGUIA", "1") == "1"
+
+# Cascada por campo: solo los campos que no validan se vuelven a pedir a un modelo pro
+OCR_ESCALAR_CAMPOS = os.getenv("OCR_ESCALAR_CAMPOS", "1") == "1"
+
+# Enrutamiento por complejidad: documentos triviales al modelo ligero, difíciles directo a pro
+OCR_ENRUTAR_COMPLEJIDAD = os.getenv("OCR_ENRUTAR_COMPLEJIDAD", "1") == "1"
+VERTEX_MODELOS_LIGEROS = [m.strip() for m in os.getenv("VERTEX_MODELOS_LIGEROS", "gemini-1.5-flash-8b").split(",") if m.strip()]
+OCR_TRIVIAL_MAX_PAGINAS = int(os.getenv("OCR_TRIVIAL_MAX_PAGINAS", "1"))
+OCR_TRIVIAL_MAX_BYTES = int(os.getenv("OCR_TRIVIAL_MAX_BYTES", str(300 * 1024)))
+OCR_DIFICIL_MIN_PAGINAS = int(os.getenv("OCR_DIFICIL_MIN_PAGINAS", "6"))
+OCR_DIFICIL_MIN_BYTES = int(os.getenv("OCR_DIFICIL_MIN_BYTES", str(4 * 1024 * 1024)))
+
+# Rutas Vertex (orden de preferencia inicial) y cortacircuitos de salud por (región, modelo)
+VERTEX_REGIONES = [r.strip() for r in os.getenv("VERTEX_REGIONES", "us-central1,us-west1,us-east4,southamerica-east1").split(",") if r.strip()]
+VERTEX_FALLOS_PARA_ABRIR = int(os.getenv("VERTEX_FALLOS_PARA_ABRIR", "3"))
+VERTEX_ENFRIAMIENTO_S = int(os.getenv("VERTEX_ENFRIAMIENTO_S", "120"))
+VERTEX_ENFRIAMIENTO_404_S = int(os.getenv("VERTEX_ENFRIAMIENTO_404_S", "3600"))
+
+# Plazos con cancelación real (por llamada y por lote) y cobertura al p95 de la ruta principal
+VERTEX_PLAZO_LLAMADA_S = float(os.getenv("VERTEX_PLAZO_LLAMADA_S", "60"))
+OCR_PLAZO_LOTE_S = float(os.getenv("OCR_PLAZO_LOTE_S", "900"))
+VERTEX_COBERTURA = os.getenv("VERTEX_COBERTURA", "1") == "1"
+
+# Concurrencia adaptativa (AIMD) compartida por todas las sesiones y reintentos ante 429 / RESOURCE_EXHAUSTED
+VERTEX_CONCURRENCIA_INICIAL = int(os.getenv("VERTEX_CONCURRENCIA_INICIAL", "4"))
+VERTEX_CONCURRENCIA_MIN = int(os.getenv("VERTEX_CONCURRENCIA_MIN", "1"))
+VERTEX_CONCURRENCIA_MAX = int(os.getenv("VERTEX_CONCURRENCIA_MAX", "16"))
+VERTEX_REINTENTOS_CUOTA = int(os.getenv("VERTEX_REINTENTOS_CUOTA", "4"))
+VERTEX_BACKOFF_BASE_S = float(os.getenv("VERTEX_BACKOFF_BASE_S", "1"))
+VERTEX_BACKOFF_MAX_S = float(os.getenv("VERTEX_BACKOFF_MAX_S", "30"))
+
+# Métricas por llamada Vertex (almacén local solo-inserción) y precios de referencia USD por 1M tokens (entrada, salida)
+METRICAS_DIR = os.getenv("METRICAS_DIR", OCR_CACHE_DIR)
+METRICAS_VENTANA_H = int(os.getenv("METRICAS_VENTANA_H", "24"))
+METRICAS_RETENCION_H = int(os.getenv("METRICAS_RETENCION_H", "168")) # Filas más viejas se borran (nunca menos que la ventana)
+PRECIOS_VERTEX_USD_1M = {
+    "gemini-2.0-flash-001": (0.15, 0.60),
+    "gemini-2.5-flash": (0.30, 2.50),
+    "gemini-1.5-flash-002": (0.075, 0.30),
+    "gemini-1.5-flash-8b": (0.0375, 0.15),
+    "gemini-2.5-pro": (1.25, 10.00),
+    "gemini-3.1-pro-preview": (2.00, 12.00),
+    "gemini-1.5-pro-002": (1.25, 5.00),
+}
+PRECIO_TOKENS_CACHE_FACTOR = float(os.getenv("PRECIO_TOKENS_CACHE_FACTOR", "0.25")) # Tokens de entrada servidos desde caché de contexto
+
+# Reglas fijas del prompt como system_instruction; por llamada solo viaja el documento. Vertex factura igual la
+# instrucción: solo se sirve desde caché si el prefijo alcanza el mínimo de caché implícita del modelo
+VERTEX_INSTRUCCION_SISTEMA = os.getenv("VERTEX_INSTRUCCION_SISTEMA", "1") == "1"
+# "vertex" (real) o "simulado" (sustituto local sin red para medir tokens de entrada y tiempo al primer token)
+VERTEX_BACKEND = os.getenv("VERTEX_BACKEND", "vertex")
+
+# Modo lote nocturno (Vertex Batch Prediction): pendientes de Guias_recibidas en un solo job asíncrono
+VERTEX_LOTE_BACKEND = os.getenv("VERTEX_LOTE_BACKEND", "simulado" if VERTEX_BACKEND == "simulado" else "vertex")
+VERTEX_LOTE_MODELO = os.getenv("VERTEX_LOTE_MODELO", "gemini-2.0-flash-001")
+VERTEX_LOTE_REGION = os.getenv("VERTEX_LOTE_REGION", GCP_LOCATION)
+VERTEX_LOTE_GCS_URI = os.getenv("VERTEX_LOTE_GCS_URI", "") # gs://bucket/prefijo, obligatorio con el backend vertex
+VERTEX_LOTE_DIR = os.getenv("VERTEX_LOTE_DIR", os.path.join(OCR_CACHE_DIR, "lotes_vertex"))
+VERTEX_LOTE_SONDEO_S = float(os.getenv("VERTEX_LOTE_SONDEO_S", "60"))
+VERTEX_LOTE_SIMULADO_DEMORA_S = float(os.getenv("VERTEX_LOTE_SIMULADO_DEMORA_S", "5"))
+
+# Backend simulado (VERTEX_BACKEND=simulado): latencia extra, errores inyectados y respuestas grabadas
+SIMULADO_LATENCIA = os.getenv("SIMULADO_LATENCIA", "fija:0") # fija:s | uniforme:min:max | lognormal:mediana:sigma
+SIMULADO_TASA_404 = float(os.getenv("SIMULADO_TASA_404", "0"))
+SIMULADO_TASA_429 = float(os.getenv("SIMULADO_TASA_429", "0"))
+SIMULADO_TASA_MALFORMADO = float(os.getenv("SIMULADO_TASA_MALFORMADO", "0"))
+SIMULADO_MODELOS_404 = [m.strip() for m in os.getenv("SIMULADO_MODELOS_404", "").split(",") if m.strip()] # Siempre 404
+SIMULADO_SEMILLA = int(os.getenv("SIMULADO_SEMILLA", "0"))
+SIMULADO_RESPUESTAS_DIR = os.getenv("SIMULADO_RESPUESTAS_DIR", "")
+SIMULADO_ESCALA = float(os.getenv("SIMULADO_ESCALA", "1")) # <1 acelera todas las esperas (benchmarks)
+# Con el backend real, guarda la respuesta de cada documento para reproducirla después con el simulado
+VERTEX_GRABAR_DIR = os.getenv("VERTEX_GRABAR_DIR", "")
+
+# ====================================================================
+# --- BLOQUE 5: Lecturas de Google Sheets (Instantáneas Compartidas) ---
+# ====================================================================
+# Guias_recibidas se descarga una vez y se comparte entre sesiones; las marcas propias se aplican al vuelo
+GUIAS_INSTANTANEA_TTL_S = int(os.getenv("GUIAS_INSTANTANEA_TTL_S", "60"))
+# Pestañas que solo crecen por abajo: se piden las filas nuevas y una ventana de cola para detectar ediciones
+SHEETS_DELTA_VENTANA = int(os.getenv("SHEETS_DELTA_VENTANA", "20"))
+HISTORIAL_TTL_S = int(os.getenv("HISTORIAL_TTL_S", "60")) # Lectura del historial para el correlativo
+REGISTRO_GUIAS_TTL_S = int(os.getenv("REGISTRO_GUIAS_TTL_S", "60")) # Registro_Guias de Sigersol (la marca en O la vence)
+# EMPRESAS, CLIENTES, SERVICIOS, COMERCIALIZACION y Usuario_Roles: un batchGet por Spreadsheet, compartido entre sesiones
+MAESTROS_TTL_S = int(os.getenv("MAESTROS_TTL_S", "600"))
+
+# ====================================================================
+# --- BLOQUE 6: Escrituras Diferidas a Google Sheets (Diario Local) ---
+# ====================================================================
+# historial y auditoría se anotan en un SQLite local y un hilo los envía agrupados por pestaña
+# Debe ser un volumen persistente (sobrevive a reinicios del contenedor); vacío = sin diario, se escribe directo
+COLA_ESCRITURA_DIR = os.getenv("COLA_ESCRITURA_DIR", "")
+COLA_ESCRITURA_INTERVALO_S = float(os.getenv("COLA_ESCRITURA_INTERVALO_S", "2")) # Espera para juntar filas en un append
+COLA_ESCRITURA_LOTE = int(os.getenv("COLA_ESCRITURA_LOTE", "200")) # Máximo de filas por values.append
+COLA_ESCRITURA_MAX_INTENTOS = int(os.getenv("COLA_ESCRITURA_MAX_INTENTOS", "8")) # Después queda como fallida
+COLA_ESCRITURA_BACKOFF_MAX_S = float(os.getenv("COLA_ESCRITURA_BACKOFF_MAX_S", "300"))
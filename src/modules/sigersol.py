@@ -3,10 +3,13 @@ import pandas as pd
 from datetime import datetime
 from googleapiclient.discovery import build
 
-from src.config.settings import ID_SHEET_CONTROL
+from src.config.settings import ID_SHEET_CONTROL, REGISTRO_GUIAS_TTL_S
 from src.services.google_service import obtener_servicios, descargar_guias_drive
-from src.services.vertex_service import procesar_guia_ia_vertex_sigersol
+from src.services.sheets_incremental import sincronizar_pestana, vencer_pestana
+from src.services.vertex_service import procesar_lote_guias_vertex
+from src.services.planificador_ocr import CARRIL_MASIVO, texto_estado_cola
 from src.utils.format_utils import limpiar_monto, formato_inteligente
+from src.utils.gre_xml_utils import expandir_archivos_guia
 import time
 
 # ID del destino dado en el prompt
@@ -16,9 +19,11 @@ def leer_registro_guias():
     _, sheets = obtener_servicios()
     if not sheets: return pd.DataFrame()
     try:
-        # Obtenemos todo el rango incluyendo la columna O (Sigersol)
-        r = sheets.spreadsheets().values().get(spreadsheetId=ID_SHEET_CONTROL, range="'Registro_Guias'!A:P").execute()
-        v = r.get('values', [])
+        # Obtenemos todo el rango incluyendo la columna O (Sigersol): tras la primera lectura solo llegan
+        # las filas nuevas y la columna O de las anteriores, como mucho cada REGISTRO_GUIAS_TTL_S
+        # (actualizar_sigersol_origen vence la pestaña al marcar, así la marca propia se ve al instante)
+        v = sincronizar_pestana(sheets, ID_SHEET_CONTROL, "Registro_Guias", "P", ("O",),
+                                ttl_s=REGISTRO_GUIAS_TTL_S)["filas"]
         if not v or len(v) < 2: return pd.DataFrame()
         
         headers = v[0]
@@ -55,6 +60,7 @@ def actualizar_sigersol_origen(filas_excel_idx):
             "data": data
         }
         sheets.spreadsheets().values().batchUpdate(spreadsheetId=ID_SHEET_CONTROL, body=body).execute()
+        vencer_pestana(ID_SHEET_CONTROL, "Registro_Guias")
         return True
     except Exception as e:
         st.error(f"Error actualizando origen: {e}")
@@ -248,39 +254,57 @@ def render_sigersol():
                     progreso = st.progress(0)
                     total_docs = len(df_filtrado)
                     
+                    # 1. Descarga: XML SUNAT -> datos directos; PDF -> se junta para el lote OCR
+                    documentos_por_fila = []
                     for i, (idx_df, row) in enumerate(df_filtrado.iterrows()):
                         row_excel_idx = row['_excel_row_idx']
                         nombre_archivo = str(row.get(col_guia_hecha, '')).strip()
                         
                         if nombre_archivo and nombre_archivo.lower() not in ['nan', 'none', '']:
                             archivos = descargar_guias_drive(drv, [nombre_archivo])
-                            if archivos and len(archivos) > 0:
-                                # Llamar a Vertex OCR exclusivo Sigersol
-                                data_ia = procesar_guia_ia_vertex_sigersol(archivos[0].read())
-                                if data_ia and 'items' in data_ia:
-                                    suma_peso = 0.0
-                                    descripciones = []
-                                    for item in data_ia['items']:
-                                        peso_str = item.get('peso', '0')
-                                        peso_float = float(formato_inteligente(limpiar_monto(peso_str)) or 0.0)
-                                        suma_peso += peso_float
-                                        
-                                        desc = str(item.get('desc', '')).strip().upper()
-                                        if desc:
-                                            descripciones.append(desc)
-                                    
-                                    desc_final = " / ".join(set(descripciones)) if descripciones else "RESIDUOS SOLIDOS NO PELIGROSOS"
-                                    
-                                    # Integrar Documentos Relacionados
-                                    doc_rel = str(data_ia.get('documentos_relacionados', '')).strip()
-                                    if doc_rel and doc_rel.upper() not in ["S/D", "NONE", "NULL", ""]:
-                                        desc_final += f" - {doc_rel}"
-                                    
-                                    st.session_state.sigersol_ia_cache[row_excel_idx] = {
-                                        "cantidad": f"{suma_peso:.2f}",
-                                        "descripcion": desc_final
-                                    }
-                        progreso.progress((i + 1) / total_docs)
+                            documentos = list(expandir_archivos_guia(archivos[:1])) if archivos else []
+                            if documentos:
+                                documentos_por_fila.append((row_excel_idx, documentos[0]))
+                        progreso.progress((i + 1) / total_docs * 0.5)
+                    
+                    # 2. OCR exclusivo Sigersol en el carril masivo del planificador (no frena las subidas manuales)
+                    aviso_cola = st.empty()
+                    resultados_ocr = iter(procesar_lote_guias_vertex(
+                        [doc['contenido'] for _, doc in documentos_por_fila if 'contenido' in doc],
+                        conjunto="sigersol",
+                        al_avanzar=lambda hechos, tot: progreso.progress(0.5 + hechos / tot * 0.5),
+                        usuario=st.session_state.get('usuario_email'),
+                        carril=CARRIL_MASIVO,
+                        al_esperar=lambda info: aviso_cola.caption(texto_estado_cola(info))
+                    ))
+                    aviso_cola.empty()
+                    
+                    for row_excel_idx, doc in documentos_por_fila:
+                        data_ia = doc['datos'] if 'datos' in doc else next(resultados_ocr)
+                        if data_ia and 'items' in data_ia:
+                            suma_peso = 0.0
+                            descripciones = []
+                            for item in data_ia['items']:
+                                peso_str = item.get('peso', '0')
+                                peso_float = float(formato_inteligente(limpiar_monto(peso_str)) or 0.0)
+                                suma_peso += peso_float
+                                
+                                desc = str(item.get('desc', '')).strip().upper()
+                                if desc:
+                                    descripciones.append(desc)
+                            
+                            desc_final = " / ".join(set(descripciones)) if descripciones else "RESIDUOS SOLIDOS NO PELIGROSOS"
+                            
+                            # Integrar Documentos Relacionados
+                            doc_rel = str(data_ia.get('documentos_relacionados', '')).strip()
+                            if doc_rel and doc_rel.upper() not in ["S/D", "NONE", "NULL", ""]:
+                                desc_final += f" - {doc_rel}"
+                            
+                            st.session_state.sigersol_ia_cache[row_excel_idx] = {
+                                "cantidad": f"{suma_peso:.2f}",
+                                "descripcion": desc_final
+                            }
+                    progreso.progress(1.0)
                     
                     time.sleep(0.5)
                     progreso.empty()
@@ -436,7 +460,25 @@ def render_sigersol():
                 cx1.metric(label="Certificados", value=st.session_state.get('metricas_exitosos', 0), delta="Esta sesión")
                 cx2.metric(label="Errores", value=st.session_state.get('metricas_errores', 0), delta="Alertas", delta_color="inverse")
                 st.divider()
+                from src.services.metricas_service import render_metricas_vertex
+                render_metricas_vertex()
+                st.divider()
+                from src.services.cola_escritura import render_cola_escritura
+                render_cola_escritura()
+                st.divider()
                 if st.button("Forzar Purga GCP", key="btn_purge_sigersol", use_container_width=True):
                     st.cache_data.clear()
-                    st.success("Toda la Memoria RAM del entorno purgó Sheets y Drive.")
+                    from src.services.vertex_client import reiniciar_clientes_vertex
+                    reiniciar_clientes_vertex()
+                    from src.services.guias_recibidas import invalidar_instantanea
+                    invalidar_instantanea()
+                    from src.services.sheets_incremental import reiniciar_sincronizacion
+                    reiniciar_sincronizacion()
+                    from src.services.datos_maestros import invalidar_datos_maestros
+                    invalidar_datos_maestros()
+                    from src.services.cache_service import purgar_cache_extraccion
+                    if purgar_cache_extraccion():
+                        st.success("Toda la Memoria RAM del entorno purgó Sheets y Drive, y la caché OCR quedó vacía.")
+                    else:
+                        st.warning("Sheets y Drive purgados, pero no se pudo vaciar la caché OCR (ver logs).")
 
@@ -0,0 +1,107 @@
+# ====================================================================
+# --- BLOQUE 0: Imports (los de src van dentro de las funciones: el entorno se fija antes de leer settings) ---
+# ====================================================================
+import os
+import sys
+import json
+import time
+import tempfile
+
+# ====================================================================
+# --- BLOQUE 1: Entorno Aislado (Sin Red, Sin Caché ni Métricas Reales) ---
+# ====================================================================
+def preparar_entorno(directorio=None):
+    """
+    Apunta el proceso al modelo simulado y a una carpeta temporal propia para caché, métricas y lotes.
+    Debe llamarse antes del primer import de src.config.settings (por eso el CLI lo hace al arrancar).
+    Las esperas simuladas y de backoff se acortan para medir el comportamiento, no los segundos de espera.
+    """
+    if "src.config.settings" in sys.modules:
+        raise RuntimeError("preparar_entorno debe llamarse antes de importar src.config.settings")
+    directorio = directorio or tempfile.mkdtemp(prefix="benchmark_ocr_")
+    os.environ["VERTEX_BACKEND"] = "simulado"
+    os.environ["OCR_CACHE_DIR"] = directorio
+    os.environ["METRICAS_DIR"] = directorio
+    os.environ.setdefault("SIMULADO_ESCALA", "0.1")
+    os.environ.setdefault("VERTEX_BACKOFF_BASE_S", "0.05")
+    os.environ.setdefault("VERTEX_BACKOFF_MAX_S", "0.5")
+    return directorio
+
+# ====================================================================
+# --- BLOQUE 2: Corrida sobre el Corpus Sintético ---
+# ====================================================================
+def _medir_pasada(documentos, verdades):
+    from src.services.vertex_service import procesar_lote_guias_vertex
+    from src.services.metricas_service import resumen_metricas
+    from src.utils.validacion_utils import CAMPOS_OBLIGATORIOS_GUIA
+
+    t0 = time.time()
+    resultados = procesar_lote_guias_vertex(documentos, empaquetar=True)
+    duracion = time.time() - t0
+    m = resumen_metricas(ventana_h=(time.time() - t0) / 3600)
+
+    locales = m["por_resultado_local"]
+    n_locales = sum(locales.values())
+    correctas = sum(1 for r, g in zip(resultados, verdades)
+                    if r and all(r.get(c) == g[c] for c in CAMPOS_OBLIGATORIOS_GUIA))
+    return {
+        "guias": len(documentos),
+        "segundos": round(duracion, 2),
+        "guias_por_s": round(len(documentos) / duracion, 2) if duracion else 0.0,
+        "fallidas": sum(1 for r in resultados if r is None),
+        "correctas": correctas,
+        "llamadas": m["llamadas"],
+        "llamadas_por_guia_vertex": m["llamadas_por_guia"],
+        "reintentos": m["llamadas"] - m["exitosas"],
+        "por_resultado": m["por_resultado"],
+        "tasa_cache": round(locales.get("cache", 0) / n_locales, 3) if n_locales else 0.0,
+        "resueltas_por_texto": locales.get("texto", 0),
+        "p50_s": m["p50_s"],
+        "p95_s": m["p95_s"],
+        "costo_usd": m["costo_usd"],
+    }
+
+def ejecutar_benchmark(n_documentos=40, semilla=0, pasadas=2, proporcion_escaneadas=0.6, proporcion_multiguia=0.1,
+                       **simulado):
+    """
+    Genera el corpus sintético, registra la verdad de cada guía como respuesta del modelo simulado y lo procesa
+    'pasadas' veces con procesar_lote_guias_vertex (la segunda mide la caché). 'simulado' son opciones de
+    configurar_simulado: latencia, tasa_404, tasa_429, tasa_malformado, modelos_404, escala.
+    Misma semilla -> mismos documentos, y cada (documento, modelo, intento) recibe siempre la misma latencia y el
+    mismo error; los totales pueden variar un poco entre corridas porque la cobertura depende de los tiempos reales.
+    """
+    from src.config.settings import VERTEX_BACKEND
+    if VERTEX_BACKEND != "simulado":
+        raise RuntimeError("El benchmark solo corre con VERTEX_BACKEND=simulado (llamaría a Vertex de verdad)")
+    from src.utils.gre_sintetica import corpus_sintetico, respuesta_compacta
+    from src.utils.pdf_utils import separar_guias_multipagina
+    from src.services.vertex_simulado import configurar_simulado, registrar_respuesta, huella_enviada, errores_inyectados
+    from src.services.vertex_cuota import estado_concurrencia
+
+    config = configurar_simulado(semilla=semilla, **simulado)
+    corpus = corpus_sintetico(n_documentos, semilla, proporcion_escaneadas, proporcion_multiguia)
+    documentos, verdades = [], []
+    for doc in corpus:
+        segmentos = separar_guias_multipagina([{"nombre": doc["nombre"], "contenido": doc["contenido"]}])
+        for segmento, guia in zip(segmentos, doc["guias"]):
+            documentos.append(segmento["contenido"])
+            verdades.append(guia)
+            registrar_respuesta(huella_enviada(segmento["contenido"]), respuesta_compacta(guia))
+
+    return {
+        "configuracion": config,
+        "corpus": {"pdfs": len(corpus), "guias": len(documentos), "escaneadas": sum(1 for d in corpus if d["escaneada"])},
+        "pasadas": [_medir_pasada(documentos, verdades) for _ in range(pasadas)],
+        "errores_inyectados": errores_inyectados(),
+        "concurrencia": estado_concurrencia(),
+    }
+
+if __name__ == "__main__":
+    # python -m src.services.benchmark_ocr [n_documentos] [semilla]
+    # Latencia, errores y escala con las variables SIMULADO_* (p. ej. SIMULADO_LATENCIA=lognormal:1.5:0.6 SIMULADO_TASA_429=0.05)
+    print(f"Directorio del benchmark: {preparar_entorno()}")
+    reporte = ejecutar_benchmark(
+        n_documentos=int(sys.argv[1]) if len(sys.argv) > 1 else 40,
+        semilla=int(sys.argv[2]) if len(sys.argv) > 2 else 0,
+    )
+    print(json.dumps(reporte, ensure_ascii=False, indent=2))
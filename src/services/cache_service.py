@@ -0,0 +1,111 @@
+# ====================================================================
+# --- BLOQUE 0: Imports ---
+# ====================================================================
+import os
+import json
+import time
+import hashlib
+import sqlite3
+from src.config.settings import OCR_CACHE_DIR, OCR_CACHE_MAX_MB
+
+# ====================================================================
+# --- BLOQUE 1: Conexión a la Caché en Disco (SQLite compartido) ---
+# ====================================================================
+RUTA_CACHE_DB = os.path.join(OCR_CACHE_DIR, "extracciones.sqlite3")
+
+def _conectar_cache():
+    """Abre una conexión corta a la caché. SQLite en modo WAL permite lectores y escritores de varios procesos."""
+    os.makedirs(OCR_CACHE_DIR, exist_ok=True)
+    conn = sqlite3.connect(RUTA_CACHE_DB, timeout=10)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute(
+        "CREATE TABLE IF NOT EXISTS extracciones ("
+        " clave TEXT PRIMARY KEY, datos TEXT NOT NULL, tamano INTEGER NOT NULL,"
+        " creado REAL NOT NULL, ultimo_acceso REAL NOT NULL)"
+    )
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_ultimo_acceso ON extracciones(ultimo_acceso)")
+    return conn
+
+# ====================================================================
+# --- BLOQUE 2: Claves por Contenido (SHA-256 del PDF + Versión) ---
+# ====================================================================
+def calcular_huella(pdf_bytes):
+    return hashlib.sha256(pdf_bytes).hexdigest()
+
+def calcular_clave_extraccion(pdf_bytes, version):
+    """La clave combina el hash del archivo con la versión del prompt/esquema, así un cambio de prompt invalida solo."""
+    return f"{calcular_huella(pdf_bytes)}:{version}"
+
+# ====================================================================
+# --- BLOQUE 3: Lectura, Escritura y Desalojo LRU ---
+# ====================================================================
+def leer_cache_extraccion(pdf_bytes, version):
+    """Devuelve el JSON extraído previamente para este PDF o None si no existe."""
+    clave = calcular_clave_extraccion(pdf_bytes, version)
+    try:
+        conn = _conectar_cache()
+        try:
+            fila = conn.execute("SELECT datos FROM extracciones WHERE clave = ?", (clave,)).fetchone()
+            if not fila: return None
+            with conn:
+                conn.execute("UPDATE extracciones SET ultimo_acceso = ? WHERE clave = ?", (time.time(), clave))
+            return json.loads(fila[0])
+        finally:
+            conn.close()
+    except Exception as e:
+        print(f"Error leyendo caché OCR: {e}")
+        return None
+
+def guardar_cache_extraccion(pdf_bytes, version, datos):
+    """Guarda la extracción y desaloja las menos usadas si la caché supera OCR_CACHE_MAX_MB."""
+    return guardar_cache_por_huella(calcular_huella(pdf_bytes), version, datos)
+
+def guardar_cache_por_huella(huella, version, datos):
+    """Igual que guardar_cache_extraccion pero con el SHA-256 ya calculado (resultados de lotes offline)."""
+    if not datos: return False
+    clave = f"{huella}:{version}"
+    try:
+        texto = json.dumps(datos, ensure_ascii=False)
+        ahora = time.time()
+        conn = _conectar_cache()
+        try:
+            with conn:
+                conn.execute(
+                    "INSERT OR REPLACE INTO extracciones (clave, datos, tamano, creado, ultimo_acceso) VALUES (?, ?, ?, ?, ?)",
+                    (clave, texto, len(texto.encode("utf-8")), ahora, ahora)
+                )
+            _desalojar_lru(conn)
+        finally:
+            conn.close()
+        return True
+    except Exception as e:
+        print(f"Error guardando caché OCR: {e}")
+        return False
+
+def _desalojar_lru(conn):
+    limite = OCR_CACHE_MAX_MB * 1024 * 1024
+    total = conn.execute("SELECT COALESCE(SUM(tamano), 0) FROM extracciones").fetchone()[0]
+    if total <= limite: return
+
+    # Borrar desde la entrada con acceso más antiguo hasta volver bajo el límite
+    borrar = []
+    for clave, tamano in conn.execute("SELECT clave, tamano FROM extracciones ORDER BY ultimo_acceso ASC"):
+        if total <= limite: break
+        borrar.append((clave,))
+        total -= tamano
+    with conn:
+        conn.executemany("DELETE FROM extracciones WHERE clave = ?", borrar)
+
+def purgar_cache_extraccion():
+    """Vacía toda la caché de extracciones (Admin Tools)."""
+    try:
+        conn = _conectar_cache()
+        try:
+            with conn:
+                conn.execute("DELETE FROM extracciones")
+        finally:
+            conn.close()
+        return True
+    except Exception as e:
+        print(f"Error purgando caché OCR: {e}")
+        return False
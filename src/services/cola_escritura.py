@@ -0,0 +1,304 @@
+# ====================================================================
+# --- BLOQUE 0: Imports ---
+# ====================================================================
+import os
+import re
+import json
+import time
+import uuid
+import atexit
+import sqlite3
+import threading
+import streamlit as st
+from src.config.settings import (
+    ID_SHEET_CONTROL, ID_SHEET_RBAC, COLA_ESCRITURA_DIR, COLA_ESCRITURA_INTERVALO_S, COLA_ESCRITURA_LOTE,
+    COLA_ESCRITURA_MAX_INTENTOS, COLA_ESCRITURA_BACKOFF_MAX_S
+)
+from src.services.sheets_incremental import vencer_pestana, _indice_columna, _letra_columna
+
+# ====================================================================
+# --- BLOQUE 1: Diario Local de Filas por Enviar ---
+# ====================================================================
+# registrar_en_control y registrar_auditoria_sistema anotan la fila aquí y vuelven al instante; un hilo de fondo
+# la envía después a Sheets agrupando por pestaña. Cada fila viaja con su id en la columna siguiente a los datos
+# (historial!K, Control!G): si un envío quedó a medias (sin respuesta o el proceso murió), antes de reenviar se
+# leen los ids escritos desde la última fila confirmada y no se duplica nada.
+DESTINOS = {
+    # destino: (spreadsheet_id, pestaña, última columna de datos)
+    "historial": (ID_SHEET_CONTROL, "historial", "J"),
+    "auditoria": (ID_SHEET_RBAC, "Control", "F"),
+}
+# El diario solo tiene sentido en disco persistente: en un directorio temporal las filas en cola se pierden justo
+# en el reinicio que debía sobrevivir. Sin COLA_ESCRITURA_DIR no se encola y se escribe directo, como antes.
+COLA_DISPONIBLE = bool(COLA_ESCRITURA_DIR)
+RUTA_COLA_DB = os.path.join(COLA_ESCRITURA_DIR, "cola_escritura.sqlite3") if COLA_DISPONIBLE else ""
+RETENCION_ENVIADAS_S = 7 * 86400
+
+EN_COLA = "en_cola" # Resultado de registrar_en_control / registrar_auditoria_sistema: anotada, aún no en Sheets
+SESION_ESCRITURAS = "escrituras_en_cola" # st.session_state: {id: descripción} de las filas que encoló esta sesión
+
+_LOCK_COLA = threading.Lock() # Accesos al SQLite
+_LOCK_ENVIO = threading.Lock() # Un solo envío a la vez (hilo de fondo, botón de reintento o salida del proceso)
+_despertar = threading.Event()
+_hilo = {"activo": None}
+
+def _conectar_cola():
+    os.makedirs(COLA_ESCRITURA_DIR, exist_ok=True)
+    conn = sqlite3.connect(RUTA_COLA_DB, timeout=10)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute(
+        "CREATE TABLE IF NOT EXISTS cola ("
+        " id TEXT PRIMARY KEY, ts REAL NOT NULL, destino TEXT NOT NULL, fila TEXT NOT NULL,"
+        " estado TEXT NOT NULL DEFAULT 'pendiente', intentos INTEGER NOT NULL DEFAULT 0,"
+        " proximo_intento REAL NOT NULL DEFAULT 0, ultimo_error TEXT, enviada_en REAL)"
+    )
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_cola_estado ON cola(estado, destino, ts)")
+    # Última fila de la pestaña con un id confirmado por Sheets: los reenvíos solo leen los ids desde ahí
+    conn.execute("CREATE TABLE IF NOT EXISTS confirmadas (destino TEXT PRIMARY KEY, ultima_fila INTEGER NOT NULL)")
+    return conn
+
+def _ejecutar(sql, parametros=(), muchos=False):
+    with _LOCK_COLA:
+        conn = _conectar_cola()
+        try:
+            with conn:
+                cur = conn.executemany(sql, parametros) if muchos else conn.execute(sql, parametros)
+                return cur.fetchall()
+        finally:
+            conn.close()
+
+def _columna_id(ultima_columna):
+    """Columna siguiente a la última de datos ('J' -> 'K', 'Z' -> 'AA')."""
+    return _letra_columna(_indice_columna(ultima_columna) + 1)
+
+def _ancho(ultima_columna):
+    return _indice_columna(ultima_columna) + 1
+
+def encolar_fila(destino, fila):
+    """
+    Anota la fila para 'destino' (clave de DESTINOS) y devuelve su id; el envío ocurre en segundo plano.
+    Lanza sqlite3.Error si el disco falla o no hay COLA_ESCRITURA_DIR (quien llama decide si escribe directo).
+    """
+    if not COLA_DISPONIBLE:
+        raise sqlite3.OperationalError("COLA_ESCRITURA_DIR no configurado: sin diario persistente")
+    id_fila = f"w{uuid.uuid4().hex}" # Con letra delante: USER_ENTERED no lo convierte en número
+    _ejecutar("INSERT INTO cola (id, ts, destino, fila) VALUES (?,?,?,?)",
+              (id_fila, time.time(), destino, json.dumps([str(v) for v in fila], ensure_ascii=False)))
+    _asegurar_hilo()
+    return id_fila
+
+def seguir_en_sesion(id_fila, descripcion):
+    """Recuerda la fila en la sesión que la generó: render_estado_cola avisa a ese usuario si termina fallida."""
+    try:
+        st.session_state.setdefault(SESION_ESCRITURAS, {})[id_fila] = descripcion
+    except Exception:
+        pass # Fuera de una sesión de Streamlit (scripts, hilos): no hay a quién avisar
+
+def estado_filas(ids):
+    """{id: estado} de las filas pedidas; las que ya salieron del diario no aparecen."""
+    if not COLA_DISPONIBLE or not ids: return {}
+    try:
+        marcas = ",".join("?" * len(ids))
+        return dict(_ejecutar(f"SELECT id, estado FROM cola WHERE id IN ({marcas})", tuple(ids)))
+    except sqlite3.Error as e:
+        print(f"Error leyendo la cola de escritura: {e}")
+        return {}
+
+def filas_pendientes(destino):
+    """Filas aún no escritas en Sheets (pendientes o fallidas), en orden: p. ej. para no repetir un correlativo."""
+    if not COLA_DISPONIBLE: return []
+    try:
+        filas = _ejecutar("SELECT fila FROM cola WHERE destino=? AND estado!='enviada' ORDER BY ts", (destino,))
+    except sqlite3.Error as e:
+        print(f"Error leyendo la cola de escritura: {e}")
+        return []
+    return [json.loads(f) for (f,) in filas]
+
+# ====================================================================
+# --- BLOQUE 2: Envío Agrupado con Reintentos ---
+# ====================================================================
+RE_FILA_FINAL = re.compile(r'![A-Z]+\d+:[A-Z]+(\d+)$')
+
+def _ultima_fila_confirmada(destino):
+    filas = _ejecutar("SELECT ultima_fila FROM confirmadas WHERE destino=?", (destino,))
+    return filas[0][0] if filas else None
+
+def _confirmar_fila(destino, fila):
+    _ejecutar("INSERT INTO confirmadas (destino, ultima_fila) VALUES (?,?)"
+              " ON CONFLICT(destino) DO UPDATE SET ultima_fila=MAX(ultima_fila, excluded.ultima_fila)", (destino, fila))
+
+def _ids_escritos(sheets, destino, spreadsheet_id, pestana, columna_id):
+    """
+    Ids presentes en la columna de ids, leyendo solo las filas posteriores a la última confirmada (el append que
+    quedó a medias, si llegó, está después). Sin marca previa se lee la columna completa una sola vez.
+    """
+    desde = (_ultima_fila_confirmada(destino) or 0) + 1
+    r = sheets.spreadsheets().values().get(
+        spreadsheetId=spreadsheet_id, range=f"'{pestana}'!{columna_id}{desde}:{columna_id}"
+    ).execute()
+    valores = r.get('values', [])
+    ids = {str(f[0]).strip() for f in valores if f}
+    con_id = [n for n, f in enumerate(valores) if f and str(f[0]).strip()]
+    if con_id:
+        _confirmar_fila(destino, desde + con_id[-1])
+    return ids
+
+def _enviar_destino(sheets, destino):
+    """Un values.append con hasta COLA_ESCRITURA_LOTE filas vencidas del destino. Devuelve (enviadas, fallidas)."""
+    spreadsheet_id, pestana, ultima = DESTINOS[destino]
+    columna_id, ancho = _columna_id(ultima), _ancho(ultima)
+    filas = _ejecutar(
+        "SELECT id, fila, intentos FROM cola WHERE destino=? AND estado='pendiente' AND proximo_intento<=?"
+        " ORDER BY ts LIMIT ?", (destino, time.time(), COLA_ESCRITURA_LOTE)
+    )
+    if not filas: return 0, 0
+    ids = [f[0] for f in filas]
+    try:
+        # Algún intento anterior pudo llegar a Sheets sin que se anotara: se descartan los ids ya presentes
+        ya_escritos = (_ids_escritos(sheets, destino, spreadsheet_id, pestana, columna_id)
+                       if any(f[2] for f in filas) else set())
+        por_enviar = [(i, json.loads(f)) for i, f, _ in filas if i not in ya_escritos]
+        # El intento se anota antes del append: si el proceso muere en medio, el próximo envío verifica los ids
+        _ejecutar("UPDATE cola SET intentos=intentos+1 WHERE id=?", [(i,) for i in ids], muchos=True)
+        if por_enviar:
+            valores = [(fila + [""] * ancho)[:ancho] + [i] for i, fila in por_enviar]
+            respuesta = sheets.spreadsheets().values().append(
+                spreadsheetId=spreadsheet_id, range=f"'{pestana}'!A:{columna_id}",
+                valueInputOption="USER_ENTERED",
+                insertDataOption="INSERT_ROWS",
+                body={"values": valores}
+            ).execute()
+            vencer_pestana(spreadsheet_id, pestana)
+            m = RE_FILA_FINAL.search(((respuesta or {}).get("updates") or {}).get("updatedRange", ""))
+            if m: _confirmar_fila(destino, int(m.group(1)))
+        _ejecutar("UPDATE cola SET estado='enviada', enviada_en=?, ultimo_error=NULL WHERE id=?",
+                  [(time.time(), i) for i in ids], muchos=True)
+        return len(ids), 0
+    except Exception as e:
+        ahora, error = time.time(), str(e)[:300]
+        print(f"Error enviando {len(ids)} filas a '{pestana}': {error}")
+        actualizaciones = []
+        for i, _, intentos in filas:
+            intentos += 1
+            estado = "fallida" if intentos >= COLA_ESCRITURA_MAX_INTENTOS else "pendiente"
+            espera = min(COLA_ESCRITURA_BACKOFF_MAX_S, COLA_ESCRITURA_INTERVALO_S * 2 ** intentos)
+            actualizaciones.append((estado, intentos, ahora + espera, error, i))
+        _ejecutar("UPDATE cola SET estado=?, intentos=?, proximo_intento=?, ultimo_error=? WHERE id=?",
+                  actualizaciones, muchos=True)
+        return 0, sum(1 for a in actualizaciones if a[0] == "fallida")
+
+def vaciar_cola(sheets=None):
+    """Envía lo vencido de cada destino (un append por pestaña y lote). Devuelve {enviadas, fallidas}."""
+    with _LOCK_ENVIO:
+        if sheets is None:
+            from src.services.google_service import obtener_servicios
+            _, sheets = obtener_servicios()
+        if not sheets: return {"enviadas": 0, "fallidas": 0}
+        enviadas = fallidas = 0
+        for destino in DESTINOS:
+            while True:
+                ok, ko = _enviar_destino(sheets, destino)
+                enviadas, fallidas = enviadas + ok, fallidas + ko
+                if ok < COLA_ESCRITURA_LOTE: break # Sin más filas, o el destino falló: el resto espera su backoff
+        _ejecutar("DELETE FROM cola WHERE estado='enviada' AND enviada_en<?", (time.time() - RETENCION_ENVIADAS_S,))
+        return {"enviadas": enviadas, "fallidas": fallidas}
+
+def _hay_vencidas():
+    return bool(_ejecutar("SELECT 1 FROM cola WHERE estado='pendiente' AND proximo_intento<=? LIMIT 1", (time.time(),)))
+
+def _bucle_envio():
+    while True:
+        # Las filas que llegan durante la espera salen juntas en el mismo append
+        _despertar.wait(COLA_ESCRITURA_INTERVALO_S)
+        _despertar.clear()
+        try:
+            if _hay_vencidas(): vaciar_cola()
+        except Exception as e:
+            print(f"Error en el hilo de la cola de escritura: {e}")
+
+def _asegurar_hilo():
+    with _LOCK_COLA:
+        if _hilo["activo"] is not None and _hilo["activo"].is_alive(): return
+        _hilo["activo"] = threading.Thread(target=_bucle_envio, name="cola_escritura_sheets", daemon=True)
+        _hilo["activo"].start()
+
+@atexit.register
+def _vaciar_al_salir():
+    # Último intento al cerrar el proceso; lo que no salga queda en el diario para el próximo arranque
+    try:
+        if _hilo["activo"] is not None and _hay_vencidas(): vaciar_cola()
+    except Exception as e:
+        print(f"Error vaciando la cola de escritura al salir: {e}")
+
+def reintentar_fallidas():
+    """Devuelve las fallidas a la cola y despierta al hilo. intentos queda en 1: el reenvío verifica los ids escritos."""
+    n = _ejecutar("SELECT COUNT(*) FROM cola WHERE estado='fallida'")[0][0]
+    _ejecutar("UPDATE cola SET estado='pendiente', intentos=1, proximo_intento=0 WHERE estado='fallida'")
+    _asegurar_hilo()
+    _despertar.set()
+    return n
+
+# ====================================================================
+# --- BLOQUE 3: Estado para la Interfaz ---
+# ====================================================================
+def estado_cola():
+    """Pendientes, fallidas y enviadas en 24 h, con la antigüedad de la pendiente más vieja y el último error."""
+    if not COLA_DISPONIBLE:
+        return {"pendientes": 0, "fallidas": 0, "enviadas_24h": 0, "antiguedad_s": None, "ultimo_error": None}
+    try:
+        conteos = dict(_ejecutar("SELECT estado, COUNT(*) FROM cola GROUP BY estado"))
+        antigua = _ejecutar("SELECT MIN(ts) FROM cola WHERE estado!='enviada'")[0][0]
+        error = _ejecutar("SELECT ultimo_error FROM cola WHERE ultimo_error IS NOT NULL ORDER BY ts DESC LIMIT 1")
+        recientes = _ejecutar("SELECT COUNT(*) FROM cola WHERE estado='enviada' AND enviada_en>=?", (time.time() - 86400,))
+    except sqlite3.Error as e:
+        print(f"Error leyendo la cola de escritura: {e}")
+        return {"pendientes": 0, "fallidas": 0, "enviadas_24h": 0, "antiguedad_s": None, "ultimo_error": None}
+    if conteos.get("pendiente"): _asegurar_hilo() # Filas de una ejecución anterior: arranca el envío
+    return {
+        "pendientes": conteos.get("pendiente", 0),
+        "fallidas": conteos.get("fallida", 0),
+        "enviadas_24h": recientes[0][0],
+        "antiguedad_s": round(time.time() - antigua, 1) if antigua else None,
+        "ultimo_error": error[0][0] if error else None,
+    }
+
+def _avisar_fallidas_propias():
+    """Errores de las filas que encoló esta sesión y quedaron fallidas; olvida las que ya llegaron. Devuelve cuántas fallaron."""
+    propias = st.session_state.get(SESION_ESCRITURAS) or {}
+    if not propias: return 0
+    estados = estado_filas(list(propias))
+    fallidas = 0
+    for id_fila, descripcion in list(propias.items()):
+        estado = estados.get(id_fila)
+        if estado == "fallida":
+            fallidas += 1
+            st.error(f"❌ {descripcion}: no llegó a Sheets tras {COLA_ESCRITURA_MAX_INTENTOS} intentos. "
+                     "Reintentar desde Admin Tools.")
+        elif estado != "pendiente":
+            del propias[id_fila] # Enviada (o ya depurada del diario)
+    return fallidas
+
+def render_estado_cola():
+    """Aviso breve en la barra lateral: fallidas de esta sesión con detalle y, para todas las sesiones, el total sin llegar."""
+    e = estado_cola()
+    propias = _avisar_fallidas_propias()
+    if e["fallidas"] > propias:
+        st.error(f"⚠️ {e['fallidas'] - propias} registro(s) no llegaron a Sheets. Revisar en Admin Tools.")
+    elif e["pendientes"]:
+        st.caption(f"⏳ {e['pendientes']} registro(s) en cola hacia Sheets (hace {e['antiguedad_s']:.0f}s)")
+
+def render_cola_escritura():
+    """Detalle de la cola para el expander de Admin Tools, con reintento manual de las fallidas."""
+    e = estado_cola()
+    st.markdown("### 📨 Escrituras a Sheets")
+    if not COLA_DISPONIBLE:
+        st.caption("Sin COLA_ESCRITURA_DIR (volumen persistente): historial y auditoría se escriben directo en Sheets.")
+        return
+    c1, c2, c3 = st.columns(3)
+    c1.metric(label="En cola", value=e["pendientes"])
+    c2.metric(label="Fallidas", value=e["fallidas"])
+    c3.metric(label="Enviadas 24 h", value=e["enviadas_24h"])
+    if e["ultimo_error"]:
+        st.caption(f"Último error: {e['ultimo_error']}")
+    if e["fallidas"] and st.button("Reintentar envíos fallidos", key="btn_reintentar_cola", use_container_width=True):
+        st.success(f"{reintentar_fallidas()} registro(s) devueltos a la cola.")
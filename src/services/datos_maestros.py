@@ -0,0 +1,157 @@
+# ====================================================================
+# --- BLOQUE 0: Imports ---
+# ====================================================================
+import time
+import threading
+import pandas as pd
+from src.config.settings import ID_SHEET_REPOSITORIO, ID_SHEET_RBAC, MAESTROS_TTL_S
+
+# ====================================================================
+# --- BLOQUE 1: Carga por Lotes (un values.batchGet por Spreadsheet) ---
+# ====================================================================
+# Al arrancar, la app pedía EMPRESAS, CLIENTES, SERVICIOS/COMERCIALIZACION, Usuario_Roles y otra vez CLIENTES y
+# EMPRESAS con rangos propios: ~7 idas a Sheets. Aquí cada Spreadsheet se lee con un solo batchGet, se arman los
+# diccionarios una vez y se comparten entre sesiones hasta que vence MAESTROS_TTL_S (o la purga de Admin Tools).
+PESTANAS_MAESTRAS = ("EMPRESAS", "CLIENTES", "SERVICIOS", "COMERCIALIZACION")
+RANGO_USUARIOS = "'Usuario_Roles'!A2:D"
+
+_LOCK_MAESTROS = threading.Lock()
+_LOCK_CARGA_MAESTROS = threading.Lock() # Una sola carga por Spreadsheet a la vez: las demás sesiones la reutilizan
+_estado = {"repositorio": None, "rbac": None}
+_pestanas_ausentes = set() # Pestañas que no existen: fuera del batchGet hasta la próxima purga
+REINTENTO_PARCIAL_S = 30 # Carga con pestañas caídas por un error pasajero (429, 500, timeout): se reintenta pronto
+
+def _es_pestana_ausente(error):
+    """Solo el 400 'Unable to parse range' significa que la pestaña no existe; el resto puede ser pasajero."""
+    return getattr(getattr(error, "resp", None), "status", None) == 400 and "UNABLE TO PARSE RANGE" in str(error).upper()
+
+def _leer_lote(servicio_sheets, spreadsheet_id, rangos):
+    """
+    Valores de cada rango en orden y los índices de los rangos cuya pestaña no existe. Si el batchGet falla
+    (basta con que falte una pestaña), se lee rango por rango para no perder las demás (None en los que fallaron);
+    solo lanza si no se pudo leer ninguno.
+    """
+    try:
+        r = servicio_sheets.spreadsheets().values().batchGet(spreadsheetId=spreadsheet_id, ranges=rangos).execute()
+        return [b.get('values', []) for b in r.get('valueRanges', [])], set()
+    except Exception as e:
+        print(f"batchGet de datos maestros falló, leyendo por pestaña: {e}")
+    valores, errores, ausentes = [], [], set()
+    for i, rango in enumerate(rangos):
+        try:
+            valores.append(servicio_sheets.spreadsheets().values().get(spreadsheetId=spreadsheet_id, range=rango)
+                           .execute().get('values', []))
+        except Exception as e:
+            print(f"Error leyendo {rango}: {e}")
+            errores.append(e)
+            valores.append(None)
+            if _es_pestana_ausente(e): ausentes.add(i)
+    if len(errores) == len(rangos): raise errores[0]
+    return valores, ausentes
+
+def _tabla(valores):
+    """Fila 1 = encabezados, como leer_sheet_seguro."""
+    if not valores: return pd.DataFrame()
+    try:
+        return pd.DataFrame(valores[1:], columns=valores[0])
+    except ValueError as e:
+        print(f"Pestaña maestra con filas más anchas que sus encabezados: {e}")
+        return pd.DataFrame()
+
+def construir_repositorio(valores_por_pestana):
+    """Tablas crudas por pestaña más CLIENTES -> {nombre: RUC} y EMPRESAS -> {nombre: {ruc, reg}}."""
+    clientes, empresas = {}, {}
+    for fila in valores_por_pestana.get("CLIENTES", [])[1:]:
+        if len(fila) >= 2:
+            nombre = str(fila[0]).strip().upper()
+            if nombre: clientes[nombre] = str(fila[1]).strip()
+    for fila in valores_por_pestana.get("EMPRESAS", [])[1:]:
+        if len(fila) >= 2:
+            nombre = str(fila[0]).strip().upper()
+            # Si hay columna C (Registro), la tomamos; si no, queda pendiente
+            reg = str(fila[2]).strip() if len(fila) >= 3 else "Pendiente"
+            if nombre: empresas[nombre] = {"ruc": str(fila[1]).strip(), "reg": reg}
+    return {
+        "cargado_en": time.time(),
+        "tablas": {p: _tabla(v) for p, v in valores_por_pestana.items()},
+        "clientes": clientes,
+        "empresas": empresas,
+    }
+
+def construir_rbac(valores):
+    """Usuario_Roles A2:D -> {email: {Nombre, Rol, Estado}} (filas incompletas se ignoran)."""
+    usuarios = {}
+    for fila in valores:
+        if len(fila) >= 4:
+            email = str(fila[0]).strip().lower()
+            if email:
+                usuarios[email] = {"Nombre": str(fila[1]).strip(), "Rol": str(fila[2]).strip(), "Estado": str(fila[3]).strip()}
+    return {"cargado_en": time.time(), "usuarios": usuarios}
+
+def _cargar_repositorio(servicio_sheets):
+    pestanas = [p for p in PESTANAS_MAESTRAS if p not in _pestanas_ausentes]
+    valores, ausentes = _leer_lote(servicio_sheets, ID_SHEET_REPOSITORIO, [f"'{p}'!A1:Z" for p in pestanas])
+    _pestanas_ausentes.update(pestanas[i] for i in ausentes)
+    datos = construir_repositorio({p: v or [] for p, v in zip(pestanas, valores)})
+    # Una pestaña que falló por un error pasajero no se da por vacía hasta el TTL: la carga vence antes
+    datos["parcial"] = any(v is None and i not in ausentes for i, v in enumerate(valores))
+    return datos
+
+def _cargar_rbac(servicio_sheets):
+    valores, _ = _leer_lote(servicio_sheets, ID_SHEET_RBAC, [RANGO_USUARIOS])
+    return construir_rbac(valores[0] or [])
+
+_CARGADORES = {"repositorio": _cargar_repositorio, "rbac": _cargar_rbac}
+
+def _vigente(clave):
+    datos = _estado[clave]
+    ttl = min(REINTENTO_PARCIAL_S, MAESTROS_TTL_S) if datos is not None and datos.get("parcial") else MAESTROS_TTL_S
+    if datos is not None and time.time() - datos["cargado_en"] < ttl:
+        return datos
+    return None
+
+def _obtener(clave):
+    """Datos vigentes de 'repositorio' o 'rbac'; None si no hay conexión o la lectura falló (no se cachea el fallo)."""
+    datos = _vigente(clave)
+    if datos is not None: return datos
+    with _LOCK_CARGA_MAESTROS:
+        datos = _vigente(clave)
+        if datos is not None: return datos # Otra sesión los cargó mientras esperábamos
+        from src.services.google_service import obtener_servicios
+        _, servicio_sheets = obtener_servicios()
+        if not servicio_sheets: return None
+        try:
+            datos = _CARGADORES[clave](servicio_sheets)
+        except Exception as e:
+            print(f"Error cargando datos maestros ({clave}): {e}")
+            return None
+        with _LOCK_MAESTROS:
+            _estado[clave] = datos
+        return datos
+
+def invalidar_datos_maestros():
+    """La siguiente consulta vuelve a leer ambos Spreadsheets (purga de caché desde Admin Tools)."""
+    with _LOCK_MAESTROS:
+        _estado["repositorio"] = _estado["rbac"] = None
+        _pestanas_ausentes.clear()
+
+# ====================================================================
+# --- BLOQUE 2: Consultas (Copias: quien llama puede modificarlas) ---
+# ====================================================================
+def tabla_maestra(pestana):
+    """DataFrame de una pestaña de PESTANAS_MAESTRAS (vacío si no hay datos)."""
+    datos = _obtener("repositorio")
+    if datos is None: return pd.DataFrame()
+    return datos["tablas"].get(pestana.upper(), pd.DataFrame()).copy()
+
+def clientes_ruc():
+    datos = _obtener("repositorio")
+    return dict(datos["clientes"]) if datos else {}
+
+def empresas_datos():
+    datos = _obtener("repositorio")
+    return {k: dict(v) for k, v in datos["empresas"].items()} if datos else {}
+
+def usuarios_roles():
+    datos = _obtener("rbac")
+    return {k: dict(v) for k, v in datos["usuarios"].items()} if datos else {}
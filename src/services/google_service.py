@@ -3,17 +3,30 @@
 # ====================================================================
 import streamlit as st
 import io
+import sqlite3
 import pandas as pd
 from google.oauth2 import service_account
 from googleapiclient.discovery import build
 from googleapiclient.http import MediaIoBaseDownload, MediaIoBaseUpload
-from src.config.settings import ID_SHEET_CONTROL, ID_SHEET_REPOSITORIO
+from src.config.settings import ID_SHEET_CONTROL, ID_SHEET_REPOSITORIO, ID_SHEET_RBAC, HISTORIAL_TTL_S
+from src.services.sheets_incremental import sincronizar_pestana, vencer_pestana
+from src.services.cola_escritura import COLA_DISPONIBLE, EN_COLA, encolar_fila, filas_pendientes, seguir_en_sesion
+from src.services.datos_maestros import PESTANAS_MAESTRAS, tabla_maestra, clientes_ruc, empresas_datos, usuarios_roles
+from src.services.guias_recibidas import (
+    catalogo_pendientes, guias_pendientes_grupo, guias_pendientes, filas_por_numeros, registrar_marcas, texto_marca
+)
 
 # ====================================================================
 # --- BLOQUE 1: Lectura Segura de Google Sheets (Caché Opcional) ---
 # ====================================================================
-@st.cache_data(show_spinner=False, ttl=600)
 def leer_sheet_seguro(pestaña):
+    """Lectura segura de Google Sheets; las pestañas maestras salen del lote compartido de datos_maestros."""
+    if pestaña.upper() in PESTANAS_MAESTRAS:
+        return tabla_maestra(pestaña)
+    return _leer_pestana_cacheada(pestaña)
+
+@st.cache_data(show_spinner=False, ttl=600)
+def _leer_pestana_cacheada(pestaña):
     """Lectura segura de Google Sheets con cacheo parcial"""
     _, s = obtener_servicios()
     if not s: return pd.DataFrame()
@@ -26,6 +39,23 @@ def leer_sheet_seguro(pestaña):
         st.error(f"Error leyendo pestaña {pestaña}: {e}")
         return pd.DataFrame()
 
+def leer_historial():
+    """
+    'historial'!A:J (fila 1 = encabezados) para el correlativo, sin el tope de 1000 filas de leer_sheet_seguro.
+    Se sincroniza por deltas cada HISTORIAL_TTL_S o tras cada envío de la cola: solo viajan las filas nuevas.
+    """
+    _, s = obtener_servicios()
+    if not s: return pd.DataFrame()
+    try:
+        v = sincronizar_pestana(s, ID_SHEET_CONTROL, "historial", "J", ttl_s=HISTORIAL_TTL_S)["filas"]
+        if not v: return pd.DataFrame()
+        # Más las filas que siguen en la cola de escritura: cuentan para el correlativo aunque no hayan llegado
+        en_cola = [f[:len(v[0])] for f in filas_pendientes("historial")]
+        return pd.DataFrame(v[1:] + en_cola, columns=v[0])
+    except Exception as e:
+        st.error(f"Error leyendo pestaña historial: {e}")
+        return pd.DataFrame()
+
 # ====================================================================
 # --- BLOQUE 2: Flujo de Autenticación y Obtención de Credenciales ---
 # ====================================================================
@@ -98,6 +128,17 @@ def obtener_servicios():
 # --- BLOQUE 3: Funciones de Escritura y Subida (Sheets y Drive) ---
 # ====================================================================
 def registrar_en_control(datos_fila):
+    """
+    Anota la fila de historial en la cola local y devuelve EN_COLA (aún no está en Sheets; si termina fallida,
+    la barra lateral de esta sesión lo avisa). Sin diario persistente la escribe directo: True / False.
+    """
+    if COLA_DISPONIBLE:
+        try:
+            id_fila = encolar_fila("historial", datos_fila)
+            seguir_en_sesion(id_fila, f"Registro del certificado {datos_fila[3] if len(datos_fila) > 3 else ''}".strip())
+            return EN_COLA
+        except sqlite3.Error as e:
+            print(f"Cola de escritura no disponible, escribiendo historial directo: {e}")
     _, sheets = obtener_servicios()
     if not sheets: return False
     try:
@@ -107,6 +148,7 @@ def registrar_en_control(datos_fila):
             insertDataOption="INSERT_ROWS",
             body={"values": [datos_fila]}
         ).execute()
+        vencer_pestana(ID_SHEET_CONTROL, "historial")
         return True
     except: return False
 
@@ -291,169 +333,74 @@ def obtener_mapa_plantillas_drive(es_modelo=False):
         print(f"🚨 Error al leer Drive: {e}")
         return {"EPMI S.A.C.": ["Comercialización"]}
 
-@st.cache_data(ttl=600) 
 def obtener_clientes_desde_sheets():
-    """Lee la pestaña 'CLIENTES' del Excel y devuelve un diccionario {Nombre: RUC}."""
-    SHEET_ID = '14As5bCpZi56V5Nq1DRs0xl6R1LuOXLvRRoV26nI50NU'
-    RANGO = 'CLIENTES!A2:B' 
-    
-    from src.services.google_service import obtener_servicios 
-    # LA CORRECCIÓN: Llamamos a los dos robots en el orden correcto
-    drive_service, sheet_service = obtener_servicios() 
-    
-    if not sheet_service: 
-        st.error("❌ No hay conexión a los servicios de Google.")
-        return {}
-    
-    try:
-        resultado = sheet_service.spreadsheets().values().get(spreadsheetId=SHEET_ID, range=RANGO).execute()
-        filas = resultado.get('values', [])
-        
-        clientes_dict = {}
-        for fila in filas:
-            if len(fila) >= 2: 
-                nombre = str(fila[0]).strip().upper()
-                ruc = str(fila[1]).strip()
-                if nombre:
-                    clientes_dict[nombre] = ruc
-                    
-        if not clientes_dict:
-            st.warning("⚠️ El bot entró al Excel pero no encontró texto en las columnas A y B.")
+    """Pestaña 'CLIENTES' como diccionario {Nombre: RUC} (del lote compartido de datos maestros)."""
+    clientes_dict = clientes_ruc()
+    if not clientes_dict:
+        st.warning("⚠️ El bot entró al Excel pero no encontró texto en las columnas A y B.")
+    return clientes_dict
 
-        return clientes_dict
-    except Exception as e:
-        # Si falla, ahora sí lo imprimirá en tu terminal negra para que lo veamos
-        st.error(f"🚨 Error real leyendo el Excel: {e}") 
-        return {}
-
-@st.cache_data(ttl=600)
 def obtener_datos_empresas_desde_sheets():
-    """Lee la pestaña 'EMPRESAS' del Excel y devuelve un diccionario con RUC y Registro."""
-    SHEET_ID = '14As5bCpZi56V5Nq1DRs0xl6R1LuOXLvRRoV26nI50NU'
-    RANGO = 'EMPRESAS!A2:C' # A=Empresa, B=RUC, C=Registro
-    
-    from src.services.google_service import obtener_servicios 
-    _, sheet_service = obtener_servicios()
-    
-    if not sheet_service: return {}
-    
-    try:
-        resultado = sheet_service.spreadsheets().values().get(spreadsheetId=SHEET_ID, range=RANGO).execute()
-        filas = resultado.get('values', [])
-        
-        datos_dict = {}
-        for fila in filas:
-            if len(fila) >= 2:
-                nombre = str(fila[0]).strip().upper()
-                ruc = str(fila[1]).strip()
-                # Si hay columna C, la tomamos; si no, ponemos pendiente
-                reg = str(fila[2]).strip() if len(fila) >= 3 else "Pendiente"
-                
-                if nombre:
-                    datos_dict[nombre] = {"ruc": ruc, "reg": reg}
-                    
-        return datos_dict
-    except Exception as e:
-        print(f"Error leyendo base de datos de empresas: {e}")
-        return {}
+    """Pestaña 'EMPRESAS' como diccionario {Nombre: {ruc, reg}} (del lote compartido de datos maestros)."""
+    return empresas_datos()
 
 # ====================================================================
 # --- BLOQUE 4: Funciones de Repositorio Masivo ---
 # ====================================================================
 ID_SHEET_GUIAS = "14As5bCpZi56V5Nq1DRs0xl6R1LuOXLvRRoV26nI50NU"
 
-@st.cache_data(show_spinner=False, ttl=60)
-def obtener_catalogo_guias(_servicio_sheets):
-    """Extrae listado de empresas, mesas y fundos anidados para los selectbots."""
-    if not _servicio_sheets: return {}
+def obtener_catalogo_guias(servicio_sheets):
+    """Extrae listado de empresas, meses y fundos anidados para los selectbox (desde la instantánea compartida)."""
+    if not servicio_sheets: return {}
     try:
-        r = _servicio_sheets.spreadsheets().values().get(spreadsheetId=ID_SHEET_GUIAS, range="'Guias_recibidas'!A2:H").execute()
-        v = r.get('values', [])
-        
-        catalogo = {}
-        meses_es = {"01":"Enero", "02":"Febrero", "03":"Marzo", "04":"Abril", "05":"Mayo", "06":"Junio", "07":"Julio", "08":"Agosto", "09":"Septiembre", "10":"Octubre", "11":"Noviembre", "12":"Diciembre"}
-        
-        for fila in v:
-            # Solo consideramos si tiene al menos Fecha(0), Empresa(3), Fundo(4)
-            if len(fila) >= 6:
-                fecha_str = str(fila[0]).strip()
-                empresa = str(fila[3]).strip()
-                fundo = str(fila[4]).strip()
-                bitacora = str(fila[7]).strip() if len(fila) > 7 else ""
-                
-                # REGLA ESTRICTA: Filtrar lo que ya fue generado
-                if "✅ Nuevo" in bitacora:
-                    continue
-                
-                mes_formateado = "Sin Fecha"
-                # Parseo manual de fecha DD/MM/YYYY o M/D/YYYY
-                if "/" in fecha_str:
-                    partes = fecha_str.split("/")
-                    if len(partes) >= 2:
-                        mes_num = partes[1].zfill(2)
-                        anio = partes[2] if len(partes) > 2 else ""
-                        nombre_mes = meses_es.get(mes_num, mes_num)
-                        mes_formateado = f"{nombre_mes} {anio}".strip()
-                elif fecha_str:
-                    mes_formateado = fecha_str
-                
-                if empresa:
-                    if empresa not in catalogo:
-                        catalogo[empresa] = {}
-                    if mes_formateado not in catalogo[empresa]:
-                        catalogo[empresa][mes_formateado] = set()
-                    if fundo:
-                        catalogo[empresa][mes_formateado].add(fundo)
-                        
-        # Formatear sets a listas ordenadas
-        for emp in catalogo:
-            for mes in catalogo[emp]:
-                catalogo[emp][mes] = sorted(list(catalogo[emp][mes]))
-        return catalogo
+        return catalogo_pendientes(servicio_sheets)
     except Exception as e:
         print(f"Error catalogo guias: {e}")
         return {}
 
 def buscar_guias_repositorio(servicio_sheets, empresa, fundo, mes):
-    """Filtra y devuelve archivos a descargar, validando que no estén procesados."""
+    """Filtra y devuelve archivos a descargar, validando que no estén procesados (índice por empresa, mes y fundo)."""
     if not servicio_sheets: return []
     try:
-        r = servicio_sheets.spreadsheets().values().get(spreadsheetId=ID_SHEET_REPOSITORIO, range="'Guias_recibidas'!A2:H").execute()
-        v = r.get('values', [])
-        
-        resultados = []
-        meses_es = {"01":"Enero", "02":"Febrero", "03":"Marzo", "04":"Abril", "05":"Mayo", "06":"Junio", "07":"Julio", "08":"Agosto", "09":"Septiembre", "10":"Octubre", "11":"Noviembre", "12":"Diciembre"}
-        
-        for i, fila in enumerate(v):
-            fila_real = i + 2 # Fila en excel (A2 en adelante)
-            if len(fila) >= 6:
-                fecha_str = str(fila[0]).strip()
-                f_empresa = str(fila[3]).strip()
-                f_fundo = str(fila[4]).strip()
-                f_archivo = str(fila[5]).strip()
-                bitacora = str(fila[7]).strip() if len(fila) > 7 else ""
-                
-                mes_formateado = "Sin Fecha"
-                if "/" in fecha_str:
-                    partes = fecha_str.split("/")
-                    if len(partes) >= 2:
-                        mes_num = partes[1].zfill(2)
-                        anio = partes[2] if len(partes) > 2 else ""
-                        nombre_mes = meses_es.get(mes_num, mes_num)
-                        mes_formateado = f"{nombre_mes} {anio}".strip()
-                elif fecha_str:
-                    mes_formateado = fecha_str
-                
-                # Coincidir con los filtros y que no contenga marca de 'Nuevo' procesado
-                if f_empresa == empresa and f_fundo == fundo and mes_formateado == mes and f_archivo:
-                    if "✅ Nuevo" not in bitacora:
-                        numero_guia = str(fila[1]).strip() if len(fila) > 1 else "S/N"
-                        resultados.append({"nombre": f_archivo, "fila": fila_real, "numero_guia": numero_guia})
-        return resultados
+        return guias_pendientes_grupo(servicio_sheets, empresa, mes, fundo)
     except Exception as e:
         print(f"Error buscar guias: {e}")
         return []
 
+def listar_guias_pendientes(servicio_sheets):
+    """Todas las filas de Guias_recibidas con archivo y sin marca '✅ Nuevo' (modo lote nocturno)."""
+    if not servicio_sheets: return []
+    try:
+        return guias_pendientes(servicio_sheets)
+    except Exception as e:
+        print(f"Error listando guías pendientes: {e}")
+        return []
+
+def _descargar_archivo_drive(servicio_drive, archivo_id):
+    import io
+    from googleapiclient.http import MediaIoBaseDownload
+    req = servicio_drive.files().get_media(fileId=archivo_id)
+    fh = io.BytesIO()
+    downloader = MediaIoBaseDownload(fh, req)
+    done = False
+    while not done:
+        status, done = downloader.next_chunk()
+    fh.seek(0)
+    return fh
+
+def _contiene_guia(fh):
+    """El XML es un DespatchAdvice legible o el ZIP trae al menos una guía (XML o PDF/imagen)."""
+    from src.utils.gre_xml_utils import expandir_archivos_guia
+    try:
+        docs = list(expandir_archivos_guia([fh]))
+        if fh.name.lower().endswith(".xml"): return any("datos" in d for d in docs)
+        return bool(docs)
+    except Exception as e:
+        print(f"Archivo de guía ilegible {fh.name}: {e}")
+        return False
+    finally:
+        fh.seek(0)
+
 def descargar_guias_drive(servicio_drive, nombres_archivos):
     """Busca y descarga los archivos del Drive, los devuelve en memoria."""
     import io
@@ -500,19 +447,17 @@ def descargar_guias_drive(servicio_drive, nombres_archivos):
                     fields='files(id, name)'
                 ).execute()
                 items = res.get('files', [])
-                if items:
-                    archivo_id = items[0]['id']
-                    req = servicio_drive.files().get_media(fileId=archivo_id)
-                    fh = io.BytesIO()
-                    downloader = MediaIoBaseDownload(fh, req)
-                    done = False
-                    while not done:
-                        status, done = downloader.next_chunk()
-                    fh.seek(0)
-                    
-                    # Mock streamlit file properties
-                    fh.name = items[0]['name']
+                # Si existe el XML SUNAT (o el ZIP XML+PDF) de la guía se prefiere: se lee sin llamar a Gemini
+                items.sort(key=lambda it: 0 if it.get('name', '').lower().endswith(('.xml', '.zip')) else 1)
+                for item in items:
+                    fh = _descargar_archivo_drive(servicio_drive, item['id'])
+                    fh.name = item['name'] # Mock streamlit file properties
+                    # Un CDR (R-…xml) u otro XML/ZIP que solo comparte el número no es la guía: se prueba el siguiente
+                    if item['name'].lower().endswith(('.xml', '.zip')) and not _contiene_guia(fh):
+                        print(f"{item['name']} no es una guía SUNAT legible: se descarta")
+                        continue
                     archivos_memoria.append(fh)
+                    break
         except Exception as e:
             print(f"Error descargando {nombre}: {e}")
             
@@ -524,7 +469,7 @@ def actualizar_bitacora_guias(servicio_sheets, filas):
     if not servicio_sheets or not filas: return False
     try:
         hora_lima = datetime.utcnow() - timedelta(hours=5)
-        marca = f"✅ Nuevo: {hora_lima.strftime('%d/%m/%Y %H:%M')}"
+        marca = texto_marca(hora_lima)
         
         data = []
         for fila in filas:
@@ -538,85 +483,58 @@ def actualizar_bitacora_guias(servicio_sheets, filas):
             "data": data
         }
         servicio_sheets.spreadsheets().values().batchUpdate(spreadsheetId=ID_SHEET_REPOSITORIO, body=body).execute()
+        registrar_marcas(filas, marca)
         return True
     except Exception as e:
         print(f"Error actualizando bitácora: {e}")
         return False
 
-def buscar_actualizar_guia(servicio_sheets, num_guia):
-    from datetime import datetime, timedelta
-    if not servicio_sheets or not str(num_guia).strip() or str(num_guia).strip() == "S/N": return False
+def marcar_guias_procesadas(servicio_sheets, numeros_guia, parcial=False):
+    """
+    Marca '✅ Nuevo' en todas las guías generadas con una sola escritura: cada número se canoniza una vez,
+    se resuelve en el índice de la instantánea y todas las filas viajan en un único values.batchUpdate.
+    Devuelve (ok, números no encontrados en Guias_recibidas); ok es False solo si falló la lectura o la escritura.
+    """
+    numeros = [n for n in dict.fromkeys(str(n).strip() for n in numeros_guia) if n and n != "S/N"]
+    if not servicio_sheets: return False, []
+    if not numeros: return True, []
     try:
-        r = servicio_sheets.spreadsheets().values().get(spreadsheetId=ID_SHEET_REPOSITORIO, range="'Guias_recibidas'!A2:H").execute()
-        v = r.get('values', [])
-        
-        hora_lima = datetime.utcnow() - timedelta(hours=5)
-        marca = f"✅ Nuevo: {hora_lima.strftime('%d/%m/%Y %H:%M')}"
-        
-        for i, fila in enumerate(v):
-            if len(fila) > 1 and str(fila[1]).strip().upper() == str(num_guia).strip().upper():
-                fila_excel = i + 2
-                body = {"values": [[marca]]}
-                servicio_sheets.spreadsheets().values().update(
-                    spreadsheetId=ID_SHEET_REPOSITORIO,
-                    range=f"'Guias_recibidas'!H{fila_excel}",
-                    valueInputOption="USER_ENTERED",
-                    body=body
-                ).execute()
-        return True
+        encontradas = filas_por_numeros(servicio_sheets, numeros, parcial)
     except Exception as e:
-        print(f"Error actualizando marca de control {num_guia}: {e}")
-        return False
+        print(f"Error leyendo Guias_recibidas para marcar: {e}")
+        return False, []
+    faltantes = [n for n, filas in encontradas.items() if not filas]
+    filas = sorted({f for filas in encontradas.values() for f in filas})
+    if not filas: return True, faltantes
+    return actualizar_bitacora_guias(servicio_sheets, filas), faltantes
+
+def buscar_actualizar_guia(servicio_sheets, num_guia):
+    """Marca una sola guía (todas sus filas) por su número canónico."""
+    ok, _ = marcar_guias_procesadas(servicio_sheets, [num_guia])
+    return ok
 
 def obtener_usuarios_roles():
-    """Descarga los roles de usuario desde la hoja 'Usuario_Roles'."""
-    from src.services.google_service import obtener_servicios
-    _, servicio_sheets = obtener_servicios()
-    
-    if not servicio_sheets:
-        return {}
-        
-    try:
-        # Apunta a la Base de Datos Exclusiva de Seguridad (RBAC)
-        SHEET_ID = "1OglcHUuRkD6LErUMevr-tOmAsLZpQEk2OKn8NyJN8mo" 
-        r = servicio_sheets.spreadsheets().values().get(
-            spreadsheetId=SHEET_ID, 
-            range="'Usuario_Roles'!A2:D"
-        ).execute()
-        
-        v = r.get('values', [])
-        usuarios = {}
-        for fila in v:
-            if len(fila) >= 4:
-                email = str(fila[0]).strip().lower()
-                nombre = str(fila[1]).strip()
-                rol = str(fila[2]).strip()
-                estado = str(fila[3]).strip()
-                
-                if email:
-                    usuarios[email] = {
-                        "Nombre": nombre,
-                        "Rol": rol,
-                        "Estado": estado
-                    }
-        return usuarios
-    except Exception as e:
-        import streamlit as st
-        st.error(f"Error cargando dict de roles: {e}")
-        return {}
+    """Roles de usuario de la hoja 'Usuario_Roles' del Sheet RBAC: {email: {Nombre, Rol, Estado}}."""
+    return usuarios_roles()
 
 def registrar_auditoria_sistema(correo, modo, guias_leidas, guias_certificadas):
-    """Registra en la pestaña 'Control' del Sheet RBAC."""
-    SHEET_ID = "1OglcHUuRkD6LErUMevr-tOmAsLZpQEk2OKn8NyJN8mo" 
-    from src.services.google_service import obtener_servicios
+    """Registra en la pestaña 'Control' del Sheet RBAC: EN_COLA vía la cola de escritura; True / False si se escribe directo."""
+    SHEET_ID = ID_SHEET_RBAC
     from datetime import datetime
-    _, sheets = obtener_servicios()
-    if not sheets: return False
     
     fecha = datetime.now().strftime("%d/%m/%Y")
     hora = datetime.now().strftime("%H:%M:%S")
     
     datos = [fecha, hora, str(correo), str(modo), str(guias_leidas), str(guias_certificadas)]
+    if COLA_DISPONIBLE:
+        try:
+            id_fila = encolar_fila("auditoria", datos)
+            seguir_en_sesion(id_fila, f"Auditoría {modo} ({fecha} {hora})")
+            return EN_COLA
+        except sqlite3.Error as e:
+            print(f"Cola de escritura no disponible, escribiendo auditoría directo: {e}")
+    _, sheets = obtener_servicios()
+    if not sheets: return False
     
     try:
         sheets.spreadsheets().values().append(
@@ -0,0 +1,195 @@
+# ====================================================================
+# --- BLOQUE 0: Imports ---
+# ====================================================================
+import time
+import threading
+from src.config.settings import ID_SHEET_REPOSITORIO, GUIAS_INSTANTANEA_TTL_S
+from src.utils.format_utils import numero_guia_canonico
+from src.services.sheets_incremental import sincronizar_pestana
+
+# ====================================================================
+# --- BLOQUE 1: Instantánea Compartida de Guias_recibidas ---
+# ====================================================================
+# 'Guias_recibidas'!A2:H en memoria, compartida por todas las sesiones del proceso y al día por deltas (sheets_incremental).
+# Columnas: A Fecha | B N° Guía | D Empresa | E Fundo | F Archivo | H Bitácora ('✅ Nuevo: ...' = ya generada)
+PESTANA_GUIAS = "Guias_recibidas"
+MARCA_PROCESADA = "✅ Nuevo"
+FORMATO_MARCA = "%d/%m/%Y %H:%M" # El de siempre en la columna H (hora de Lima): hay filtros de la hoja que lo leen
+MESES_ES = {"01": "Enero", "02": "Febrero", "03": "Marzo", "04": "Abril", "05": "Mayo", "06": "Junio", "07": "Julio",
+            "08": "Agosto", "09": "Septiembre", "10": "Octubre", "11": "Noviembre", "12": "Diciembre"}
+
+_LOCK_GUIAS = threading.Lock() # Protege la instantánea vigente (lecturas de índices y marcas)
+_LOCK_CARGA = threading.Lock() # Una sola descarga a la vez: las demás sesiones esperan y reutilizan esa
+_estado = {"instantanea": None, "version": 0}
+
+def texto_marca(momento):
+    """'✅ Nuevo: 05/03/2025 14:07' para la columna H."""
+    return f"{MARCA_PROCESADA}: {momento.strftime(FORMATO_MARCA)}"
+
+def mes_de_fecha(fecha_str):
+    """'15/03/2025' (o M/D/YYYY) -> 'Marzo 2025'; sin fecha -> 'Sin Fecha'; otro texto se devuelve tal cual."""
+    fecha_str = str(fecha_str).strip()
+    if "/" in fecha_str:
+        partes = fecha_str.split("/")
+        if len(partes) >= 2:
+            mes_num = partes[1].zfill(2)
+            anio = partes[2] if len(partes) > 2 else ""
+            return f"{MESES_ES.get(mes_num, mes_num)} {anio}".strip()
+    return fecha_str or "Sin Fecha"
+
+def _celda(fila, i):
+    return str(fila[i]).strip() if len(fila) > i else ""
+
+def _indexar_fila(inst, fila_excel, fila):
+    registro = {
+        "fila": fila_excel,
+        "numero_guia": _celda(fila, 1) if len(fila) > 1 else "S/N",
+        "empresa": _celda(fila, 3),
+        "fundo": _celda(fila, 4),
+        "archivo": _celda(fila, 5),
+        "bitacora": _celda(fila, 7),
+        "mes": mes_de_fecha(_celda(fila, 0)),
+    }
+    inst["filas"][fila_excel] = registro
+    if MARCA_PROCESADA not in registro["bitacora"]:
+        inst["pendientes"].add(fila_excel)
+    if registro["numero_guia"] not in ("", "S/N"):
+        inst["por_numero"].setdefault(numero_guia_canonico(registro["numero_guia"]), []).append(fila_excel)
+    # Solo filas con Fecha..Archivo completas cuentan para el catálogo del Repositorio Masivo
+    if len(fila) >= 6:
+        inst["por_grupo"].setdefault((registro["empresa"], registro["mes"], registro["fundo"]), []).append(fila_excel)
+
+def construir_instantanea(valores, version):
+    """
+    Filas de A2:H -> registros por fila de Excel más los índices que consultan las pantallas:
+    por (empresa, mes, fundo), por número de guía canónico y el conjunto de filas pendientes.
+    """
+    inst = {"version": version, "cargada_en": time.time(), "filas": {}, "por_grupo": {}, "por_numero": {},
+            "pendientes": set()}
+    for i, fila in enumerate(valores):
+        _indexar_fila(inst, i + 2, fila) # A2 en adelante
+    return inst
+
+def _aplicar_delta(inst, valores, desde, modificadas, version):
+    """
+    Filas nuevas al final de los índices y bitácora al día en las modificadas. sincronizar_pestana solo deja pasar
+    cambios de la columna H en filas ya conocidas (cualquier otra edición provoca una recarga completa).
+    """
+    for i in modificadas:
+        registro = inst["filas"].get(i + 2)
+        if registro is None or i >= desde: continue
+        registro["bitacora"] = _celda(valores[i], 7)
+        if MARCA_PROCESADA in registro["bitacora"]: inst["pendientes"].discard(i + 2)
+        else: inst["pendientes"].add(i + 2)
+    for i in range(desde, len(valores)):
+        _indexar_fila(inst, i + 2, valores[i])
+    inst["version"] = version
+    inst["cargada_en"] = time.time()
+
+def _vigente():
+    inst = _estado["instantanea"]
+    if inst is not None and time.time() - inst["cargada_en"] < GUIAS_INSTANTANEA_TTL_S:
+        return inst
+    return None
+
+def obtener_instantanea(servicio_sheets, forzar=False):
+    """
+    Instantánea vigente; si venció (GUIAS_INSTANTANEA_TTL_S) la sincroniza un solo hilo y el resto la reutiliza.
+    La sincronización es incremental (filas nuevas y columna H); forzar=True descarga la pestaña completa.
+    """
+    inst = None if forzar else _vigente()
+    if inst is not None: return inst
+    with _LOCK_CARGA:
+        inst = None if forzar else _vigente()
+        if inst is not None: return inst # Otra sesión la recargó mientras esperábamos
+        delta = sincronizar_pestana(servicio_sheets, ID_SHEET_REPOSITORIO, PESTANA_GUIAS, "H", ("H",), fila_inicio=2,
+                                    completa=forzar or _estado["instantanea"] is None)
+        with _LOCK_GUIAS:
+            _estado["version"] += 1
+            inst = _estado["instantanea"]
+            if delta["completa"] or inst is None:
+                inst = construir_instantanea(delta["filas"], _estado["version"])
+                _estado["instantanea"] = inst
+            else:
+                _aplicar_delta(inst, delta["filas"], delta["desde"], delta["modificadas"], _estado["version"])
+        return inst
+
+def invalidar_instantanea():
+    """La siguiente consulta vuelve a descargar la pestaña (purga de caché desde Admin Tools)."""
+    with _LOCK_GUIAS:
+        _estado["instantanea"] = None
+
+def registrar_marcas(filas_excel, marca):
+    """
+    Aplica a la instantánea las marcas de bitácora ya escritas en Sheets: las guías dejan de figurar como pendientes
+    en todas las sesiones sin esperar a la siguiente descarga.
+    """
+    with _LOCK_GUIAS:
+        inst = _estado["instantanea"]
+        if inst is None: return
+        for fila in filas_excel:
+            registro = inst["filas"].get(fila)
+            if registro is None: continue
+            registro["bitacora"] = marca
+            if MARCA_PROCESADA in marca:
+                inst["pendientes"].discard(fila)
+        _estado["version"] += 1
+        inst["version"] = _estado["version"]
+
+def estado_instantanea():
+    """Versión, edad y tamaño de la instantánea (panel de administración)."""
+    with _LOCK_GUIAS:
+        inst = _estado["instantanea"]
+        if inst is None: return {"version": _estado["version"], "filas": 0, "pendientes": 0, "edad_s": None}
+        return {"version": inst["version"], "filas": len(inst["filas"]), "pendientes": len(inst["pendientes"]),
+                "edad_s": round(time.time() - inst["cargada_en"], 1)}
+
+# ====================================================================
+# --- BLOQUE 2: Consultas sobre los Índices ---
+# ====================================================================
+def _guia_de(registro):
+    return {"nombre": registro["archivo"], "fila": registro["fila"], "numero_guia": registro["numero_guia"]}
+
+def catalogo_pendientes(servicio_sheets):
+    """Empresa -> mes -> fundos ordenados, solo de grupos con alguna guía pendiente (recorre grupos, no filas)."""
+    inst = obtener_instantanea(servicio_sheets)
+    catalogo = {}
+    with _LOCK_GUIAS:
+        for (empresa, mes, fundo), filas in inst["por_grupo"].items():
+            if not empresa or not any(f in inst["pendientes"] for f in filas): continue
+            fundos = catalogo.setdefault(empresa, {}).setdefault(mes, set())
+            if fundo: fundos.add(fundo)
+    return {emp: {mes: sorted(fundos) for mes, fundos in meses.items()} for emp, meses in catalogo.items()}
+
+def guias_pendientes_grupo(servicio_sheets, empresa, mes, fundo):
+    """Guías con archivo y sin marca de un (empresa, mes, fundo), en el orden de la hoja."""
+    inst = obtener_instantanea(servicio_sheets)
+    with _LOCK_GUIAS:
+        filas = inst["por_grupo"].get((empresa, mes, fundo), [])
+        return [_guia_de(inst["filas"][f]) for f in filas if f in inst["pendientes"] and inst["filas"][f]["archivo"]]
+
+def guias_pendientes(servicio_sheets):
+    """Todas las guías con archivo y sin marca, en el orden de la hoja."""
+    inst = obtener_instantanea(servicio_sheets)
+    with _LOCK_GUIAS:
+        return [_guia_de(inst["filas"][f]) for f in sorted(inst["pendientes"]) if inst["filas"][f]["archivo"]]
+
+def _buscar_numero(inst, clave, parcial):
+    filas = list(inst["por_numero"].get(clave, []))
+    if filas or not parcial or len(clave) < 4: return filas
+    candidatas = [min(f) for c, f in inst["por_numero"].items() if clave in c]
+    return [min(candidatas)] if candidatas else []
+
+def filas_por_numeros(servicio_sheets, numeros_guia, parcial=False):
+    """
+    {número tal como llegó: filas de Excel} resolviendo cada número una sola vez contra el índice canónico.
+    Con parcial=True y sin coincidencia exacta, acepta el primer número que contenga al buscado (p. ej. un nombre de archivo).
+    """
+    inst = obtener_instantanea(servicio_sheets)
+    claves = {numero: numero_guia_canonico(numero) for numero in numeros_guia}
+    with _LOCK_GUIAS:
+        return {numero: _buscar_numero(inst, clave, parcial) for numero, clave in claves.items()}
+
+def filas_por_numero(servicio_sheets, numero_guia, parcial=False):
+    """Filas de Excel de un solo número de guía (ver filas_por_numeros)."""
+    return filas_por_numeros(servicio_sheets, [numero_guia], parcial)[numero_guia]
@@ -0,0 +1,278 @@
+# ====================================================================
+# --- BLOQUE 0: Imports ---
+# ====================================================================
+import os
+import time
+import sqlite3
+import threading
+import streamlit as st
+from src.config.settings import (METRICAS_DIR, METRICAS_VENTANA_H, METRICAS_RETENCION_H, PRECIOS_VERTEX_USD_1M,
+                                 PRECIO_TOKENS_CACHE_FACTOR)
+
+# ====================================================================
+# --- BLOQUE 1: Almacén Local de Métricas (Inserciones y Poda por Retención) ---
+# ====================================================================
+RUTA_METRICAS_DB = os.path.join(METRICAS_DIR, "metricas_vertex.sqlite3")
+PODA_INTERVALO_S = 3600 # Como mucho una poda por hora y proceso
+_LOCK_METRICAS = threading.Lock()
+_LOCK_ESQUEMA = threading.Lock()
+_estado = {"esquema": False, "ultima_poda": 0.0}
+
+def _preparar_esquema(conn):
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute(
+        "CREATE TABLE IF NOT EXISTS llamadas ("
+        " ts REAL NOT NULL, guia TEXT, etapa TEXT, region TEXT, modelo TEXT, intento INTEGER,"
+        " tokens_entrada INTEGER, tokens_salida INTEGER, latencia_s REAL, resultado TEXT, guias INTEGER)"
+    )
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_llamadas_ts ON llamadas(ts)")
+    conn.execute(
+        "CREATE TABLE IF NOT EXISTS enrutamiento ("
+        " ts REAL NOT NULL, guia TEXT, complejidad TEXT, motivo TEXT, paginas INTEGER, bytes INTEGER,"
+        " paginas_con_texto INTEGER, proporcion_imagen REAL, modelo_inicial TEXT, modelo_final TEXT,"
+        " latencia_s REAL, llamadas INTEGER, resultado TEXT)"
+    )
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_enrutamiento_ts ON enrutamiento(ts)")
+    if "tokens_cache" not in {c[1] for c in conn.execute("PRAGMA table_info(llamadas)")}:
+        conn.execute("ALTER TABLE llamadas ADD COLUMN tokens_cache INTEGER DEFAULT 0")
+
+def _conectar_metricas():
+    """Conexión al almacén; el esquema (PRAGMA / CREATE / ALTER) se prepara una sola vez por proceso."""
+    if not _estado["esquema"]:
+        with _LOCK_ESQUEMA:
+            if not _estado["esquema"]:
+                os.makedirs(METRICAS_DIR, exist_ok=True)
+                conn = sqlite3.connect(RUTA_METRICAS_DB, timeout=10)
+                try:
+                    _preparar_esquema(conn)
+                    conn.commit()
+                finally:
+                    conn.close()
+                _estado["esquema"] = True
+    return sqlite3.connect(RUTA_METRICAS_DB, timeout=10)
+
+def _podar_metricas(conn):
+    """Borra filas fuera de METRICAS_RETENCION_H (llamar con _LOCK_METRICAS tomado)."""
+    ahora = time.time()
+    if ahora - _estado["ultima_poda"] < PODA_INTERVALO_S: return
+    _estado["ultima_poda"] = ahora
+    limite = ahora - max(METRICAS_RETENCION_H, METRICAS_VENTANA_H) * 3600
+    with conn:
+        borradas = conn.execute("DELETE FROM llamadas WHERE ts < ?", (limite,)).rowcount
+        borradas += conn.execute("DELETE FROM enrutamiento WHERE ts < ?", (limite,)).rowcount
+    if borradas:
+        print(f"Métricas Vertex: {borradas} filas anteriores a {METRICAS_RETENCION_H} h eliminadas")
+
+def tokens_de_respuesta(response):
+    """
+    (entrada, salida, entrada servida desde caché) según usage_metadata; ceros si la respuesta no lo trae.
+    Los tokens en caché ya están incluidos en los de entrada.
+    """
+    uso = getattr(response, "usage_metadata", None)
+    if uso is None: return 0, 0, 0
+    return (int(getattr(uso, "prompt_token_count", 0) or 0), int(getattr(uso, "candidates_token_count", 0) or 0),
+            int(getattr(uso, "cached_content_token_count", 0) or 0))
+
+def clasificar_resultado(err_msg):
+    t = str(err_msg).upper()
+    if "429" in t or "RESOURCE_EXHAUSTED" in t: return "cuota"
+    if "DEADLINE" in t or "TIMEOUT" in t: return "plazo"
+    if "404" in t: return "404"
+    return "error"
+
+def registrar_llamada(guia, etapa, region, modelo, intento, latencia_s, resultado,
+                      tokens_entrada=0, tokens_salida=0, guias=1, tokens_cache=0):
+    """Agrega una fila; nunca interrumpe la extracción si el disco falla."""
+    fila = (time.time(), guia, etapa, region, modelo, intento, tokens_entrada, tokens_salida,
+            round(latencia_s, 3), resultado, guias, tokens_cache)
+    try:
+        with _LOCK_METRICAS:
+            conn = _conectar_metricas()
+            try:
+                with conn:
+                    conn.execute(
+                        "INSERT INTO llamadas (ts, guia, etapa, region, modelo, intento, tokens_entrada, tokens_salida,"
+                        " latencia_s, resultado, guias, tokens_cache) VALUES (?,?,?,?,?,?,?,?,?,?,?,?)", fila
+                    )
+                _podar_metricas(conn)
+            finally:
+                conn.close()
+    except sqlite3.Error as e:
+        print(f"Error registrando métrica Vertex: {e}")
+
+def registrar_enrutamiento(guia, complejidad, motivo, perfil, modelo_inicial, modelo_final, latencia_s, llamadas, resultado):
+    """Decisión del enrutador por complejidad y su desenlace (una fila por guía enviada a Vertex)."""
+    fila = (time.time(), guia, complejidad, motivo, perfil.get("paginas"), perfil.get("bytes"),
+            perfil.get("paginas_con_texto"), perfil.get("proporcion_imagen"), modelo_inicial, modelo_final,
+            round(latencia_s, 3), llamadas, resultado)
+    print(f"Enrutamiento {complejidad} ({motivo}): {modelo_inicial} -> {modelo_final or resultado} "
+          f"en {latencia_s:.1f}s, {llamadas} llamada(s)")
+    try:
+        with _LOCK_METRICAS:
+            conn = _conectar_metricas()
+            try:
+                with conn:
+                    conn.execute("INSERT INTO enrutamiento VALUES (?,?,?,?,?,?,?,?,?,?,?,?,?)", fila)
+                _podar_metricas(conn)
+            finally:
+                conn.close()
+    except sqlite3.Error as e:
+        print(f"Error registrando enrutamiento: {e}")
+
+# ====================================================================
+# --- BLOQUE 2: Agregados (p50 / p95, Tokens y Costo por Guía) ---
+# ====================================================================
+def costo_llamada_usd(modelo, tokens_entrada, tokens_salida, tokens_cache=0):
+    """Los tokens de entrada servidos desde caché se cobran a PRECIO_TOKENS_CACHE_FACTOR del precio normal."""
+    precio_in, precio_out = PRECIOS_VERTEX_USD_1M.get(modelo, (0.0, 0.0))
+    entrada = (tokens_entrada - tokens_cache) + tokens_cache * PRECIO_TOKENS_CACHE_FACTOR
+    return (entrada * precio_in + tokens_salida * precio_out) / 1_000_000
+
+def _percentil(conn, tabla, filtro, params, n, p):
+    """Percentil p de latencia_s entre las n filas que cumplen filtro (misma regla: índice int(p * n) del orden)."""
+    if not n: return 0.0
+    fila = conn.execute(f"SELECT latencia_s FROM {tabla} WHERE {filtro} ORDER BY latencia_s LIMIT 1 OFFSET ?",
+                        (*params, min(n - 1, int(p * n)))).fetchone()
+    return round(fila[0] or 0.0, 2) if fila else 0.0
+
+# Llamadas reales a Vertex: la etapa local (caché / texto / a_vertex) se registra con modelo = 'local'
+_VERTEX = "ts >= ? AND modelo IS NOT 'local'"
+_LOCAL = "ts >= ? AND modelo = 'local'"
+
+def _agregar_metricas(conn, desde):
+    por_modelo, costo, llamadas, tokens_entrada, tokens_salida, tokens_cache = {}, 0.0, 0, 0, 0, 0
+    for modelo, n, ok, t_in, t_out, t_cache in conn.execute(
+        "SELECT modelo, COUNT(*), SUM(resultado = 'ok'), SUM(tokens_entrada), SUM(tokens_salida),"
+        f" SUM(COALESCE(tokens_cache, 0)) FROM llamadas WHERE {_VERTEX} GROUP BY modelo", (desde,)
+    ):
+        t_in, t_out, t_cache = t_in or 0, t_out or 0, t_cache or 0
+        costo_modelo = costo_llamada_usd(modelo, t_in, t_out, t_cache) # Lineal en tokens: sumar antes da lo mismo
+        filtro_ok = f"{_VERTEX} AND modelo IS ? AND resultado = 'ok'"
+        por_modelo[modelo] = {
+            "llamadas": n, "ok": ok, "tokens_entrada": t_in, "tokens_salida": t_out, "costo_usd": round(costo_modelo, 5),
+            "p50_s": _percentil(conn, "llamadas", filtro_ok, (desde, modelo), ok, 0.50),
+            "p95_s": _percentil(conn, "llamadas", filtro_ok, (desde, modelo), ok, 0.95),
+        }
+        costo += costo_modelo
+        llamadas += n
+        tokens_entrada, tokens_salida, tokens_cache = tokens_entrada + t_in, tokens_salida + t_out, tokens_cache + t_cache
+
+    por_resultado = dict(conn.execute(
+        f"SELECT resultado, COUNT(*) FROM llamadas WHERE {_VERTEX} GROUP BY resultado ORDER BY resultado", (desde,)))
+    por_resultado_local = dict(conn.execute(
+        f"SELECT resultado, COUNT(*) FROM llamadas WHERE {_LOCAL} GROUP BY resultado ORDER BY resultado", (desde,)))
+    exitosas, entrada_exitosas = conn.execute(
+        f"SELECT COUNT(*), SUM(tokens_entrada) FROM llamadas WHERE {_VERTEX} AND resultado = 'ok'", (desde,)).fetchone()
+    # Toda guía pasa una vez por la etapa local (caché / texto / a_vertex): ahí se cuentan, sin duplicar lotes ni reintentos
+    n_guias, n_guias_vertex = conn.execute(
+        "SELECT COUNT(DISTINCT guia), COUNT(DISTINCT CASE WHEN resultado = 'a_vertex' THEN guia END)"
+        f" FROM llamadas WHERE {_LOCAL}", (desde,)).fetchone()
+
+    por_etapa = {}
+    for etapa, n in conn.execute("SELECT etapa, COUNT(*) FROM llamadas WHERE ts >= ? GROUP BY etapa", (desde,)).fetchall():
+        filtro = "ts >= ? AND etapa IS ?"
+        por_etapa[etapa] = {"n": n, "p50_s": _percentil(conn, "llamadas", filtro, (desde, etapa), n, 0.5),
+                            "p95_s": _percentil(conn, "llamadas", filtro, (desde, etapa), n, 0.95)}
+
+    filtro_ok = f"{_VERTEX} AND resultado = 'ok'"
+    return {
+        "llamadas": llamadas,
+        "exitosas": exitosas,
+        "por_resultado": por_resultado,
+        "por_resultado_local": por_resultado_local,
+        "p50_s": _percentil(conn, "llamadas", filtro_ok, (desde,), exitosas, 0.50),
+        "p95_s": _percentil(conn, "llamadas", filtro_ok, (desde,), exitosas, 0.95),
+        "tokens_entrada": tokens_entrada,
+        "tokens_salida": tokens_salida,
+        "tokens_cache": tokens_cache,
+        "tokens_entrada_por_llamada": round((entrada_exitosas or 0) / exitosas) if exitosas else 0,
+        "costo_usd": round(costo, 4),
+        "guias": n_guias,
+        "costo_por_guia_usd": round(costo / n_guias, 5) if n_guias else 0.0,
+        "guias_vertex": n_guias_vertex,
+        "costo_por_guia_vertex_usd": round(costo / n_guias_vertex, 5) if n_guias_vertex else 0.0,
+        "llamadas_por_guia": round(llamadas / n_guias_vertex, 2) if n_guias_vertex else 0.0,
+        "por_modelo": por_modelo,
+        "por_etapa": por_etapa,
+    }
+
+def resumen_metricas(ventana_h=None):
+    """
+    Agregados de las últimas ventana_h horas: latencias, tokens, costo total y por guía, desglose por modelo.
+    Sumas, conteos y percentiles se calculan en SQLite: Python solo recibe una fila por grupo.
+    """
+    desde = time.time() - (ventana_h or METRICAS_VENTANA_H) * 3600
+    try:
+        conn = _conectar_metricas()
+        try:
+            return _agregar_metricas(conn, desde)
+        finally:
+            conn.close()
+    except sqlite3.Error as e:
+        print(f"Error leyendo métricas Vertex: {e}")
+    # Sin almacén legible: los mismos agregados en cero (mismo esquema, en memoria)
+    vacia = sqlite3.connect(":memory:")
+    try:
+        _preparar_esquema(vacia)
+        return _agregar_metricas(vacia, desde)
+    finally:
+        vacia.close()
+
+def resumen_enrutamiento(ventana_h=None):
+    """Por complejidad: guías, % ok, latencia p50/p95, llamadas medias y % resueltas por el primer modelo elegido."""
+    desde = time.time() - (ventana_h or METRICAS_VENTANA_H) * 3600
+    resumen = {}
+    try:
+        conn = _conectar_metricas()
+        try:
+            for complejidad, n, ok, llamadas_media, primer_modelo in conn.execute(
+                "SELECT complejidad, COUNT(*), SUM(resultado = 'ok'), AVG(llamadas),"
+                " SUM(resultado = 'ok' AND modelo_inicial IS modelo_final)"
+                " FROM enrutamiento WHERE ts >= ? GROUP BY complejidad ORDER BY complejidad", (desde,)
+            ).fetchall():
+                filtro_ok = "ts >= ? AND complejidad IS ? AND resultado = 'ok'"
+                resumen[complejidad] = {
+                    "guias": n,
+                    "ok_pct": round(100 * ok / n, 1),
+                    "p50_s": _percentil(conn, "enrutamiento", filtro_ok, (desde, complejidad), ok, 0.50),
+                    "p95_s": _percentil(conn, "enrutamiento", filtro_ok, (desde, complejidad), ok, 0.95),
+                    "llamadas_media": round(llamadas_media or 0, 2),
+                    "primer_modelo_pct": round(100 * primer_modelo / ok, 1) if ok else 0.0,
+                }
+        finally:
+            conn.close()
+    except sqlite3.Error as e:
+        print(f"Error leyendo enrutamiento: {e}")
+    return resumen
+
+# ====================================================================
+# --- BLOQUE 3: Panel para Admin Tools ---
+# ====================================================================
+def render_metricas_vertex():
+    """Bloque de métricas Vertex (todas las sesiones) para el expander de Admin Tools."""
+    r = resumen_metricas()
+    st.markdown(f"### 💰 Vertex AI (últimas {METRICAS_VENTANA_H} h)")
+    c1, c2, c3 = st.columns(3)
+    c1.metric(label="Latencia p50", value=f"{r['p50_s']}s")
+    c2.metric(label="Latencia p95", value=f"{r['p95_s']}s")
+    c3.metric(label="Costo / guía", value=f"${r['costo_por_guia_usd']:.4f}", delta=f"${r['costo_por_guia_vertex_usd']:.4f} vía Vertex", delta_color="off")
+    c1, c2, c3 = st.columns(3)
+    c1.metric(label="Llamadas", value=r["llamadas"], delta=f"{r['llamadas_por_guia']} por guía Vertex", delta_color="off")
+    c2.metric(label="Tokens in/out", value=f"{r['tokens_entrada']:,}", delta=f"{r['tokens_salida']:,} salida", delta_color="off")
+    c3.metric(label="Costo total", value=f"${r['costo_usd']:.2f}")
+    if r["por_modelo"]:
+        st.dataframe(
+            [{"modelo": m, **v} for m, v in sorted(r["por_modelo"].items())],
+            use_container_width=True, hide_index=True
+        )
+    if r["por_etapa"]:
+        st.caption(" · ".join(f"{e}: p50 {v['p50_s']}s / p95 {v['p95_s']}s (n={v['n']})" for e, v in sorted(r["por_etapa"].items())))
+    if r["tokens_entrada"]:
+        st.caption(f"Entrada media por llamada: {r['tokens_entrada_por_llamada']:,} tokens · "
+                   f"{100 * r['tokens_cache'] / r['tokens_entrada']:.0f}% servido desde caché de contexto")
+    enrutamiento = resumen_enrutamiento()
+    if enrutamiento:
+        st.caption("Enrutamiento por complejidad (ajustar OCR_TRIVIAL_* / OCR_DIFICIL_*):")
+        st.dataframe([{"complejidad": c, **v} for c, v in enrutamiento.items()], use_container_width=True, hide_index=True)
+    if r["por_resultado"]:
+        st.caption("Resultados: " + ", ".join(f"{k}={v}" for k, v in r["por_resultado"].items()))
@@ -0,0 +1,162 @@
+# ====================================================================
+# --- BLOQUE 0: Imports ---
+# ====================================================================
+import time
+import threading
+from collections import OrderedDict, deque
+from concurrent.futures import Future
+from src.config.settings import OCR_PLANIFICADOR_HILOS, OCR_TURNO_MASIVO
+
+# ====================================================================
+# --- BLOQUE 1: Carriles y Estado del Planificador (Proceso Completo) ---
+# ====================================================================
+# Interactivo: guías subidas a mano con st.file_uploader (alguien espera frente a la pantalla).
+# Masivo: Repositorio Masivo y Auto-Completar de Sigersol (lotes largos que pueden esperar).
+CARRIL_INTERACTIVO = "interactivo"
+CARRIL_MASIVO = "masivo"
+CARRILES = [CARRIL_INTERACTIVO, CARRIL_MASIVO]
+
+ALFA_ESPERA = 0.2 # Peso de la última espera en la media móvil
+
+_COND = threading.Condition()
+# carril -> {usuario: deque de trabajos}; el orden del OrderedDict es el turno round-robin
+_colas = {c: OrderedDict() for c in CARRILES}
+_estado = {
+    "hilos": [],
+    "en_ejecucion": 0,
+    "despachos": 0,
+    "espera_media": {c: 0.0 for c in CARRILES},
+}
+
+class _Trabajo:
+    __slots__ = ("usuario", "carril", "funcion", "args", "futuro", "encolado")
+
+    def __init__(self, usuario, carril, funcion, args):
+        self.usuario = usuario
+        self.carril = carril
+        self.funcion = funcion
+        self.args = args
+        self.futuro = Future()
+        self.encolado = time.time()
+
+# ====================================================================
+# --- BLOQUE 2: Orden de Despacho (Prioridad + Turnos Justos por Usuario) ---
+# ====================================================================
+def _carril_siguiente(colas, despachos):
+    """
+    El carril interactivo va primero; para que un lote masivo no quede congelado,
+    uno de cada OCR_TURNO_MASIVO despachos se reserva al carril masivo si tiene trabajo.
+    """
+    hay = {c: any(colas[c].values()) for c in CARRILES}
+    if hay[CARRIL_MASIVO] and (not hay[CARRIL_INTERACTIVO] or (despachos + 1) % OCR_TURNO_MASIVO == 0):
+        return CARRIL_MASIVO
+    if hay[CARRIL_INTERACTIVO]:
+        return CARRIL_INTERACTIVO
+    return None
+
+def _sacar(colas, carril):
+    """Round-robin entre usuarios del carril: un trabajo del primero y ese usuario pasa al final."""
+    cola = colas[carril]
+    usuario, trabajos = next(iter(cola.items()))
+    trabajo = trabajos.popleft()
+    del cola[usuario]
+    if trabajos:
+        cola[usuario] = trabajos
+    return trabajo
+
+def _siguiente_trabajo():
+    """Con _COND tomado. Descarta trabajos cancelados antes de empezar."""
+    while True:
+        carril = _carril_siguiente(_colas, _estado["despachos"])
+        if carril is None: return None
+        trabajo = _sacar(_colas, carril)
+        if trabajo.futuro.set_running_or_notify_cancel():
+            _estado["despachos"] += 1
+            return trabajo
+
+# ====================================================================
+# --- BLOQUE 3: Hilos Trabajadores ---
+# ====================================================================
+def _trabajador():
+    while True:
+        with _COND:
+            trabajo = _siguiente_trabajo()
+            while trabajo is None:
+                _COND.wait()
+                trabajo = _siguiente_trabajo()
+            _estado["en_ejecucion"] += 1
+            espera = time.time() - trabajo.encolado
+            media = _estado["espera_media"]
+            media[trabajo.carril] = ALFA_ESPERA * espera + (1 - ALFA_ESPERA) * media[trabajo.carril]
+
+        try:
+            trabajo.futuro.set_result(trabajo.funcion(*trabajo.args))
+        except BaseException as e:
+            trabajo.futuro.set_exception(e)
+        finally:
+            with _COND:
+                _estado["en_ejecucion"] -= 1
+
+def _asegurar_hilos():
+    """Con _COND tomado. Los hilos se crean al primer uso y viven lo que el proceso."""
+    vivos = [h for h in _estado["hilos"] if h.is_alive()]
+    for n in range(len(vivos), OCR_PLANIFICADOR_HILOS):
+        h = threading.Thread(target=_trabajador, name=f"ocr_planificador_{n}", daemon=True)
+        h.start()
+        vivos.append(h)
+    _estado["hilos"] = vivos
+
+# ====================================================================
+# --- BLOQUE 4: API Pública (Encolar y Consultar la Cola) ---
+# ====================================================================
+def enviar_trabajo_ocr(funcion, *args, usuario=None, carril=CARRIL_INTERACTIVO):
+    """Encola funcion(*args) en el carril indicado y devuelve un Future (cancelable mientras no empiece)."""
+    usuario = usuario or "anonimo"
+    carril = carril if carril in CARRILES else CARRIL_INTERACTIVO
+    trabajo = _Trabajo(usuario, carril, funcion, args)
+    with _COND:
+        _asegurar_hilos()
+        cola = _colas[carril]
+        if usuario not in cola:
+            cola[usuario] = deque()
+        cola[usuario].append(trabajo)
+        _COND.notify()
+    return trabajo.futuro
+
+def posicion_en_cola(usuario):
+    """Trabajos que se despacharán antes del próximo de este usuario (0 = es el siguiente; None = no tiene nada en cola)."""
+    usuario = usuario or "anonimo"
+    with _COND:
+        copia = {c: OrderedDict((u, deque(t)) for u, t in _colas[c].items()) for c in CARRILES}
+        despachos = _estado["despachos"]
+    posicion = 0
+    while True:
+        carril = _carril_siguiente(copia, despachos)
+        if carril is None: return None
+        trabajo = _sacar(copia, carril)
+        if trabajo.futuro.cancelled(): continue
+        if trabajo.usuario == usuario: return posicion
+        posicion += 1
+        despachos += 1
+
+def estado_planificador(usuario=None):
+    """Profundidad por carril, trabajos en curso, espera media y, si se indica, la posición del usuario."""
+    with _COND:
+        info = {
+            "en_cola": {c: sum(len(t) for t in _colas[c].values()) for c in CARRILES},
+            "usuarios_en_cola": {c: len(_colas[c]) for c in CARRILES},
+            "en_ejecucion": _estado["en_ejecucion"],
+            "hilos": OCR_PLANIFICADOR_HILOS,
+            "espera_media_s": {c: round(v, 1) for c, v in _estado["espera_media"].items()},
+        }
+    if usuario is not None:
+        info["posicion"] = posicion_en_cola(usuario)
+    return info
+
+def texto_estado_cola(info):
+    """Mensaje corto para st.caption mientras el lote del usuario espera turno."""
+    posicion = info.get("posicion")
+    if posicion is None:
+        return f"⚙️ Procesando... ({info['en_ejecucion']} trabajos en curso en el servidor)"
+    return (f"⏳ En cola: {posicion} trabajo(s) antes que el tuyo · "
+            f"espera media {info['espera_media_s'][CARRIL_INTERACTIVO]}s (manual) / {info['espera_media_s'][CARRIL_MASIVO]}s (masivo)")
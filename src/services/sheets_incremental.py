@@ -0,0 +1,149 @@
+# ====================================================================
+# --- BLOQUE 0: Imports ---
+# ====================================================================
+import json
+import time
+import hashlib
+import threading
+from src.config.settings import SHEETS_DELTA_VENTANA
+
+# ====================================================================
+# --- BLOQUE 1: Estado por Pestaña (Compartido entre Sesiones) ---
+# ====================================================================
+# Guias_recibidas, Registro_Guias e historial solo crecen por abajo: tras la primera descarga completa se piden
+# únicamente las filas nuevas (más una ventana de cola para detectar ediciones) y las columnas de estado (H / O),
+# que son las únicas que la operación edita en filas antiguas. Si la cola no coincide, se recarga todo.
+_LOCK_REGISTRO = threading.Lock()
+_pestanas = {} # (spreadsheet_id, pestaña) -> estado
+_locks = {}
+
+def _indice_columna(letra):
+    """'A' -> 0, 'H' -> 7, 'AA' -> 26."""
+    n = 0
+    for c in letra.upper():
+        n = n * 26 + (ord(c) - ord('A') + 1)
+    return n - 1
+
+def _letra_columna(indice):
+    """0 -> 'A', 25 -> 'Z', 26 -> 'AA' (inversa de _indice_columna)."""
+    letras = ""
+    indice += 1
+    while indice > 0:
+        indice, resto = divmod(indice - 1, 26)
+        letras = chr(ord('A') + resto) + letras
+    return letras
+
+def _firma_cola(filas, indices_estado):
+    """Checksum de las filas sin sus columnas de estado (esas se sincronizan aparte y pueden cambiar)."""
+    normalizadas = []
+    for fila in filas:
+        r = ["" if i in indices_estado else str(v) for i, v in enumerate(fila)]
+        while r and r[-1] == "": r.pop()
+        normalizadas.append(r)
+    return hashlib.sha1(json.dumps(normalizadas, ensure_ascii=False).encode("utf-8")).hexdigest()
+
+def _lock_de(clave):
+    with _LOCK_REGISTRO:
+        return _locks.setdefault(clave, threading.Lock())
+
+def vencer_pestana(spreadsheet_id, pestana):
+    """Tras escribir en la pestaña: la siguiente lectura sincroniza aunque no haya vencido su TTL."""
+    with _LOCK_REGISTRO:
+        estado = _pestanas.get((spreadsheet_id, pestana))
+        if estado: estado["sincronizada_en"] = 0.0
+
+def reiniciar_sincronizacion():
+    """Olvida todas las pestañas: la siguiente lectura de cada una vuelve a ser completa (purga de Admin Tools)."""
+    with _LOCK_REGISTRO:
+        _pestanas.clear()
+
+def estado_sincronizacion():
+    """Por pestaña: filas en memoria, lecturas completas/incrementales y filas descargadas (panel de administración)."""
+    campos = ("version", "lecturas_completas", "lecturas_incrementales", "filas_descargadas")
+    with _LOCK_REGISTRO:
+        return {p: dict({k: e[k] for k in campos}, filas=len(e["filas"])) for (_, p), e in _pestanas.items()}
+
+# ====================================================================
+# --- BLOQUE 2: Sincronización Incremental ---
+# ====================================================================
+def _carga_completa(servicio_sheets, spreadsheet_id, pestana, ultima_columna, fila_inicio):
+    r = servicio_sheets.spreadsheets().values().get(
+        spreadsheetId=spreadsheet_id, range=f"'{pestana}'!A{fila_inicio}:{ultima_columna}"
+    ).execute()
+    return r.get('values', [])
+
+def sincronizar_pestana(servicio_sheets, spreadsheet_id, pestana, ultima_columna, columnas_estado=(), fila_inicio=1,
+                        ttl_s=0, completa=False):
+    """
+    Filas de A{fila_inicio}:{ultima_columna} al día, con una sola llamada values.batchGet por sincronización:
+    la cola (SHEETS_DELTA_VENTANA filas ya conocidas) seguida de las filas nuevas, y las columnas de estado del resto.
+    Devuelve {filas, version, completa, desde, modificadas}: 'desde' es el índice de la primera fila nueva y
+    'modificadas' los índices cuyo estado cambió, para que quien indexa aplique solo el delta.
+    Con ttl_s > 0 y una sincronización más reciente, no llama a la API.
+    """
+    clave = (spreadsheet_id, pestana)
+    indices_estado = {_indice_columna(c) for c in columnas_estado}
+    with _lock_de(clave):
+        estado = _pestanas.get(clave)
+        if estado and not completa and time.time() - estado["sincronizada_en"] < ttl_s:
+            return {"filas": list(estado["filas"]), "version": estado["version"], "completa": False,
+                    "desde": len(estado["filas"]), "modificadas": []}
+
+        recarga = completa or estado is None
+        if not recarga:
+            filas = estado["filas"]
+            n = len(filas)
+            ventana = min(SHEETS_DELTA_VENTANA, n)
+            inicio_cola = fila_inicio + n - ventana
+            rangos = [f"'{pestana}'!A{inicio_cola}:{ultima_columna}"]
+            if n > ventana:
+                rangos += [f"'{pestana}'!{c}{fila_inicio}:{c}{inicio_cola - 1}" for c in columnas_estado]
+            r = servicio_sheets.spreadsheets().values().batchGet(spreadsheetId=spreadsheet_id, ranges=rangos).execute()
+            bloques = [b.get('values', []) for b in r.get('valueRanges', [])]
+            cola = bloques[0] if bloques else []
+
+            # Filas editadas o borradas dentro de la ventana: el delta ya no es fiable
+            recarga = len(cola) < ventana or _firma_cola(cola[:ventana], indices_estado) != estado["firma_cola"]
+
+        if recarga:
+            nuevas = _carga_completa(servicio_sheets, spreadsheet_id, pestana, ultima_columna, fila_inicio)
+            estado = {
+                "filas": nuevas, "version": (estado["version"] if estado else 0) + 1,
+                "lecturas_completas": (estado["lecturas_completas"] if estado else 0) + 1,
+                "lecturas_incrementales": estado["lecturas_incrementales"] if estado else 0,
+                "filas_descargadas": (estado["filas_descargadas"] if estado else 0) + len(nuevas),
+            }
+            desde, modificadas = 0, []
+        else:
+            modificadas = []
+            # Columnas de estado de las filas anteriores a la cola
+            for c, bloque in zip(columnas_estado, bloques[1:]):
+                i_col = _indice_columna(c)
+                for i in range(n - ventana):
+                    nuevo = str(bloque[i][0]).strip() if i < len(bloque) and bloque[i] else ""
+                    fila = filas[i]
+                    actual = str(fila[i_col]).strip() if len(fila) > i_col else ""
+                    if nuevo != actual:
+                        fila = list(fila) + [""] * max(0, i_col + 1 - len(fila))
+                        fila[i_col] = nuevo
+                        filas[i] = fila
+                        modificadas.append(i)
+            # La cola trae la versión vigente de sus columnas de estado
+            for j, fila in enumerate(cola[:ventana]):
+                i = n - ventana + j
+                if fila != filas[i]:
+                    filas[i] = fila
+                    modificadas.append(i)
+            filas.extend(cola[ventana:])
+            desde = n
+            estado["version"] += 1
+            estado["lecturas_incrementales"] += 1
+            estado["filas_descargadas"] += len(cola)
+
+        ventana = min(SHEETS_DELTA_VENTANA, len(estado["filas"]))
+        estado["firma_cola"] = _firma_cola(estado["filas"][len(estado["filas"]) - ventana:], indices_estado)
+        estado["sincronizada_en"] = time.time()
+        with _LOCK_REGISTRO:
+            _pestanas[clave] = estado
+        return {"filas": list(estado["filas"]), "version": estado["version"], "completa": recarga,
+                "desde": desde, "modificadas": sorted(set(modificadas))}
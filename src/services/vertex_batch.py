@@ -0,0 +1,377 @@
+# ====================================================================
+# --- BLOQUE 0: Imports ---
+# ====================================================================
+import os
+import sys
+import json
+import time
+import base64
+import asyncio
+import threading
+import streamlit as st
+from src.config.settings import (
+    VERTEX_LOTE_BACKEND, VERTEX_LOTE_MODELO, VERTEX_LOTE_REGION, VERTEX_LOTE_GCS_URI, VERTEX_LOTE_DIR,
+    VERTEX_LOTE_SONDEO_S, VERTEX_LOTE_SIMULADO_DEMORA_S
+)
+from src.services.cache_service import calcular_huella, guardar_cache_por_huella
+from src.services.vertex_service import (
+    SISTEMA_GUIA, INSTRUCCION_LLAMADA, CAMPOS_GUIA, VERSION_CACHE_GUIA, resolver_sin_modelo, extraccion_aceptada
+)
+from src.utils.pdf_utils import optimizar_payload_ocr, separar_guias_multipagina
+from src.utils.respuesta_utils import construir_esquema_guia
+from src.utils.gre_xml_utils import expandir_archivos_guia
+
+# ====================================================================
+# --- BLOQUE 1: Manifiesto del Lote en Disco ---
+# ====================================================================
+# Un lote sobrevive a reinicios de la app: el manifiesto guarda la referencia del job y qué filas cubre cada guía.
+# Estados: preparado -> enviado -> ok | fallo -> cargado
+ESTADOS_FINALES = ("fallo", "cargado")
+
+def _dir_lote(id_lote):
+    return os.path.join(VERTEX_LOTE_DIR, id_lote)
+
+def guardar_manifiesto(manifiesto):
+    ruta = os.path.join(_dir_lote(manifiesto["id"]), "manifiesto.json")
+    os.makedirs(os.path.dirname(ruta), exist_ok=True)
+    temporal = ruta + ".tmp"
+    with open(temporal, "w", encoding="utf-8") as f:
+        json.dump(manifiesto, f, ensure_ascii=False, indent=1)
+    os.replace(temporal, ruta)
+
+def leer_manifiesto(id_lote):
+    try:
+        with open(os.path.join(_dir_lote(id_lote), "manifiesto.json"), encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+def listar_lotes():
+    """Manifiestos del más reciente al más antiguo."""
+    if not os.path.isdir(VERTEX_LOTE_DIR): return []
+    lotes = [leer_manifiesto(d) for d in os.listdir(VERTEX_LOTE_DIR)]
+    return sorted([m for m in lotes if m], key=lambda m: m["creado"], reverse=True)
+
+# ====================================================================
+# --- BLOQUE 2: Petición por Guía (GenerateContentRequest en JSONL) ---
+# ====================================================================
+def peticion_guia(contenido, id_guia):
+    """Misma extracción que la llamada en línea: system_instruction fija, documento optimizado e instrucción corta."""
+    datos, mime, _ = optimizar_payload_ocr(contenido)
+    return {
+        "key": id_guia,
+        "request": {
+            "contents": [{"role": "user", "parts": [
+                {"inlineData": {"mimeType": mime, "data": base64.b64encode(datos).decode("ascii")}},
+                {"text": INSTRUCCION_LLAMADA},
+            ]}],
+            "systemInstruction": {"parts": [{"text": SISTEMA_GUIA}]},
+            "generationConfig": {"responseMimeType": "application/json", "responseSchema": construir_esquema_guia(CAMPOS_GUIA)},
+            # Las etiquetas vuelven en la salida: así se reconoce cada guía aunque el orden cambie
+            "labels": {"guia": id_guia},
+        },
+    }
+
+def _id_de_linea(linea):
+    return linea.get("key") or ((linea.get("request") or {}).get("labels") or {}).get("guia")
+
+def _texto_de_linea(linea):
+    for candidato in (linea.get("response") or {}).get("candidates", []):
+        texto = "".join(p.get("text", "") for p in (candidato.get("content") or {}).get("parts", []))
+        if texto: return texto
+    return ""
+
+# ====================================================================
+# --- BLOQUE 3: Backends (Vertex Batch Prediction y Sustituto Local) ---
+# ====================================================================
+class BackendLoteVertex:
+    """Sube el JSONL a Cloud Storage y lanza un BatchPredictionJob; la salida se lee del mismo bucket."""
+    nombre = "vertex"
+
+    def _bucket(self):
+        if not VERTEX_LOTE_GCS_URI.startswith("gs://"):
+            raise ValueError("VERTEX_LOTE_GCS_URI debe apuntar a un bucket (gs://bucket/prefijo)")
+        bucket, _, prefijo = VERTEX_LOTE_GCS_URI[5:].partition("/")
+        return bucket, prefijo.strip("/")
+
+    def _storage(self):
+        from google.cloud import storage
+        from src.services.vertex_client import PROJECT_ID, obtener_credenciales_vertex
+        return storage.Client(project=PROJECT_ID, credentials=obtener_credenciales_vertex())
+
+    def enviar(self, id_lote, ruta_entrada):
+        from vertexai.batch_prediction import BatchPredictionJob
+        from src.services.vertex_client import ejecutar_en_region
+        bucket, prefijo = self._bucket()
+        base = f"{prefijo}/{id_lote}" if prefijo else id_lote
+        self._storage().bucket(bucket).blob(f"{base}/entrada.jsonl").upload_from_filename(ruta_entrada)
+        job = ejecutar_en_region(VERTEX_LOTE_REGION, lambda: BatchPredictionJob.submit(
+            source_model=VERTEX_LOTE_MODELO,
+            input_dataset=f"gs://{bucket}/{base}/entrada.jsonl",
+            output_uri_prefix=f"gs://{bucket}/{base}/salida",
+        ))
+        return job.resource_name
+
+    def _job(self, referencia):
+        from vertexai.batch_prediction import BatchPredictionJob
+        from src.services.vertex_client import ejecutar_en_region
+        return ejecutar_en_region(VERTEX_LOTE_REGION, lambda: BatchPredictionJob(referencia))
+
+    def estado(self, referencia):
+        job = self._job(referencia)
+        if not job.has_ended: return "en_curso"
+        return "ok" if job.has_succeeded else "fallo"
+
+    def leer_salida(self, referencia):
+        salida = self._job(referencia).output_location
+        bucket, _, prefijo = salida[5:].partition("/")
+        for blob in self._storage().list_blobs(bucket, prefix=prefijo):
+            if not blob.name.endswith(".jsonl"): continue
+            for linea in blob.download_as_text().splitlines():
+                if linea.strip(): yield json.loads(linea)
+
+class BackendLoteSimulado:
+    """
+    Sustituto local sin GCP: el "job" corre en un hilo, responde cada petición con el modelo simulado
+    tras VERTEX_LOTE_SIMULADO_DEMORA_S y deja la salida en el directorio del lote con el formato de Vertex.
+    """
+    nombre = "simulado"
+    _hilos = {}
+
+    def _rutas(self, referencia):
+        return os.path.join(_dir_lote(referencia), "entrada.jsonl"), os.path.join(_dir_lote(referencia), "salida.jsonl")
+
+    def _ejecutar(self, referencia):
+        from src.services.vertex_simulado import ModeloSimulado, DocumentoSimulado
+        time.sleep(VERTEX_LOTE_SIMULADO_DEMORA_S)
+        entrada, salida = self._rutas(referencia)
+        with open(entrada, encoding="utf-8") as f_in, open(salida + ".tmp", "w", encoding="utf-8") as f_out:
+            for linea in f_in:
+                if not linea.strip(): continue
+                pedido = json.loads(linea)
+                req = pedido["request"]
+                partes = [p["text"] if "text" in p else DocumentoSimulado() for p in req["contents"][0]["parts"]]
+                sistema = "".join(p.get("text", "") for p in req.get("systemInstruction", {}).get("parts", []))
+                respuesta = asyncio.run(ModeloSimulado(VERTEX_LOTE_MODELO, sistema, escala=0).generate_content_async(partes))
+                uso = respuesta.usage_metadata
+                f_out.write(json.dumps({
+                    "key": pedido.get("key"),
+                    "request": {"labels": req.get("labels", {})},
+                    "response": {
+                        "candidates": [{"content": {"role": "model", "parts": [{"text": respuesta.text}]}}],
+                        "usageMetadata": {"promptTokenCount": uso.prompt_token_count, "candidatesTokenCount": uso.candidates_token_count},
+                    },
+                    "status": "",
+                }, ensure_ascii=False) + "\n")
+        os.replace(salida + ".tmp", salida)
+
+    def _lanzar(self, referencia):
+        hilo = threading.Thread(target=self._ejecutar, args=(referencia,), name=f"lote_simulado_{referencia}", daemon=True)
+        hilo.start()
+        self._hilos[referencia] = hilo
+
+    def enviar(self, id_lote, ruta_entrada):
+        self._lanzar(id_lote)
+        return id_lote
+
+    def estado(self, referencia):
+        if os.path.exists(self._rutas(referencia)[1]): return "ok"
+        hilo = self._hilos.get(referencia)
+        if hilo is None or not hilo.is_alive():
+            self._lanzar(referencia) # La app se reinició a mitad del job: se retoma
+        return "en_curso"
+
+    def leer_salida(self, referencia):
+        with open(self._rutas(referencia)[1], encoding="utf-8") as f:
+            for linea in f:
+                if linea.strip(): yield json.loads(linea)
+
+BACKENDS_LOTE = {"vertex": BackendLoteVertex, "simulado": BackendLoteSimulado}
+
+def obtener_backend_lote(nombre=None):
+    return BACKENDS_LOTE[nombre or VERTEX_LOTE_BACKEND]()
+
+# ====================================================================
+# --- BLOQUE 4: Preparar, Enviar, Sondear y Cargar en la Caché ---
+# ====================================================================
+def preparar_lote_pendientes(servicio_drive, servicio_sheets, al_avanzar=None):
+    """
+    Descarga las guías pendientes de Guias_recibidas y escribe el JSONL del lote.
+    Cada archivo se parte por guía (separar_guias_multipagina) antes de calcular la huella: petición y caché quedan
+    por guía, igual que en la lectura en línea del Repositorio Masivo, que parte el PDF antes de consultar la caché.
+    Las que ya están en caché o se leen localmente (XML / capa de texto) no entran al job.
+    Devuelve el manifiesto, o None si no hay nada que enviar a Gemini.
+    """
+    from src.services.google_service import listar_guias_pendientes, descargar_guias_drive
+
+    pendientes = listar_guias_pendientes(servicio_sheets)
+    id_lote = time.strftime("%Y%m%d-%H%M%S")
+    manifiesto = {
+        "id": id_lote, "creado": time.time(), "backend": VERTEX_LOTE_BACKEND, "modelo": VERTEX_LOTE_MODELO,
+        "version_cache": VERSION_CACHE_GUIA, "referencia": None, "estado": "preparado",
+        "filas": len(pendientes), "resueltas_local": 0, "sin_archivo": 0, "cargadas": 0, "rechazadas": 0, "guias": {},
+    }
+    os.makedirs(_dir_lote(id_lote), exist_ok=True)
+    ruta_entrada = os.path.join(_dir_lote(id_lote), "entrada.jsonl")
+
+    with open(ruta_entrada, "w", encoding="utf-8") as f:
+        for n, pendiente in enumerate(pendientes):
+            archivos = descargar_guias_drive(servicio_drive, [pendiente["nombre"]])
+            documentos = list(separar_guias_multipagina(expandir_archivos_guia(archivos[:1]))) if archivos else []
+            if not documentos:
+                manifiesto["sin_archivo"] += 1
+            for doc in documentos:
+                if "datos" in doc or resolver_sin_modelo(doc["contenido"]):
+                    manifiesto["resueltas_local"] += 1
+                    continue
+                huella = calcular_huella(doc["contenido"])
+                id_guia = huella[:32]
+                if id_guia not in manifiesto["guias"]:
+                    f.write(json.dumps(peticion_guia(doc["contenido"], id_guia)) + "\n")
+                    manifiesto["guias"][id_guia] = {"huella": huella, "filas": []}
+                if pendiente["fila"] not in manifiesto["guias"][id_guia]["filas"]:
+                    manifiesto["guias"][id_guia]["filas"].append(pendiente["fila"])
+            if al_avanzar:
+                al_avanzar(n + 1, len(pendientes))
+
+    if not manifiesto["guias"]:
+        print(f"Lote {id_lote}: nada que enviar ({manifiesto['resueltas_local']} resueltas sin Gemini)")
+        return None
+    guardar_manifiesto(manifiesto)
+    return manifiesto
+
+def enviar_lote(manifiesto):
+    backend = obtener_backend_lote(manifiesto["backend"])
+    manifiesto["referencia"] = backend.enviar(manifiesto["id"], os.path.join(_dir_lote(manifiesto["id"]), "entrada.jsonl"))
+    manifiesto["estado"] = "enviado"
+    manifiesto["enviado"] = time.time()
+    guardar_manifiesto(manifiesto)
+    print(f"Lote {manifiesto['id']} enviado ({len(manifiesto['guias'])} guías): {manifiesto['referencia']}")
+    return manifiesto
+
+def _cargar_resultados(manifiesto, backend):
+    """Cada respuesta aceptable entra a la caché de extracciones: el Repositorio Masivo la leerá sin llamar a Gemini."""
+    if manifiesto.get("version_cache") != VERSION_CACHE_GUIA:
+        print(f"Lote {manifiesto['id']}: el prompt cambió desde el envío, resultados descartados")
+        manifiesto["estado"] = "fallo"
+        return
+    for linea in backend.leer_salida(manifiesto["referencia"]):
+        guia = manifiesto["guias"].get(_id_de_linea(linea))
+        if guia is None: continue
+        datos = extraccion_aceptada(_texto_de_linea(linea))
+        if datos and guardar_cache_por_huella(guia["huella"], VERSION_CACHE_GUIA, datos):
+            manifiesto["cargadas"] += 1
+        else:
+            manifiesto["rechazadas"] += 1
+    # Las guías sin respuesta aceptable se procesan en línea como siempre cuando alguien las abra
+    manifiesto["estado"] = "cargado"
+
+def actualizar_lote(id_lote):
+    """Un sondeo: consulta el job y, si terminó bien, carga sus resultados en la caché. Devuelve el manifiesto."""
+    manifiesto = leer_manifiesto(id_lote)
+    if not manifiesto or manifiesto["estado"] in ESTADOS_FINALES or not manifiesto.get("referencia"):
+        return manifiesto
+    backend = obtener_backend_lote(manifiesto["backend"])
+    try:
+        estado = backend.estado(manifiesto["referencia"])
+    except Exception as e:
+        print(f"Error consultando lote {id_lote}: {e}")
+        return manifiesto
+    if estado == "ok":
+        _cargar_resultados(manifiesto, backend)
+        manifiesto["terminado"] = time.time()
+    elif estado == "fallo":
+        manifiesto["estado"] = "fallo"
+    guardar_manifiesto(manifiesto)
+    return manifiesto
+
+def esperar_lote(id_lote, sondeo_s=None, plazo_s=None):
+    """Sondea hasta que el lote termine (o venza plazo_s) y devuelve el manifiesto final."""
+    limite = None if plazo_s is None else time.time() + plazo_s
+    while True:
+        manifiesto = actualizar_lote(id_lote)
+        if not manifiesto or manifiesto["estado"] in ESTADOS_FINALES: return manifiesto
+        if limite is not None and time.time() >= limite: return manifiesto
+        time.sleep(sondeo_s or VERTEX_LOTE_SONDEO_S)
+
+# Preparar un lote descarga cada guía pendiente de Drive una por una: corre en un hilo propio del proceso
+# (como la cola de escritura) y el panel solo consulta su avance; la sesión de Streamlit no queda bloqueada.
+_LOCK_PREPARACION = threading.Lock()
+_preparacion = {"hilo": None, "hechos": 0, "total": 0, "manifiesto": None, "error": None, "terminado": None}
+
+def _avance_preparacion(hechos, total):
+    with _LOCK_PREPARACION:
+        _preparacion["hechos"], _preparacion["total"] = hechos, total
+
+def _preparar_y_enviar():
+    from src.services.google_service import obtener_servicios
+    manifiesto, error = None, None
+    try:
+        drv, sh = obtener_servicios()
+        manifiesto = preparar_lote_pendientes(drv, sh, al_avanzar=_avance_preparacion)
+        if manifiesto:
+            manifiesto = enviar_lote(manifiesto)
+    except Exception as e:
+        print(f"Error preparando el lote de pendientes: {e}")
+        error = str(e)
+    with _LOCK_PREPARACION:
+        _preparacion.update(manifiesto=manifiesto, error=error, terminado=time.time())
+
+def iniciar_lote_pendientes():
+    """Prepara y envía el lote de pendientes en segundo plano. False si ya hay una preparación en curso."""
+    with _LOCK_PREPARACION:
+        hilo = _preparacion["hilo"]
+        if hilo is not None and hilo.is_alive(): return False
+        _preparacion.update(hechos=0, total=0, manifiesto=None, error=None, terminado=None)
+        _preparacion["hilo"] = threading.Thread(target=_preparar_y_enviar, name="lote_vertex_preparacion", daemon=True)
+        _preparacion["hilo"].start()
+        return True
+
+def estado_preparacion():
+    """{en_curso, hechos, total, manifiesto, error, terminado} de la última preparación lanzada desde el panel."""
+    with _LOCK_PREPARACION:
+        hilo = _preparacion["hilo"]
+        return {"en_curso": hilo is not None and hilo.is_alive(), **{k: v for k, v in _preparacion.items() if k != "hilo"}}
+
+# ====================================================================
+# --- BLOQUE 5: Panel para Admin Tools ---
+# ====================================================================
+def render_lotes_vertex():
+    st.markdown("### 🌙 Extracción Nocturna (Vertex Batch)")
+    st.caption(f"Backend: {VERTEX_LOTE_BACKEND} · modelo {VERTEX_LOTE_MODELO}. Para cierres de mes: "
+               "`python -m src.services.vertex_batch` envía y espera sin la app abierta.")
+    preparacion = estado_preparacion()
+    if preparacion["en_curso"]:
+        hechos, total = preparacion["hechos"], preparacion["total"]
+        st.progress(hechos / total if total else 0.0)
+        st.caption(f"Preparando el lote en segundo plano: {hechos}/{total} guías descargadas de Drive.")
+        if st.button("Actualizar avance", use_container_width=True):
+            st.rerun()
+    else:
+        if st.button("Enviar pendientes de Guias_recibidas", use_container_width=True):
+            iniciar_lote_pendientes()
+            st.rerun()
+        if preparacion["error"]:
+            st.error(f"La preparación del lote falló: {preparacion['error']}")
+        elif preparacion["manifiesto"]:
+            st.success(f"Lote {preparacion['manifiesto']['id']} enviado: {len(preparacion['manifiesto']['guias'])} guías para Gemini.")
+        elif preparacion["terminado"]:
+            st.info("No hay guías pendientes que necesiten Gemini.")
+    for manifiesto in listar_lotes()[:5]:
+        c1, c2 = st.columns([3, 1])
+        c1.caption(f"{manifiesto['id']} · {manifiesto['estado']} · {len(manifiesto['guias'])} guías · "
+                   f"{manifiesto['cargadas']} en caché · {manifiesto['rechazadas']} rechazadas")
+        if manifiesto["estado"] not in ESTADOS_FINALES and c2.button("Actualizar", key=f"lote_{manifiesto['id']}"):
+            actualizar_lote(manifiesto["id"])
+            st.rerun()
+
+if __name__ == "__main__":
+    # python -m src.services.vertex_batch              -> prepara, envía y espera el lote de pendientes
+    # python -m src.services.vertex_batch <id_lote>    -> retoma la espera de un lote ya enviado
+    if len(sys.argv) > 1:
+        final = esperar_lote(sys.argv[1])
+    else:
+        from src.services.google_service import obtener_servicios
+        nuevo = preparar_lote_pendientes(*obtener_servicios())
+        final = esperar_lote(enviar_lote(nuevo)["id"]) if nuevo else None
+    print(json.dumps({k: v for k, v in (final or {}).items() if k != "guias"}, ensure_ascii=False))
@@ -0,0 +1,132 @@
+# ====================================================================
+# --- BLOQUE 0: Imports ---
+# ====================================================================
+import os
+import asyncio
+import threading
+import concurrent.futures
+import vertexai
+from vertexai.generative_models import GenerativeModel
+from google.oauth2 import service_account
+from google.auth.transport.requests import Request
+import streamlit as st
+from src.config.settings import VERTEX_BACKEND, VERTEX_GRABAR_DIR
+
+# ====================================================================
+# --- BLOQUE 1: Estado Global del Proceso (Compartido entre Sesiones) ---
+# ====================================================================
+PROJECT_ID = "sistemacertificados-485822"
+SCOPES_VERTEX = ["https://www.googleapis.com/auth/cloud-platform"]
+
+# RLock: obtener_modelo_vertex llama a obtener_credenciales_vertex con el candado tomado
+_LOCK_REGISTRO = threading.RLock()
+_registro = {"credenciales_cargadas": False, "credenciales": None}
+_modelos = {}
+_bucle = {"loop": None}
+
+# ====================================================================
+# --- BLOQUE 2: Credenciales (Se cargan una vez, se refrescan al expirar) ---
+# ====================================================================
+def _cargar_credenciales():
+    creds = None
+
+    # 1. Intentar cargar desde los Secrets de Streamlit (Nube)
+    if "google" in st.secrets:
+        try:
+            creds_info = dict(st.secrets["google"])
+            creds = service_account.Credentials.from_service_account_info(creds_info, scopes=SCOPES_VERTEX)
+        except Exception as e:
+            st.error(f"Error cargando credenciales desde st.secrets: {e}")
+
+    # 2. Si no hay secrets, intentar cargar desde archivo local (PC)
+    if not creds:
+        cred_path = next((p for p in ["secretoslocal.json", "secretos_local.json", "secretos.json"] if os.path.exists(p)), None)
+        if cred_path:
+            try:
+                creds = service_account.Credentials.from_service_account_file(cred_path, scopes=SCOPES_VERTEX)
+            except Exception as e:
+                st.error(f"Error cargando archivo {cred_path}: {e}")
+
+    # Sin credenciales explícitas Vertex usa las Application Default Credentials del entorno
+    return creds
+
+def obtener_credenciales_vertex():
+    """Devuelve las credenciales del proceso; solo pide un token nuevo cuando el vigente expiró."""
+    if VERTEX_BACKEND == "simulado": return None # Sin llamadas reales: no se leen secretos ni archivos de cuenta
+    with _LOCK_REGISTRO:
+        if not _registro["credenciales_cargadas"]:
+            _registro["credenciales"] = _cargar_credenciales()
+            _registro["credenciales_cargadas"] = True
+
+        creds = _registro["credenciales"]
+        if creds is not None and not creds.valid:
+            try:
+                creds.refresh(Request())
+            except Exception as e:
+                print(f"Error refrescando token de Vertex: {e}")
+        return creds
+
+# ====================================================================
+# --- BLOQUE 3: Registro de Modelos Inicializados por (Región, Modelo) ---
+# ====================================================================
+def obtener_modelo_vertex(region, nombre_modelo, instruccion_sistema=None):
+    """
+    Devuelve un GenerativeModel ya inicializado para la región pedida.
+    El modelo fija su región al construirse, por eso vertexai.init y la construcción van juntos bajo el candado.
+    Cada variante de prompt (instruccion_sistema) tiene su propio modelo: las reglas fijas viajan como prefijo estable.
+    """
+    clave = (region, nombre_modelo, instruccion_sistema)
+    with _LOCK_REGISTRO:
+        modelo = _modelos.get(clave)
+        if modelo is None:
+            if VERTEX_BACKEND == "simulado":
+                from src.services.vertex_simulado import ModeloSimulado
+                modelo = ModeloSimulado(nombre_modelo, system_instruction=instruccion_sistema)
+            else:
+                creds = obtener_credenciales_vertex()
+                vertexai.init(project=PROJECT_ID, location=region, credentials=creds)
+                modelo = GenerativeModel(nombre_modelo, system_instruction=instruccion_sistema)
+                if VERTEX_GRABAR_DIR:
+                    from src.services.vertex_simulado import ModeloGrabador
+                    modelo = ModeloGrabador(modelo, nombre_modelo)
+            _modelos[clave] = modelo
+        return modelo
+
+def ejecutar_en_region(region, funcion):
+    """Ejecuta funcion() con vertexai inicializado en la región (trabajos de lote); mismo candado que los modelos."""
+    with _LOCK_REGISTRO:
+        vertexai.init(project=PROJECT_ID, location=region, credentials=obtener_credenciales_vertex())
+        return funcion()
+
+def reiniciar_clientes_vertex():
+    """Olvida credenciales y modelos (se recargan en la siguiente llamada)."""
+    with _LOCK_REGISTRO:
+        _modelos.clear()
+        _registro["credenciales"] = None
+        _registro["credenciales_cargadas"] = False
+
+# ====================================================================
+# --- BLOQUE 4: Bucle asyncio del Proceso (Llamadas Cancelables) ---
+# ====================================================================
+def _obtener_bucle():
+    """Bucle de eventos en un hilo daemon; las llamadas async de Vertex se pueden cancelar de verdad."""
+    with _LOCK_REGISTRO:
+        if _bucle["loop"] is None or _bucle["loop"].is_closed():
+            loop = asyncio.new_event_loop()
+            threading.Thread(target=loop.run_forever, name="vertex_async", daemon=True).start()
+            _bucle["loop"] = loop
+        return _bucle["loop"]
+
+def ejecutar_en_bucle(coro, plazo_s):
+    """
+    Ejecuta la corrutina en el bucle del proceso y espera su resultado como máximo plazo_s.
+    Al vencer, la tarea se cancela (se corta la petición gRPC en curso) y se lanza TimeoutError.
+    """
+    futuro = asyncio.run_coroutine_threadsafe(coro, _obtener_bucle())
+    try:
+        return futuro.result(timeout=plazo_s)
+    except concurrent.futures.TimeoutError:
+        # En Python 3.11+ es el mismo TimeoutError que puede lanzar la corrutina: si ya terminó, se propaga tal cual
+        if futuro.done(): raise
+        futuro.cancel()
+        raise TimeoutError(f"DEADLINE_EXCEEDED: sin respuesta en {plazo_s:.0f}s")
@@ -0,0 +1,103 @@
+# ====================================================================
+# --- BLOQUE 0: Imports ---
+# ====================================================================
+import time
+import random
+import threading
+from contextlib import contextmanager
+from src.config.settings import (
+    VERTEX_CONCURRENCIA_INICIAL, VERTEX_CONCURRENCIA_MIN, VERTEX_CONCURRENCIA_MAX,
+    VERTEX_BACKOFF_BASE_S, VERTEX_BACKOFF_MAX_S
+)
+
+# ====================================================================
+# --- BLOQUE 1: Control de Concurrencia Adaptativo (AIMD, Proceso Completo) ---
+# ====================================================================
+# Todas las sesiones de Streamlit comparten la cuota de Vertex del proyecto, así que comparten también este límite
+_COND_CUOTA = threading.Condition()
+_estado = {
+    "limite": float(VERTEX_CONCURRENCIA_INICIAL),
+    "en_vuelo": 0,
+    "ultimo_recorte": 0.0,
+    "exitos": 0,
+    "rechazos_cuota": 0,
+}
+
+REDUCCION_MULTIPLICATIVA = 0.5
+VENTANA_RECORTE_S = 2.0 # Varios 429 simultáneos cuentan como una sola señal de congestión
+
+def es_error_cuota(err_msg):
+    t = str(err_msg).upper()
+    return "429" in t or "RESOURCE_EXHAUSTED" in t or "RESOURCE EXHAUSTED" in t or "QUOTA EXCEEDED" in t
+
+def _registrar_resultado(resultado):
+    """exito: +1/límite (≈ +1 por ronda completa); cuota: límite × 0.5 como mucho una vez por ventana."""
+    if resultado == "exito":
+        _estado["exitos"] += 1
+        _estado["limite"] = min(float(VERTEX_CONCURRENCIA_MAX), _estado["limite"] + 1.0 / _estado["limite"])
+    elif resultado == "cuota":
+        _estado["rechazos_cuota"] += 1
+        ahora = time.time()
+        if ahora - _estado["ultimo_recorte"] >= VENTANA_RECORTE_S:
+            _estado["limite"] = max(float(VERTEX_CONCURRENCIA_MIN), _estado["limite"] * REDUCCION_MULTIPLICATIVA)
+            _estado["ultimo_recorte"] = ahora
+            print(f"Cuota Vertex (429): concurrencia reducida a {int(_estado['limite'])}")
+
+def adquirir_cupo(plazo_s=None):
+    """Espera un cupo de llamada en vuelo; False si vence plazo_s sin conseguirlo."""
+    limite_t = None if plazo_s is None else time.time() + plazo_s
+    with _COND_CUOTA:
+        while _estado["en_vuelo"] >= int(_estado["limite"]):
+            restante = None if limite_t is None else limite_t - time.time()
+            if restante is not None and restante <= 0:
+                return False
+            _COND_CUOTA.wait(timeout=restante)
+        _estado["en_vuelo"] += 1
+        return True
+
+def intentar_cupo():
+    """Cupo sin esperar (peticiones de cobertura: si no hay cupo, no se lanzan)."""
+    with _COND_CUOTA:
+        if _estado["en_vuelo"] >= int(_estado["limite"]):
+            return False
+        _estado["en_vuelo"] += 1
+        return True
+
+def liberar_cupo(resultado=None):
+    """resultado: 'exito', 'cuota' o None (error ajeno a la cuota, no mueve el límite)."""
+    with _COND_CUOTA:
+        _estado["en_vuelo"] = max(0, _estado["en_vuelo"] - 1)
+        _registrar_resultado(resultado)
+        _COND_CUOTA.notify_all()
+
+@contextmanager
+def cupo_vertex(plazo_s=None):
+    """Reserva un cupo durante la llamada; clasifica el desenlace para el AIMD."""
+    if not adquirir_cupo(plazo_s):
+        raise TimeoutError("DEADLINE_EXCEEDED: sin cupo de concurrencia Vertex")
+    resultado = None
+    try:
+        yield
+        resultado = "exito"
+    except Exception as e:
+        resultado = "cuota" if es_error_cuota(e) else None
+        raise
+    finally:
+        liberar_cupo(resultado)
+
+# ====================================================================
+# --- BLOQUE 2: Reintento con Backoff Exponencial y Jitter ---
+# ====================================================================
+def espera_reintento(intento):
+    """Full jitter: aleatorio entre 0 y base·2^intento (acotado), así las sesiones no reintentan a la vez."""
+    return random.uniform(0, min(VERTEX_BACKOFF_MAX_S, VERTEX_BACKOFF_BASE_S * (2 ** intento)))
+
+def estado_concurrencia():
+    """Instantánea para el panel de administración."""
+    with _COND_CUOTA:
+        return {
+            "limite": int(_estado["limite"]),
+            "en_vuelo": _estado["en_vuelo"],
+            "exitos": _estado["exitos"],
+            "rechazos_cuota": _estado["rechazos_cuota"],
+        }
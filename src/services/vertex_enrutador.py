@@ -0,0 +1,45 @@
+# ====================================================================
+# --- BLOQUE 0: Imports ---
+# ====================================================================
+from src.config.settings import (
+    VERTEX_MODELOS_LIGEROS, OCR_TRIVIAL_MAX_PAGINAS, OCR_TRIVIAL_MAX_BYTES,
+    OCR_DIFICIL_MIN_PAGINAS, OCR_DIFICIL_MIN_BYTES
+)
+
+# ====================================================================
+# --- BLOQUE 1: Complejidad Estimada del Documento ---
+# ====================================================================
+COMPLEJIDAD_TRIVIAL = "trivial"
+COMPLEJIDAD_NORMAL = "normal"
+COMPLEJIDAD_DIFICIL = "dificil"
+
+def estimar_complejidad(perfil):
+    """
+    (complejidad, motivo) a partir de perfil_documento: páginas, bytes, capa de texto y proporción de imagen.
+    Los umbrales viven en settings (OCR_TRIVIAL_* / OCR_DIFICIL_*) y se ajustan con el resumen de enrutamiento.
+    """
+    escaneado = perfil["paginas_con_texto"] == 0 and perfil["proporcion_imagen"] >= 0.5
+    if perfil["paginas"] >= OCR_DIFICIL_MIN_PAGINAS:
+        return COMPLEJIDAD_DIFICIL, f"{perfil['paginas']} páginas"
+    if escaneado and perfil["bytes"] >= OCR_DIFICIL_MIN_BYTES:
+        return COMPLEJIDAD_DIFICIL, f"escaneo de {perfil['bytes'] // 1024} KB"
+    if perfil["paginas"] <= OCR_TRIVIAL_MAX_PAGINAS and perfil["bytes"] <= OCR_TRIVIAL_MAX_BYTES and not escaneado:
+        return COMPLEJIDAD_TRIVIAL, f"{perfil['paginas']} página(s) de {perfil['bytes'] // 1024} KB sin escaneo"
+    return COMPLEJIDAD_NORMAL, f"{perfil['paginas']} página(s), {perfil['bytes'] // 1024} KB" + (", escaneo" if escaneado else "")
+
+# ====================================================================
+# --- BLOQUE 2: Niveles de Modelos por Complejidad ---
+# ====================================================================
+def niveles_modelos(complejidad, modelos_flash, modelos_pro):
+    """
+    Niveles para ordenar_rutas: trivial empieza por el modelo ligero, difícil va directo a pro
+    (sin fallar antes en flash) y normal mantiene flash -> pro. Los niveles siguientes son el respaldo.
+    El modelo ligero queda reservado a los triviales: si no, el registro de salud lo preferiría por ser el más rápido.
+    """
+    ligeros = [m for m in VERTEX_MODELOS_LIGEROS if m not in modelos_pro]
+    flash = [m for m in modelos_flash if m not in ligeros]
+    if complejidad == COMPLEJIDAD_TRIVIAL and ligeros:
+        return [ligeros, flash, modelos_pro]
+    if complejidad == COMPLEJIDAD_DIFICIL:
+        return [modelos_pro, flash]
+    return [flash, modelos_pro]
@@ -0,0 +1,124 @@
+# ====================================================================
+# --- BLOQUE 0: Imports ---
+# ====================================================================
+import time
+import threading
+from collections import deque
+from src.config.settings import VERTEX_FALLOS_PARA_ABRIR, VERTEX_ENFRIAMIENTO_S, VERTEX_ENFRIAMIENTO_404_S
+
+# ====================================================================
+# --- BLOQUE 1: Registro de Salud Compartido (Proceso Completo) ---
+# ====================================================================
+# Estado por ruta (región, modelo) y por región; lo comparten todas las sesiones de Streamlit del proceso
+_LOCK_SALUD = threading.Lock()
+_rutas = {}
+_regiones = {}
+_ultima_ruta_exitosa = {"ruta": None}
+
+ALFA_LATENCIA = 0.3 # Peso de la última medición en la media móvil exponencial
+MUESTRAS_LATENCIA = 50 # Ventana de latencias por ruta para percentiles (cobertura de cola)
+MIN_MUESTRAS_P95 = 5
+_muestras = {}
+
+def _estado(tabla, clave):
+    if clave not in tabla:
+        tabla[clave] = {"fallos": 0, "abierto_hasta": 0.0, "latencia": None, "exitos": 0}
+    return tabla[clave]
+
+def _es_error_de_region(err_msg):
+    """Timeouts y caídas de servicio afectan a toda la región, no solo a un modelo."""
+    t = err_msg.upper()
+    return any(k in t for k in ["DEADLINE", "TIMEOUT", "TIMED OUT", "503", "UNAVAILABLE", "CONNECTION"])
+
+# ====================================================================
+# --- BLOQUE 2: Registro de Resultados (Éxitos y Fallos) ---
+# ====================================================================
+def registrar_exito_ruta(region, modelo, latencia_s):
+    with _LOCK_SALUD:
+        for est in (_estado(_rutas, (region, modelo)), _estado(_regiones, region)):
+            est["fallos"] = 0
+            est["abierto_hasta"] = 0.0
+            est["exitos"] += 1
+        est_ruta = _rutas[(region, modelo)]
+        if est_ruta["latencia"] is None:
+            est_ruta["latencia"] = latencia_s
+        else:
+            est_ruta["latencia"] = ALFA_LATENCIA * latencia_s + (1 - ALFA_LATENCIA) * est_ruta["latencia"]
+        _muestras.setdefault((region, modelo), deque(maxlen=MUESTRAS_LATENCIA)).append(latencia_s)
+        _ultima_ruta_exitosa["ruta"] = (region, modelo)
+
+def registrar_fallo_ruta(region, modelo, err_msg):
+    """Un 404 abre el circuito de inmediato (modelo retirado); el resto lo abre tras fallos consecutivos."""
+    ahora = time.time()
+    with _LOCK_SALUD:
+        est_ruta = _estado(_rutas, (region, modelo))
+        est_ruta["fallos"] += 1
+        if "404" in err_msg:
+            est_ruta["abierto_hasta"] = ahora + VERTEX_ENFRIAMIENTO_404_S
+        elif est_ruta["fallos"] >= VERTEX_FALLOS_PARA_ABRIR:
+            est_ruta["abierto_hasta"] = ahora + VERTEX_ENFRIAMIENTO_S
+
+        if _es_error_de_region(err_msg):
+            est_region = _estado(_regiones, region)
+            est_region["fallos"] += 1
+            if est_region["fallos"] >= VERTEX_FALLOS_PARA_ABRIR:
+                est_region["abierto_hasta"] = ahora + VERTEX_ENFRIAMIENTO_S
+
+        if _ultima_ruta_exitosa["ruta"] == (region, modelo):
+            _ultima_ruta_exitosa["ruta"] = None
+
+# ====================================================================
+# --- BLOQUE 3: Orden de Rutas (Sana y Rápida > Última Exitosa > Resto) ---
+# ====================================================================
+def ordenar_rutas(regiones, niveles_modelos):
+    """
+    Devuelve la lista de (región, modelo) a intentar.
+    - Dentro de cada nivel (flash antes que pro) va primero la última ruta exitosa, luego las rutas sin fallos
+      recientes antes que las que vienen fallando.
+    - Entre las demás, las medidas por latencia ascendente y al final las no medidas en su orden original.
+    - Las rutas con circuito abierto se omiten; si todas lo están se prueban en orden de reapertura (half-open).
+    """
+    ahora = time.time()
+    rutas = []
+    for nivel, modelos in enumerate(niveles_modelos):
+        for region in regiones:
+            for modelo in modelos:
+                rutas.append((nivel, region, modelo))
+
+    with _LOCK_SALUD:
+        def abierto_hasta(region, modelo):
+            return max(_rutas.get((region, modelo), {}).get("abierto_hasta", 0.0),
+                       _regiones.get(region, {}).get("abierto_hasta", 0.0))
+
+        sanas = [r for r in rutas if abierto_hasta(r[1], r[2]) <= ahora]
+        if not sanas:
+            return [(reg, mod) for _, reg, mod in sorted(rutas, key=lambda r: abierto_hasta(r[1], r[2]))]
+
+        ultima = _ultima_ruta_exitosa["ruta"]
+
+        def clave(item):
+            idx, (nivel, region, modelo) = item
+            est = _rutas.get((region, modelo), {})
+            latencia = est.get("latencia")
+            return (
+                nivel,
+                0 if (region, modelo) == ultima else 1,
+                1 if est.get("fallos", 0) > 0 else 0,
+                0 if latencia is not None else 1,
+                latencia or 0.0,
+                idx
+            )
+
+        ordenadas = sorted(enumerate(sanas), key=clave)
+        return [(region, modelo) for _, (_, region, modelo) in ordenadas]
+
+def latencia_p95(region, modelo):
+    """p95 observado de la ruta (segundos) o None si aún no hay muestras suficientes."""
+    with _LOCK_SALUD:
+        muestras = sorted(_muestras.get((region, modelo), ()))
+    if len(muestras) < MIN_MUESTRAS_P95: return None
+    return muestras[min(len(muestras) - 1, int(0.95 * len(muestras)))]
+
+def obtener_ultima_ruta_exitosa():
+    with _LOCK_SALUD:
+        return _ultima_ruta_exitosa["ruta"]
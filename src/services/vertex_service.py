@@ -1,134 +1,497 @@
 # ====================================================================
 # --- BLOQUE 0: Imports ---
 # ====================================================================
-import vertexai
-from vertexai.generative_models import GenerativeModel, Part, GenerationConfig
-from google.oauth2 import service_account
-import os
+from vertexai.generative_models import Part, GenerationConfig
 import json
+import asyncio
+import hashlib
+import time
+import threading
 import streamlit as st
 import warnings
+from concurrent.futures import wait, FIRST_COMPLETED
+from src.config.settings import (
+    VERTEX_REGIONES,
+    OCR_EMPAQUETAR, OCR_EMPAQUE_MAX_DOCS, OCR_EMPAQUE_MAX_BYTES, OCR_EMPAQUE_DOC_MAX_BYTES,
+    OCR_ESCALAR_CAMPOS, VERTEX_PLAZO_LLAMADA_S, OCR_PLAZO_LOTE_S, VERTEX_COBERTURA,
+    VERTEX_REINTENTOS_CUOTA, VERTEX_INSTRUCCION_SISTEMA, OCR_ENRUTAR_COMPLEJIDAD, OCR_VENTANA_DOCUMENTOS
+)
+from src.services.planificador_ocr import enviar_trabajo_ocr, estado_planificador, CARRIL_INTERACTIVO
+from src.services.cache_service import leer_cache_extraccion, guardar_cache_extraccion
+from src.services.metricas_service import registrar_llamada, registrar_enrutamiento, tokens_de_respuesta, clasificar_resultado
+from src.services.vertex_client import PROJECT_ID, obtener_credenciales_vertex, obtener_modelo_vertex, ejecutar_en_bucle
+from src.services.vertex_enrutador import estimar_complejidad, niveles_modelos, COMPLEJIDAD_NORMAL
+from src.services.vertex_cuota import cupo_vertex, intentar_cupo, liberar_cupo, es_error_cuota, espera_reintento
+from src.services.vertex_health import (
+    ordenar_rutas, registrar_exito_ruta, registrar_fallo_ruta, obtener_ultima_ruta_exitosa, latencia_p95
+)
+from src.utils.pdf_utils import analizar_pdf, extraer_texto_pdf, optimizar_payload_ocr, perfil_documento
+from src.utils.gre_utils import extraer_guia_desde_texto
+from src.utils.gre_xml_utils import es_xml, extraer_guia_desde_xml
+from src.utils.validacion_utils import campos_invalidos_guia, REGLAS_CAMPO, CAMPOS_OBLIGATORIOS_GUIA, VERSION_VALIDADORES
+from src.utils.respuesta_utils import (
+    construir_esquema_guia, instrucciones_claves_compactas, interpretar_respuesta_guia, interpretar_respuesta_lote,
+    VERSION_NORMALIZACION
+)
 
 # Suprimir explicitamente warnings de deprecación de Vertex AI para evitar KeyError: 'src' en Streamlit
 warnings.filterwarnings("ignore", category=UserWarning, module="vertexai")
 
 # ====================================================================
-# --- BLOQUE 1: Función Principal y Variables Estáticas ---
+# --- BLOQUE 1: Prompts del Generative Engine (Strict Extraction V4) ---
 # ====================================================================
-def procesar_guia_ia_vertex(pdf_bytes):
+PROMPT_ENCABEZADO = """
+    INSTRUCCIÓN DE SISTEMA: Eres un extractor de datos OCR estricto. Tu única tarea es extraer datos del PDF adjunto y devolverlos ÚNICAMENTE en formato JSON válido. Tienes PROHIBIDO inventar datos, alucinar información o incluir texto fuera del JSON (como ```json o explicaciones).
+    
+    ESTRUCTURA JSON EXACTA Y REGLAS DE NEGOCIO OBLIGATORIAS:
+"""
+
+# Descripción de cada campo que se le pide al modelo (superconjunto de todos los consumidores, en orden de salida)
+DESCRIPCION_CAMPOS = {
+    "cliente": "Razón Social exacta del REMITENTE. Regla Estricta: NO extraer la empresa de transportes, NO extraer nombres de conductores.",
+    "ruc_cliente": "Número de RUC del Remitente o Cliente Emisor.",
+    "fecha": "dd/mm/yyyy",
+    "serie": "Serie-Numero completo de la guía. Ejemplo: T001-000000",
+    "vehiculo": "PLACA del vehículo. Busca en todo el documento. Obligatorio.",
+    "punto_partida": "REGLA DE ORO OBLIGATORIA: Lee primero el bloque 'Observaciones' u 'Observación' de la guía. Todo dato como 'Fundo Casuarinas', 'Planta...', u otro predio que aparezca ahí TIENE QUE SER EXTRAÍDO SÍ O SÍ. Concatena la dirección base de partida con ese dato usando un guion. Ejemplo de Salida Exacta: 'Direccion Base - Fundo Casuarinas' o 'Av Sur - PLANTA EMPACADORA'. Si dice textualmente 'Fundo Casuarinas', debe salir 'Fundo Casuarinas'. NUNCA dejes fuera la información de 'Observaciones'. Si este campo está vacío entonces devuelve solo la dirección de partida base. NUNCA deduzcas ni inventes basándote en la empresa.",
+    "punto_llegada": "Dirección Completa exacta de Llegada. IMPORTANTE: Si en el documento (especialmente para la empresa Los Olivos de Villacuri) el destino o planta se indica simplemente como 'EMPACADORA', debes extraer la palabra 'EMPACADORA' y asignarla obligatoriamente a este campo. No lo dejes vacío.",
+    "destinatario": "Razón Social Completa del Destinatario",
+    "documentos_relacionados": "Si la guía contiene la frase exacta 'Documentos Relacionados:' seguida de información (ej: 'Documentos Relacionados: Guía de Remisión Remitente N° EG07 - 00001221 - RUC N° 20176770474'), extráela completa aquí incluyendo la frase inicial. De lo contrario, déjalo vacío.",
+    "items": [{
+        "desc": "Descripción literal del bien",
+        "cant": "Número",
+        "um": "Unidad de medida (KG, UNID, GLN)",
+        "peso": "Peso numérico explícito (o 0.00 si no existe)",
+    }],
+}
+
+# Registro de conjuntos de campos por consumidor: la guía se lee UNA vez (superconjunto) y cada módulo ve su vista
+CONJUNTOS_CAMPOS = {
+    "certificados": list(CAMPOS_OBLIGATORIOS_GUIA),
+    "sigersol": CAMPOS_OBLIGATORIOS_GUIA[:-1] + ["documentos_relacionados", "items"],
+}
+CAMPOS_GUIA = [c for c in DESCRIPCION_CAMPOS if any(c in campos for campos in CONJUNTOS_CAMPOS.values())]
+
+def construir_prompt_extraccion(campos):
+    """ESTRUCTURA JSON del prompt generada desde DESCRIPCION_CAMPOS para los campos pedidos."""
+    lineas = ",\n".join(
+        f'        "{c}": ' + json.dumps(DESCRIPCION_CAMPOS[c], ensure_ascii=False, indent=4).replace("\n", "\n        ")
+        for c in campos
+    )
+    return PROMPT_ENCABEZADO + "    {\n" + lineas + "\n    }\n    "
+
+def vista_campos(datos, conjunto):
+    """Copia de la extracción completa sin los campos del superconjunto que el consumidor no pidió."""
+    if not datos: return datos
+    campos = CONJUNTOS_CAMPOS[conjunto]
+    return {k: v for k, v in datos.items() if k in campos or k not in CAMPOS_GUIA}
+
+PROMPT_GUIA = construir_prompt_extraccion(CAMPOS_GUIA)
+
+# Versión de caché: cambiar el prompt, el response_schema compacto, la normalización o los validadores
+# (y sus reglas) invalida las extracciones guardadas
+VERSION_CACHE_GUIA = "guia-" + hashlib.sha256(json.dumps(
+    [PROMPT_GUIA, construir_esquema_guia(CAMPOS_GUIA), VERSION_NORMALIZACION, VERSION_VALIDADORES, REGLAS_CAMPO],
+    sort_keys=True, ensure_ascii=False
+).encode("utf-8")).hexdigest()[:12]
+
+# Modo lote: varias guías en una sola llamada; la respuesta es un arreglo con el índice de cada documento
+PROMPT_LOTE_GUIA = PROMPT_GUIA + """
+    MODO LOTE: Recibirás VARIOS documentos, cada uno precedido por la etiqueta 'DOCUMENTO <indice>'.
+    Devuelve ÚNICAMENTE un arreglo JSON con un objeto por documento, cada uno con la ESTRUCTURA anterior
+    más la clave "ix" (número entero de su etiqueta). No mezcles datos entre documentos ni omitas ninguno.
     """
-    Procesamiento Ultra-Resiliente con descubrimiento de modelos y multi-región.
+
+# Re-consulta dirigida: solo los campos que no pasaron los validadores locales
+PROMPT_REVISION_CAMPOS = """
+    REVISIÓN DE CAMPOS: Una lectura previa de este documento dejó los siguientes campos vacíos o con un valor
+    que no cumple su regla. Vuelve a leer el documento y devuelve ÚNICAMENTE estos campos, respetando las reglas de la ESTRUCTURA:
+{detalle}
     """
-    PROJECT_ID = "sistemacertificados-485822"
-    
-    # ====================================================================
-    # --- BLOQUE 2: Carga de Credenciales Inteligente (Nube o Local) ---
-    # ====================================================================
-    creds = None
-    
-    # 1. Intentar cargar desde los Secrets de Streamlit (Nube)
-    if "google" in st.secrets:
+
+# ====================================================================
+# --- BLOQUE 1.1: Regiones, Modelos y Llamada Única al Modelo ---
+# ====================================================================
+REGIONES_VERTEX = VERTEX_REGIONES
+MODELOS_FLASH = ["gemini-2.0-flash-001", "gemini-2.5-flash", "gemini-1.5-flash-002", "gemini-1.5-flash-8b"]
+MODELOS_PRO = ["gemini-2.5-pro", "gemini-3.1-pro-preview", "gemini-1.5-pro-002"]
+
+CONFIG_JSON = GenerationConfig(response_mime_type="application/json")
+CONFIG_GUIA = GenerationConfig(
+    response_mime_type="application/json", response_schema=construir_esquema_guia(CAMPOS_GUIA)
+)
+CONFIG_LOTE_GUIA = GenerationConfig(
+    response_mime_type="application/json", response_schema=construir_esquema_guia(CAMPOS_GUIA, lote=True)
+)
+
+# Traducción de las claves compactas del esquema a los campos descritos en el prompt
+CLAVES_GUIA = instrucciones_claves_compactas(CAMPOS_GUIA)
+
+# Reglas fijas (Strict Extraction V4 + claves compactas) como system_instruction: se envían como prefijo estable
+# del modelo y cada llamada solo lleva el documento y una instrucción corta
+SISTEMA_GUIA = PROMPT_GUIA + CLAVES_GUIA
+SISTEMA_LOTE_GUIA = PROMPT_LOTE_GUIA + CLAVES_GUIA
+INSTRUCCION_LLAMADA = "Extrae la guía del documento adjunto según la instrucción de sistema."
+INSTRUCCION_LLAMADA_LOTE = "Extrae cada DOCUMENTO adjunto según la instrucción de sistema (modo lote)."
+
+def armar_peticion(sistema, partes_documento, instruccion, separar=None):
+    """
+    (system_instruction, partes) de una llamada. Con VERTEX_INSTRUCCION_SISTEMA las reglas fijas van
+    en el modelo y aquí solo viaja la instrucción corta; si no, el prompt completo se anexa al final como antes.
+    """
+    separar = VERTEX_INSTRUCCION_SISTEMA if separar is None else separar
+    if separar:
+        return sistema, list(partes_documento) + [instruccion]
+    return None, list(partes_documento) + [sistema + "\n    " + instruccion]
+
+class PlazoAgotado(TimeoutError):
+    """El plazo del lote ya venció: no se inician más llamadas a Gemini."""
+
+class RespuestaNoAceptada(ValueError):
+    """La ruta respondió, pero con un JSON ilegible, bloqueado o sin los campos mínimos."""
+
+# Límite absoluto (time.time()) del lote que está procesando el hilo actual
+_plazo_hilo = threading.local()
+
+def _plazo_llamada():
+    """Segundos disponibles para la próxima llamada: el plazo por llamada acotado por lo que le queda al lote."""
+    plazo = VERTEX_PLAZO_LLAMADA_S
+    limite = getattr(_plazo_hilo, "limite", None)
+    if limite is not None:
+        restante = limite - time.time()
+        if restante <= 0:
+            raise PlazoAgotado("Plazo del lote agotado")
+        plazo = min(plazo, restante)
+    return plazo
+
+# Guía y etapa que está procesando el hilo actual, para atribuir cada llamada en las métricas
+_guia_hilo = threading.local()
+
+def _marcar_guia(pdf_bytes, etapa, guias=1, guia=None):
+    """Etiqueta las próximas llamadas del hilo; el contador de intentos se reinicia con cada guía."""
+    guia = guia or hashlib.sha256(pdf_bytes).hexdigest()[:16]
+    previa = getattr(_guia_hilo, "etiqueta", None)
+    contador = previa["contador"] if previa and previa["guia"] == guia else [0]
+    _guia_hilo.etiqueta = {"guia": guia, "etapa": etapa, "guias": guias, "contador": contador}
+
+def _etiqueta_actual():
+    return getattr(_guia_hilo, "etiqueta", None) or {"guia": None, "etapa": "sin_guia", "guias": 1, "contador": [0]}
+
+def _registrar_etapa_local(pdf_bytes, resultado, t0):
+    """Tiempo de las etapas sin modelo (caché, XML / capa de texto) para comparar contra Vertex."""
+    registrar_llamada(hashlib.sha256(pdf_bytes).hexdigest()[:16], "local", "", "local", 0, time.time() - t0, resultado)
+
+async def _llamada_async(ruta, partes, config, etiqueta=None, sistema=None):
+    region, m_name = ruta
+    etiqueta = etiqueta or _etiqueta_actual()
+    etiqueta["contador"][0] += 1
+    intento = etiqueta["contador"][0]
+
+    def _medir(resultado, response=None):
+        t_in, t_out, t_cache = tokens_de_respuesta(response) if response is not None else (0, 0, 0)
+        registrar_llamada(etiqueta["guia"], etiqueta["etapa"], region, m_name, intento, time.time() - t0,
+                          resultado, t_in, t_out, etiqueta["guias"], t_cache)
+
+    model = obtener_modelo_vertex(region, m_name, sistema)
+    t0 = time.time()
+    try:
+        response = await model.generate_content_async(partes, generation_config=config)
+    except asyncio.CancelledError:
+        _medir("cancelada")
+        raise # Perdedora de la cobertura o plazo vencido: lo registra _carrera_rutas
+    except Exception as e:
+        _medir(clasificar_resultado(e))
+        # Un 429 es congestión de cuota, no avería de la ruta: lo gestiona el AIMD, no el cortacircuitos
+        if not es_error_cuota(e):
+            registrar_fallo_ruta(region, m_name, str(e))
+        raise
+    registrar_exito_ruta(region, m_name, time.time() - t0)
+    _medir("ok", response)
+    return response
+
+async def _carrera_rutas(rutas, partes, config, plazo_s, espera_cobertura, etiqueta=None, sistema=None, validar=None):
+    """
+    Lanza la petición en rutas[0]; si no respondió tras espera_cobertura (su p95), lanza la misma
+    petición en rutas[1] y se queda con la primera respuesta válida. Al vencer plazo_s se cancela todo.
+    Con validar(response), una respuesta que no lo pasa no gana la carrera: se sigue esperando a la otra ruta.
+    """
+    loop = asyncio.get_running_loop()
+    inicio = loop.time()
+    tareas = {asyncio.ensure_future(_llamada_async(rutas[0], partes, config, etiqueta, sistema)): rutas[0]}
+    pendientes = set(tareas)
+    cubierta = espera_cobertura is None or len(rutas) < 2
+    ultimo_error = None
+
+    try:
+        while pendientes:
+            transcurrido = loop.time() - inicio
+            restante = plazo_s - transcurrido
+            if restante <= 0: break
+            espera = restante if cubierta else min(restante, max(0.0, espera_cobertura - transcurrido))
+            hechas, pendientes = await asyncio.wait(pendientes, timeout=espera, return_when=asyncio.FIRST_COMPLETED)
+
+            for t in hechas:
+                if t.exception() is not None:
+                    ultimo_error = t.exception()
+                elif validar is None or validar(t.result()):
+                    return tareas[t], t.result()
+                else:
+                    ultimo_error = RespuestaNoAceptada(f"{tareas[t][0]}/{tareas[t][1]}: respuesta sin datos de guía")
+
+            if not hechas and not cubierta:
+                # La principal superó su p95: misma petición a la siguiente ruta sana (solo si el AIMD deja cupo)
+                cubierta = True
+                if intentar_cupo():
+                    t = asyncio.ensure_future(_llamada_async(rutas[1], partes, config, etiqueta, sistema))
+                    t.add_done_callback(_liberar_cupo_cobertura)
+                    tareas[t] = rutas[1]
+                    pendientes.add(t)
+
+        if ultimo_error is not None and not pendientes:
+            raise ultimo_error
+        for t in pendientes:
+            t.cancel()
+            registrar_fallo_ruta(*tareas[t], f"DEADLINE_EXCEEDED: sin respuesta en {plazo_s:.0f}s")
+        raise TimeoutError(f"DEADLINE_EXCEEDED: sin respuesta en {plazo_s:.0f}s")
+    finally:
+        # Salida por respuesta, error, plazo o cancelación externa (wait_for): ninguna llamada queda viva en el loop
+        for t in tareas:
+            if not t.done():
+                t.cancel()
+            elif not t.cancelled():
+                t.exception() # Marca el error de la perdedora como recuperado (sin aviso "never retrieved")
+
+def _liberar_cupo_cobertura(tarea):
+    if tarea.cancelled():
+        liberar_cupo(None)
+    elif tarea.exception() is not None:
+        liberar_cupo("cuota" if es_error_cuota(tarea.exception()) else None)
+    else:
+        liberar_cupo("exito")
+
+def _generar_con_cobertura(ruta, respaldo, partes, config=CONFIG_JSON, sistema=None, validar=None):
+    """
+    Única puerta hacia Gemini: reutiliza el modelo del registro, solo refresca el token si expiró,
+    corta la llamada al vencer su plazo y, si hay respaldo y p95 medido, cubre la cola con una segunda ruta.
+    Cada llamada ocupa un cupo del control AIMD; ante 429 / RESOURCE_EXHAUSTED se reintenta la MISMA ruta
+    con backoff exponencial y jitter en vez de quemar el resto de la lista de fallbacks.
+    sistema es la system_instruction del modelo (ver armar_peticion); validar, el filtro de respuestas de la carrera.
+    Devuelve ((región, modelo) que respondió, response).
+    """
+    obtener_credenciales_vertex()
+    for intento in range(VERTEX_REINTENTOS_CUOTA + 1):
+        plazo = _plazo_llamada()
+        espera = latencia_p95(*ruta) if (VERTEX_COBERTURA and respaldo) else None
+        if espera is not None and espera >= plazo: espera = None
+        rutas = [ruta, respaldo] if espera is not None else [ruta]
         try:
-            creds_info = dict(st.secrets["google"])
-            creds = service_account.Credentials.from_service_account_info(creds_info)
+            with cupo_vertex(plazo):
+                # Margen sobre el plazo interno: la corrutina ya se cancela sola, esto solo protege al hilo que espera
+                return ejecutar_en_bucle(
+                    _carrera_rutas(rutas, partes, config, plazo, espera, _etiqueta_actual(), sistema, validar), plazo + 5
+                )
         except Exception as e:
-            st.error(f"Error cargando credenciales desde st.secrets: {e}")
+            if not es_error_cuota(e) or intento == VERTEX_REINTENTOS_CUOTA:
+                raise
+            pausa = espera_reintento(intento)
+            time.sleep(min(pausa, max(0.0, _plazo_llamada())))
 
-    # 2. Si no hay secrets, intentar cargar desde archivo local (PC)
-    if not creds:
-        cred_path = next((p for p in ["secretoslocal.json", "secretos_local.json", "secretos.json"] if os.path.exists(p)), None)
-        if cred_path:
-            try:
-                creds = service_account.Credentials.from_service_account_file(cred_path)
-            except Exception as e:
-                st.error(f"Error cargando archivo {cred_path}: {e}")
+def _generar_contenido(region, m_name, partes, config=CONFIG_JSON, sistema=None):
+    """Llamada a una sola ruta, sin cobertura (lotes empaquetados y revisión de campos)."""
+    return _generar_con_cobertura((region, m_name), None, partes, config, sistema)[1]
+
+def _parte_documento(contenido, analisis=None):
+    """Part para Gemini con el payload ya optimizado y su MIME real (PDF, JPG, PNG...)."""
+    datos, mime, _ = optimizar_payload_ocr(contenido, analisis)
+    return Part.from_data(data=datos, mime_type=mime)
+
+def _extraer_por_texto(pdf_bytes, analisis=None):
+    """
+    Vía rápida local: XML UBL de la GRE (ya estructurado) o PDF con capa de texto (GRE digital de SUNAT) leído con reglas.
+    Solo se acepta si TODOS los campos obligatorios existen y pasan validación; si no, se devuelve None y decide Vertex.
+    """
+    if es_xml(pdf_bytes):
+        return extraer_guia_desde_xml(pdf_bytes)
 
-    # 3. Inicializar Vertex AI con las credenciales obtenidas
+    texto = extraer_texto_pdf(pdf_bytes, analisis)
+    if not texto.strip(): return None
+    datos = extraer_guia_desde_texto(texto)
+    if not datos or campos_invalidos_guia(datos): return None
+    return datos
+
+def _respuesta_aceptable(datos):
+    """Misma regla de aceptación de siempre: hay destinatario o una placa mínimamente legible."""
+    return isinstance(datos, dict) and bool(datos.get("destinatario") or len(datos.get("vehiculo", "")) >= 3)
+
+def _respuesta_guia_aceptable(response):
+    """Filtro de la carrera de rutas: una respuesta ilegible o bloqueada no cancela la cobertura."""
     try:
-        vertexai.init(project=PROJECT_ID, location="us-central1", credentials=creds)
-    except Exception as e:
-        st.error(f"Error inicializando Vertex AI: {e}")
+        return _respuesta_aceptable(interpretar_respuesta_guia(response.text))
+    except Exception: # response.text lanza si el candidato vino bloqueado
+        return False
+
+def extraccion_aceptada(texto):
+    """Texto del modelo -> datos de la guía si pasa la regla de aceptación (respuestas de lotes offline), si no None."""
+    datos = interpretar_respuesta_guia(texto)
+    return datos if _respuesta_aceptable(datos) else None
+
+def resolver_sin_modelo(pdf_bytes, analisis=None):
+    """Caché por contenido y vía rápida local; None si la guía necesita pasar por Gemini."""
+    t0 = time.time()
+    # 0. Caché por contenido: una guía ya leída (desde cualquier módulo) no vuelve a pasar por Gemini
+    datos_cache = leer_cache_extraccion(pdf_bytes, VERSION_CACHE_GUIA)
+    if datos_cache:
+        _registrar_etapa_local(pdf_bytes, "cache", t0)
+        return datos_cache
+
+    # 1. Vía rápida: GRE digital con capa de texto completa -> reglas locales, sin llamar a Gemini
+    datos_locales = _extraer_por_texto(pdf_bytes, analisis)
+    if datos_locales:
+        _registrar_etapa_local(pdf_bytes, "texto", t0)
+        return datos_locales
+    _registrar_etapa_local(pdf_bytes, "a_vertex", t0)
+    return None
+
+def _completar_campos_invalidos(pdf_part, datos):
+    """
+    Cascada por campo: valida la respuesta del modelo rápido y vuelve a pedir a un modelo pro
+    SOLO los campos obligatorios que fallan. Se conservan los valores pro que sí validan; el resto queda como estaba.
+    """
+    invalidos = campos_invalidos_guia(datos)
+    if not invalidos or not OCR_ESCALAR_CAMPOS: return datos
+
+    detalle = "\n".join(
+        f"    - {campo}: valor leído {json.dumps(datos.get(campo, ''), ensure_ascii=False)}"
+        + (f" (regla: {REGLAS_CAMPO[campo]})" if campo in REGLAS_CAMPO else " (no puede quedar vacío)")
+        for campo in invalidos
+    )
+    # Mismo modelo (misma system_instruction) que la extracción: solo cambia la instrucción de la llamada
+    sistema, partes = armar_peticion(
+        SISTEMA_GUIA, [pdf_part], PROMPT_REVISION_CAMPOS.format(detalle=detalle) + instrucciones_claves_compactas(invalidos)
+    )
+    config = GenerationConfig(response_mime_type="application/json", response_schema=construir_esquema_guia(invalidos))
+
+    etiqueta = _etiqueta_actual()
+    etapa_previa, etiqueta["etapa"] = etiqueta["etapa"], "revision_campos"
+    try:
+        for region, m_name in ordenar_rutas(REGIONES_VERTEX, [MODELOS_PRO]):
+            try:
+                response = _generar_contenido(region, m_name, partes, config, sistema)
+            except PlazoAgotado:
+                break
+            except Exception:
+                continue
+            nuevos = interpretar_respuesta_guia(response.text) or {}
+            corregidos = [c for c in invalidos if c in nuevos and not campos_invalidos_guia(nuevos, [c])]
+            for campo in corregidos:
+                datos[campo] = nuevos[campo]
+            break
+    finally:
+        etiqueta["etapa"] = etapa_previa
+    return datos
+
+def rutas_vertex():
+    """(región, modelo) en el orden sugerido por el registro de salud: flash antes que pro."""
+    return ordenar_rutas(REGIONES_VERTEX, [MODELOS_FLASH, MODELOS_PRO])
+
+# ====================================================================
+# --- BLOQUE 1.2: Función Principal y Variables Estáticas ---
+# ====================================================================
+def extraer_guia_completa(pdf_bytes, analisis=None, sin_modelo_probado=False):
+    """
+    Procesamiento Ultra-Resiliente con descubrimiento de modelos y multi-región.
+    Motor único: lee el superconjunto CAMPOS_GUIA una sola vez; cada módulo toma su vista con vista_campos.
+    Quien ya pasó la guía por resolver_sin_modelo (lotes empaquetados) entrega su análisis y sin_modelo_probado=True.
+    """
+    # 0-1. Caché por contenido y vía rápida local (XML / capa de texto), sin llamar a Gemini.
+    # El PDF se lee una vez: el mismo análisis sirve al texto, al perfil y a la poda del payload.
+    analisis = analisis or analizar_pdf(pdf_bytes)
+    if not sin_modelo_probado:
+        datos_previos = resolver_sin_modelo(pdf_bytes, analisis)
+        if datos_previos:
+            return datos_previos
+
+    # ====================================================================
+    # --- BLOQUE 2: Credenciales y Clientes (Registro del Proceso) ---
+    # ====================================================================
+    # Las credenciales y los modelos por (región, modelo) viven en vertex_client:
+    # se cargan una sola vez y cada guía solo paga la llamada generate_content.
 
     # ====================================================================
     # --- BLOQUE 3: Configuración de Regiones y Modelos (Fallbacks) ---
     # ====================================================================
     # 2. Estrategia de búsqueda (Regiones y Modelos dinámicos)
     # us-central1 (estándar), us-west1 (estable), us-east4 (fallback común)
-    regiones = ["us-central1", "us-west1", "us-east4", "southamerica-east1"]
+    regiones = REGIONES_VERTEX
     
     # Modelos detectados en este proyecto específico
-    modelos_flash = ["gemini-2.0-flash-001", "gemini-2.5-flash", "gemini-1.5-flash-002", "gemini-1.5-flash-8b"]
-    modelos_pro = ["gemini-2.5-pro", "gemini-3.1-pro-preview", "gemini-1.5-pro-002"]
+    modelos_flash = MODELOS_FLASH
+    modelos_pro = MODELOS_PRO
+
+    # Complejidad estimada localmente: trivial -> modelo ligero, difícil -> pro directo, normal -> flash -> pro
+    perfil = perfil_documento(pdf_bytes, analisis)
+    if OCR_ENRUTAR_COMPLEJIDAD:
+        complejidad, motivo = estimar_complejidad(perfil)
+    else:
+        complejidad, motivo = COMPLEJIDAD_NORMAL, "enrutamiento desactivado"
 
-   # ====================================================================
+    # ====================================================================
     # --- BLOQUE 4: Prompt del Generative Engine (Strict Extraction V4) ---
     # ====================================================================
-    prompt = """
-    INSTRUCCIÓN DE SISTEMA: Eres un extractor de datos OCR estricto. Tu única tarea es extraer datos del PDF adjunto y devolverlos ÚNICAMENTE en formato JSON válido. Tienes PROHIBIDO inventar datos, alucinar información o incluir texto fuera del JSON (como ```json o explicaciones).
-    
-    ESTRUCTURA JSON EXACTA Y REGLAS DE NEGOCIO OBLIGATORIAS:
-    {
-        "cliente": "Razón Social exacta del REMITENTE. Regla Estricta: NO extraer la empresa de transportes, NO extraer nombres de conductores.",
-        "ruc_cliente": "Número de RUC del Remitente o Cliente Emisor.",
-        "fecha": "dd/mm/yyyy", 
-        "serie": "Serie-Numero completo de la guía. Ejemplo: T001-000000", 
-        "vehiculo": "PLACA del vehículo. Busca en todo el documento. Obligatorio.", 
-        
-        "punto_partida": "REGLA DE ORO OBLIGATORIA: Lee primero el bloque 'Observaciones' u 'Observación' de la guía. Todo dato como 'Fundo Casuarinas', 'Planta...', u otro predio que aparezca ahí TIENE QUE SER EXTRAÍDO SÍ O SÍ. Concatena la dirección base de partida con ese dato usando un guion. Ejemplo de Salida Exacta: 'Direccion Base - Fundo Casuarinas' o 'Av Sur - PLANTA EMPACADORA'. Si dice textualmente 'Fundo Casuarinas', debe salir 'Fundo Casuarinas'. NUNCA dejes fuera la información de 'Observaciones'. Si este campo está vacío entonces devuelve solo la dirección de partida base. NUNCA deduzcas ni inventes basándote en la empresa.", 
-        
-        "punto_llegada": "Dirección Completa exacta de Llegada. IMPORTANTE: Si en el documento (especialmente para la empresa Los Olivos de Villacuri) el destino o planta se indica simplemente como 'EMPACADORA', debes extraer la palabra 'EMPACADORA' y asignarla obligatoriamente a este campo. No lo dejes vacío.", 
-        "destinatario": "Razón Social Completa del Destinatario", 
-        
-        "items": [
-            {
-                "desc": "Descripción literal del bien", 
-                "cant": "Número", 
-                "um": "Unidad de medida (KG, UNID, GLN)", 
-                "peso": "Peso numérico explícito (o 0.00 si no existe)"
-            }
-        ]
-    }
-    """
+    # Las reglas fijas viajan como system_instruction; por llamada solo el PDF y una instrucción corta
 
     # ====================================================================
     # --- BLOQUE 5: Bucle Multi-Región y Ejecución de Modelos IA ---
     # ====================================================================
-    pdf_part = Part.from_data(data=pdf_bytes, mime_type="application/pdf")
+    pdf_part = _parte_documento(pdf_bytes, analisis)
+    sistema, partes = armar_peticion(SISTEMA_GUIA, [pdf_part], INSTRUCCION_LLAMADA)
+    _marcar_guia(pdf_bytes, "extraccion")
+    etiqueta = _etiqueta_actual()
+    t0 = time.time()
+
+    def _registrar_ruta(resultado, modelo_final=""):
+        # Deja la única línea de log de la guía: reintentos, cobertura y revisión solo cuentan como llamadas
+        registrar_enrutamiento(etiqueta["guia"], complejidad, motivo, perfil, rutas[0][1] if rutas else "",
+                               modelo_final, time.time() - t0, etiqueta["contador"][0], resultado)
 
     # Bucle de Recuperación de Desastres
+    # El registro de salud pone primero la última ruta exitosa y salta las rutas con circuito abierto
     errores_acumulados = []
+    ruta_preferida = obtener_ultima_ruta_exitosa()
     
-    for region in regiones:
+    rutas = ordenar_rutas(regiones, niveles_modelos(complejidad, modelos_flash, modelos_pro))
+    for n_ruta, (region, m_name) in enumerate(rutas):
         try:
-            vertexai.init(project=PROJECT_ID, location=region, credentials=creds)
+            # Si la ruta tarda más que su p95, la siguiente ruta sana recibe la misma petición (gana la primera)
+            respaldo = rutas[n_ruta + 1] if n_ruta + 1 < len(rutas) else None
+            (region, m_name), response = _generar_con_cobertura(
+                (region, m_name), respaldo, partes, CONFIG_GUIA, sistema, _respuesta_guia_aceptable
+            )
+            # Cercos ```json, comas finales o números con unidades se reparan aquí, sin otra vuelta al modelo
+            datos = interpretar_respuesta_guia(response.text)
             
-            # 3. Intentar Modelos en esta región
-            for m_name in modelos_flash + modelos_pro:
-                try:
-                    model = GenerativeModel(m_name)
-                    response = model.generate_content(
-                        [pdf_part, prompt],
-                        generation_config=GenerationConfig(response_mime_type="application/json")
-                    )
-                    datos = json.loads(response.text)
-                    
-                    if datos.get("destinatario") or len(datos.get("vehiculo", "")) >= 3:
-                        if region != "us-central1":
-                            st.info(f"💡 Conectado exitosamente vía {region} con {m_name}")
-                        return datos
-                except Exception as e:
-                    err_msg = str(e)
-                    if "404" not in err_msg: # Si es otro error (ej. cuota), lo guardamos
-                        errores_acumulados.append(f"{region}/{m_name}: {err_msg}")
-                    continue
+            if _respuesta_aceptable(datos):
+                if region != regiones[0] and (region, m_name) != ruta_preferida:
+                    st.info(f"💡 Conectado exitosamente vía {region} con {m_name}")
+                if m_name not in modelos_pro:
+                    datos = _completar_campos_invalidos(pdf_part, datos)
+                guardar_cache_extraccion(pdf_bytes, VERSION_CACHE_GUIA, datos)
+                _registrar_ruta("ok", m_name)
+                return datos
+        except PlazoAgotado:
+            _registrar_ruta("plazo")
+            return None
         except Exception as e:
-            errores_acumulados.append(f"Init {region}: {str(e)}")
+            err_msg = str(e)
+            if "404" not in err_msg: # Si es otro error (ej. cuota), lo guardamos
+                errores_acumulados.append(f"{region}/{m_name}: {err_msg}")
             continue
 
     # ====================================================================
     # --- BLOQUE 6: Manejo de Errores Globales y Feedback de Usuario ---
     # ====================================================================
     # Si llegamos aquí, nada funcionó
+    _registrar_ruta("fallo")
     st.error("❌ No se encontró ningún modelo de Gemini disponible en tu proyecto.")
     st.markdown(f"""
     **Causas probables:**
@@ -140,75 +503,213 @@ def procesar_guia_ia_vertex(pdf_bytes):
     """)
     return None
 
+def extraer_guia(pdf_bytes, conjunto="certificados"):
+    """Extracción única de la guía vista con los campos del conjunto registrado en CONJUNTOS_CAMPOS."""
+    return vista_campos(extraer_guia_completa(pdf_bytes), conjunto)
+
+def procesar_guia_ia_vertex(pdf_bytes):
+    return extraer_guia(pdf_bytes, "certificados")
+
 def procesar_guia_ia_vertex_sigersol(pdf_bytes):
+    """Vista Sigersol (con Documentos Relacionados) de la misma extracción y la misma caché."""
+    return extraer_guia(pdf_bytes, "sigersol")
+
+# ====================================================================
+# --- BLOQUE 6.1: Empaquetado de Varias Guías en una Sola Llamada ---
+# ====================================================================
+def agrupar_para_empaque(lista_pdf_bytes, max_docs=None, max_bytes=None):
     """
-    Procesamiento específico para Sigersol que extrae Documentos Relacionados.
+    Agrupa los índices de las guías en paquetes para una sola llamada a Gemini.
+    K se adapta al tamaño: se cierra el paquete al llegar a max_docs o al tope de bytes de la petición,
+    y los PDF grandes (> OCR_EMPAQUE_DOC_MAX_BYTES) siempre viajan solos.
     """
-    PROJECT_ID = "sistemacertificados-485822"
-    creds = None
-    
-    if "google" in st.secrets:
+    max_docs = max_docs or OCR_EMPAQUE_MAX_DOCS
+    max_bytes = max_bytes or OCR_EMPAQUE_MAX_BYTES
+    grupos, actual, bytes_actual = [], [], 0
+
+    for i, pdf_bytes in enumerate(lista_pdf_bytes):
+        tam = len(pdf_bytes or b"")
+        if tam > OCR_EMPAQUE_DOC_MAX_BYTES:
+            grupos.append([i])
+            continue
+        if actual and (len(actual) >= max_docs or bytes_actual + tam > max_bytes):
+            grupos.append(actual)
+            actual, bytes_actual = [], 0
+        actual.append(i)
+        bytes_actual += tam
+
+    if actual: grupos.append(actual)
+    return grupos
+
+def _separar_respuesta_lote(texto, n_docs):
+    """Arreglo JSON del modo lote -> {indice: datos}. Un arreglo irrecuperable devuelve {} (todo cae a llamadas individuales)."""
+    por_indice = {}
+    for obj in interpretar_respuesta_lote(texto):
         try:
-            creds_info = dict(st.secrets["google"])
-            creds = service_account.Credentials.from_service_account_info(creds_info)
-        except Exception: pass
+            idx = int(obj.pop("indice"))
+        except (KeyError, TypeError, ValueError):
+            continue
+        if 0 <= idx < n_docs and idx not in por_indice and _respuesta_aceptable(obj):
+            por_indice[idx] = obj
+    return por_indice
 
-    if not creds:
-        cred_path = next((p for p in ["secretoslocal.json", "secretos_local.json", "secretos.json"] if os.path.exists(p)), None)
-        if cred_path:
-            try: creds = service_account.Credentials.from_service_account_file(cred_path)
-            except Exception: pass
+def procesar_guias_empaquetadas_vertex(lista_pdf_bytes):
+    """
+    Extrae un paquete de guías con UNA llamada a Gemini y reparte los resultados en el mismo orden de entrada.
+    Las guías que el arreglo no trae (o si la respuesta es inválida) se reintentan con extraer_guia_completa.
+    Devuelve la extracción completa (CAMPOS_GUIA); la vista por conjunto la aplica procesar_lote_guias_vertex.
+    """
+    analisis = [analizar_pdf(pdf_bytes) for pdf_bytes in lista_pdf_bytes]
+    resultados = [resolver_sin_modelo(pdf_bytes, a) for pdf_bytes, a in zip(lista_pdf_bytes, analisis)]
+    pendientes = [i for i, datos in enumerate(resultados) if datos is None]
 
-    try: vertexai.init(project=PROJECT_ID, location="us-central1", credentials=creds)
-    except Exception: pass
+    if len(pendientes) > 1:
+        partes = []
+        for n, i in enumerate(pendientes):
+            partes.append(f"DOCUMENTO {n}")
+            partes.append(_parte_documento(lista_pdf_bytes[i], analisis[i]))
+        sistema, partes = armar_peticion(SISTEMA_LOTE_GUIA, partes, INSTRUCCION_LLAMADA_LOTE)
+        # La llamada empaquetada se atribuye al lote completo: cuenta como len(pendientes) guías en el costo por guía
+        id_lote = hashlib.sha256(b"".join(hashlib.sha256(lista_pdf_bytes[i]).digest() for i in pendientes)).hexdigest()[:16]
+        _marcar_guia(None, "lote", guias=len(pendientes), guia=f"lote:{id_lote}")
 
-    regiones = ["us-central1", "us-west1", "us-east4", "southamerica-east1"]
-    modelos_flash = ["gemini-2.0-flash-001", "gemini-2.5-flash", "gemini-1.5-flash-002", "gemini-1.5-flash-8b"]
-    modelos_pro = ["gemini-2.5-pro", "gemini-3.1-pro-preview", "gemini-1.5-pro-002"]
+        por_indice = {}
+        for region, m_name in rutas_vertex():
+            try:
+                response = _generar_contenido(region, m_name, partes, CONFIG_LOTE_GUIA, sistema)
+            except PlazoAgotado:
+                break
+            except Exception as e:
+                print(f"Lote de {len(pendientes)} guías falló en {region}/{m_name}: {e}")
+                continue
+            por_indice = _separar_respuesta_lote(response.text, len(pendientes))
+            break
 
-    prompt = """
-    INSTRUCCIÓN DE SISTEMA: Eres un extractor de datos OCR estricto. Tu única tarea es extraer datos del PDF adjunto y devolverlos ÚNICAMENTE en formato JSON válido. Tienes PROHIBIDO inventar datos, alucinar información o incluir texto fuera del JSON (como ```json o explicaciones).
-    
-    ESTRUCTURA JSON EXACTA Y REGLAS DE NEGOCIO OBLIGATORIAS:
-    {
-        "cliente": "Razón Social exacta del REMITENTE. Regla Estricta: NO extraer la empresa de transportes, NO extraer nombres de conductores.",
-        "ruc_cliente": "Número de RUC del Remitente o Cliente Emisor.",
-        "fecha": "dd/mm/yyyy", 
-        "serie": "Serie-Numero completo de la guía. Ejemplo: T001-000000", 
-        "vehiculo": "PLACA del vehículo. Busca en todo el documento. Obligatorio.", 
-        
-        "punto_partida": "REGLA DE ORO OBLIGATORIA: Lee primero el bloque 'Observaciones' u 'Observación' de la guía. Todo dato como 'Fundo Casuarinas', 'Planta...', u otro predio que aparezca ahí TIENE QUE SER EXTRAÍDO SÍ O SÍ. Concatena la dirección base de partida con ese dato usando un guion. Ejemplo de Salida Exacta: 'Direccion Base - Fundo Casuarinas' o 'Av Sur - PLANTA EMPACADORA'. Si dice textualmente 'Fundo Casuarinas', debe salir 'Fundo Casuarinas'. NUNCA dejes fuera la información de 'Observaciones'. Si este campo está vacío entonces devuelve solo la dirección de partida base. NUNCA deduzcas ni inventes basándote en la empresa.", 
-        
-        "punto_llegada": "Dirección Completa exacta de Llegada. IMPORTANTE: Si en el documento (especialmente para la empresa Los Olivos de Villacuri) el destino o planta se indica simplemente como 'EMPACADORA', debes extraer la palabra 'EMPACADORA' y asignarla obligatoriamente a este campo. No lo dejes vacío.", 
-        "destinatario": "Razón Social Completa del Destinatario", 
-        "documentos_relacionados": "Si la guía contiene la frase exacta 'Documentos Relacionados:' seguida de información (ej: 'Documentos Relacionados: Guía de Remisión Remitente N° EG07 - 00001221 - RUC N° 20176770474'), extráela completa aquí incluyendo la frase inicial. De lo contrario, déjalo vacío.",
-        
-        "items": [
-            {
-                "desc": "Descripción literal del bien", 
-                "cant": "Número", 
-                "um": "Unidad de medida (KG, UNID, GLN)", 
-                "peso": "Peso numérico explícito (o 0.00 si no existe)"
-            }
-        ]
-    }
-    """
-
-    for region in regiones:
+        for n, i in enumerate(pendientes):
+            if n in por_indice:
+                datos = por_indice[n]
+                if campos_invalidos_guia(datos):
+                    _marcar_guia(lista_pdf_bytes[i], "extraccion")
+                    datos = _completar_campos_invalidos(_parte_documento(lista_pdf_bytes[i], analisis[i]), datos)
+                resultados[i] = datos
+                guardar_cache_extraccion(lista_pdf_bytes[i], VERSION_CACHE_GUIA, datos)
+
+    # Fallback: documentos ausentes del arreglo (o paquete de uno) -> llamada individual de siempre,
+    # sin repetir la caché ni la vía local que ya se probaron arriba (ni su fila de métricas "local")
+    for i in pendientes:
+        if resultados[i] is None:
+            resultados[i] = extraer_guia_completa(lista_pdf_bytes[i], analisis[i], sin_modelo_probado=True)
+    return resultados
+
+# ====================================================================
+# --- BLOQUE 7: Motor de Lotes Concurrentes (Procesar N guías) ---
+# ====================================================================
+def _contexto_streamlit():
+    """Devuelve el contexto del script actual para que los hilos puedan usar st.info / st.error."""
+    try:
+        from streamlit.runtime.scriptrunner import get_script_run_ctx
+        return get_script_run_ctx()
+    except Exception:
+        return None
+
+def procesar_lote_guias_vertex(lista_pdf_bytes, conjunto="certificados", al_avanzar=None, empaquetar=None, plazo_s=None,
+                               usuario=None, carril=CARRIL_INTERACTIVO, al_esperar=None):
+    """
+    Procesa varias guías en paralelo a través del planificador OCR del proceso.
+    Devuelve una lista en el MISMO orden de entrada (None para las guías que fallaron)
+    e invoca al_avanzar(completados, total) desde el hilo que llama, apto para st.progress.
+    'conjunto' elige la vista de CONJUNTOS_CAMPOS; con empaquetado activo las guías pequeñas viajan de a varias por llamada.
+    El lote entero respeta plazo_s (OCR_PLAZO_LOTE_S): al vencer, las guías pendientes quedan en None.
+    'carril' separa subidas interactivas de lotes masivos y 'usuario' reparte los turnos con justicia;
+    mientras espera, al_esperar(estado_planificador(usuario or "anonimo")) permite mostrar la posición en la cola.
+    """
+    if empaquetar is None:
+        empaquetar = OCR_EMPAQUETAR
+    total = len(lista_pdf_bytes)
+    resultados = [None] * total
+    if not total: return resultados
+
+    if empaquetar:
+        grupos = agrupar_para_empaque(lista_pdf_bytes)
+    else:
+        grupos = [[i] for i in range(total)]
+
+    ctx = _contexto_streamlit()
+    limite = time.time() + (plazo_s or OCR_PLAZO_LOTE_S)
+
+    def _tarea(indices):
+        if ctx is not None:
+            from streamlit.runtime.scriptrunner import add_script_run_ctx
+            add_script_run_ctx(threading.current_thread(), ctx)
+        # Cada llamada a Gemini de este hilo queda acotada por lo que le quede al lote
+        _plazo_hilo.limite = limite
         try:
-            vertexai.init(project=PROJECT_ID, location=region, credentials=creds)
-            for m_name in modelos_flash + modelos_pro:
-                try:
-                    model = GenerativeModel(m_name)
-                    response = model.generate_content(
-                        [Part.from_data(data=pdf_bytes, mime_type="application/pdf"), prompt],
-                        generation_config=GenerationConfig(response_mime_type="application/json")
-                    )
-                    datos = json.loads(response.text)
-                    if datos.get("destinatario") or len(datos.get("vehiculo", "")) >= 3:
-                        return datos
-                except Exception:
-                    continue
-        except Exception:
-            continue
-    return None
+            if len(indices) > 1:
+                completos = procesar_guias_empaquetadas_vertex([lista_pdf_bytes[i] for i in indices])
+            else:
+                completos = [extraer_guia_completa(lista_pdf_bytes[indices[0]])]
+            return [vista_campos(datos, conjunto) for datos in completos]
+        except Exception as e:
+            print(f"Error procesando guía en lote: {e}")
+            return [None] * len(indices)
+        finally:
+            _plazo_hilo.limite = None
+
+    futuros = {enviar_trabajo_ocr(_tarea, indices, usuario=usuario, carril=carril): indices for indices in grupos}
+    pendientes = set(futuros)
+    completados = 0
+
+    while pendientes:
+        restante = limite - time.time()
+        if restante <= 0: break
+        # Se despierta cada segundo para informar la posición en la cola aunque nada haya terminado
+        hechos, pendientes = wait(pendientes, timeout=min(1.0, restante), return_when=FIRST_COMPLETED)
+        for futuro in hechos:
+            indices = futuros[futuro]
+            for i, datos in zip(indices, futuro.result()):
+                resultados[i] = datos
+            completados += len(indices)
+            if al_avanzar:
+                al_avanzar(completados, total)
+        if pendientes and al_esperar:
+            al_esperar(estado_planificador(usuario or "anonimo"))
+
+    if pendientes:
+        # Lo que no empezó se retira de la cola; lo que está en curso termina solo al vencer su plazo de llamada
+        for futuro in pendientes: futuro.cancel()
+        faltantes = total - completados
+        print(f"Plazo del lote vencido: {faltantes} guías sin procesar")
+        st.warning(f"⏱️ Se agotó el tiempo del lote: {faltantes} guía(s) quedaron sin procesar. Vuelve a subirlas.")
+
+    return resultados
+
+def procesar_documentos_guia(documentos, al_avanzar=None, ventana=None, **opciones):
+    """
+    Consume los documentos de expandir_archivos_guia / separar_guias_multipagina por ventanas de OCR_VENTANA_DOCUMENTOS:
+    solo esa cantidad de PDFs vive en memoria a la vez y de cada uno se conserva únicamente su resultado.
+    Los XML ya traen 'datos'. Devuelve los resultados en el orden de llegada (None = falló).
+    al_avanzar(hechos, vistos) recibe los documentos terminados y los vistos hasta ahora (el total se conoce al final).
+    El plazo OCR_PLAZO_LOTE_S cubre el recorrido completo, no cada ventana.
+    """
+    ventana = ventana or OCR_VENTANA_DOCUMENTOS
+    limite = time.time() + (opciones.pop("plazo_s", None) or OCR_PLAZO_LOTE_S)
+    resultados, bloque = [], []
+
+    def _procesar_bloque():
+        base = len(resultados)
+        pdfs = [doc['contenido'] for doc in bloque if 'contenido' in doc]
+        restante = limite - time.time()
+        if pdfs and restante > 0:
+            avance = (lambda hechos, _: al_avanzar(base + hechos, base + len(bloque))) if al_avanzar else None
+            ocr = iter(procesar_lote_guias_vertex(pdfs, al_avanzar=avance, plazo_s=restante, **opciones))
+        else:
+            ocr = iter([None] * len(pdfs))
+        resultados.extend(doc['datos'] if 'datos' in doc else next(ocr) for doc in bloque)
+        if al_avanzar: al_avanzar(len(resultados), len(resultados))
+        bloque.clear()
+
+    for doc in documentos:
+        bloque.append(doc)
+        if len(bloque) >= ventana: _procesar_bloque()
+    if bloque: _procesar_bloque()
+    return resultados
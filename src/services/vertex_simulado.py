@@ -0,0 +1,285 @@
+# ====================================================================
+# --- BLOQUE 0: Imports ---
+# ====================================================================
+import os
+import json
+import math
+import time
+import random
+import asyncio
+import hashlib
+import threading
+from src.config.settings import (
+    SIMULADO_LATENCIA, SIMULADO_TASA_404, SIMULADO_TASA_429, SIMULADO_TASA_MALFORMADO,
+    SIMULADO_MODELOS_404, SIMULADO_SEMILLA, SIMULADO_RESPUESTAS_DIR, SIMULADO_ESCALA, VERTEX_GRABAR_DIR
+)
+
+# ====================================================================
+# --- BLOQUE 1: Modelo Simulado (Sustituto Local de GenerativeModel) ---
+# ====================================================================
+# Se activa con VERTEX_BACKEND=simulado. Imita lo que mide la app: usage_metadata (tokens de entrada, salida
+# y servidos desde caché) y un tiempo al primer token proporcional a los tokens que hay que procesar.
+TOKENS_POR_PAGINA = 258 # Costo fijo de Gemini por página de PDF / imagen
+CARACTERES_POR_TOKEN = 4
+TTFT_BASE_S = 0.25
+PREFILL_S_POR_TOKEN = 0.0004
+FACTOR_PREFILL_CACHE = 0.1 # Un prefijo ya visto se procesa ~10 veces más rápido
+# Caché implícita de Vertex: solo familias 2.5 en adelante y solo si el prefijo común alcanza el mínimo del modelo.
+# Los modelos que no figuran (2.0 / 1.5) nunca sirven tokens desde caché implícita.
+MINIMO_TOKENS_CACHE = {"gemini-2.5-flash": 1024, "gemini-2.5-pro": 2048, "gemini-3": 2048}
+DECODIFICACION_S_POR_TOKEN = 0.004
+
+RESPUESTA_GUIA = {
+    "cl": "AGRICOLA SIMULADA S.A.C.", "ruc": "20100070970", "fe": "15/03/2025", "se": "T001-00001234",
+    "ve": "ABC-123", "pp": "Av Sur 123 - Fundo Casuarinas", "pl": "EMPACADORA", "de": "INECOVE S.A.C.",
+    "dr": "", "it": [{"d": "RESIDUOS ORGANICOS", "c": "1", "u": "KG", "p": "1500.00"}],
+}
+
+# Configuración del proceso (settings SIMULADO_*); configurar_simulado la cambia en caliente para los benchmarks
+_config = {
+    "latencia": SIMULADO_LATENCIA,
+    "tasa_404": SIMULADO_TASA_404,
+    "tasa_429": SIMULADO_TASA_429,
+    "tasa_malformado": SIMULADO_TASA_MALFORMADO,
+    "modelos_404": list(SIMULADO_MODELOS_404),
+    "semilla": SIMULADO_SEMILLA,
+    "respuestas_dir": SIMULADO_RESPUESTAS_DIR,
+    "escala": SIMULADO_ESCALA,
+}
+_LOCK_SIMULADO = threading.Lock()
+_respuestas = {} # huella del documento enviado -> texto de respuesta grabado
+_llamadas_por_documento = {}
+_inyectados = {"404": 0, "429": 0, "malformado": 0}
+
+def configurar_simulado(**cambios):
+    """Ajusta latencia, tasas de error, semilla o carpeta de respuestas; devuelve la configuración vigente."""
+    desconocidas = set(cambios) - set(_config)
+    if desconocidas: raise ValueError(f"Opciones del simulado desconocidas: {sorted(desconocidas)}")
+    with _LOCK_SIMULADO:
+        _config.update(cambios)
+        _llamadas_por_documento.clear()
+        _inyectados.update({k: 0 for k in _inyectados})
+        return dict(_config)
+
+def errores_inyectados():
+    """Cuántos 404, 429 y JSON malformados devolvió el simulado desde la última configuración."""
+    with _LOCK_SIMULADO:
+        return dict(_inyectados)
+
+def _contar_inyectado(tipo):
+    with _LOCK_SIMULADO:
+        _inyectados[tipo] += 1
+
+class DocumentoSimulado:
+    """Marcador de un PDF adjunto (solo cuenta páginas, no lleva bytes)."""
+    def __init__(self, paginas=1):
+        self.paginas = paginas
+
+class _UsoSimulado:
+    def __init__(self, entrada, salida, cache):
+        self.prompt_token_count = entrada
+        self.candidates_token_count = salida
+        self.cached_content_token_count = cache
+
+class _RespuestaSimulada:
+    def __init__(self, texto, uso, ttft_s):
+        self.text = texto
+        self.usage_metadata = uso
+        self.ttft_s = ttft_s
+
+def minimo_tokens_cache(nombre_modelo):
+    """Tamaño mínimo del prefijo para que Vertex lo sirva desde caché implícita; None si el modelo no la ofrece."""
+    for prefijo, minimo in MINIMO_TOKENS_CACHE.items():
+        if nombre_modelo.startswith(prefijo): return minimo
+    return None
+
+def estimar_tokens(parte):
+    """Texto: ~4 caracteres por token; documento o Part binario: 258 tokens por página."""
+    if parte is None: return 0
+    if isinstance(parte, str): return math.ceil(len(parte) / CARACTERES_POR_TOKEN)
+    return TOKENS_POR_PAGINA * getattr(parte, "paginas", 1)
+
+# ====================================================================
+# --- BLOQUE 2: Latencia, Errores Inyectados y Respuestas Grabadas ---
+# ====================================================================
+def muestrear_latencia(rng, especificacion=None):
+    """
+    Segundos extra por llamada según 'fija:s', 'uniforme:min:max' o 'lognormal:mediana:sigma'
+    (la lognormal reproduce la cola larga que se ve en producción).
+    """
+    tipo, *params = (especificacion or _config["latencia"]).split(":")
+    params = [float(v) for v in params]
+    if tipo == "fija": return params[0]
+    if tipo == "uniforme": return rng.uniform(params[0], params[1])
+    if tipo == "lognormal": return rng.lognormvariate(math.log(params[0]), params[1])
+    raise ValueError(f"Distribución de latencia desconocida: {tipo}")
+
+def _bytes_documento(parte):
+    """Bytes del Part del SDK (inline_data.data) o None si la parte es texto o un marcador."""
+    if isinstance(parte, (bytes, bytearray)): return bytes(parte)
+    return getattr(getattr(parte, "inline_data", None), "data", None)
+
+def huella_bytes(datos):
+    return hashlib.sha256(datos).hexdigest()
+
+def huella_enviada(contenido):
+    """Huella del documento tal como llega al modelo (después de optimizar_payload_ocr): clave de las respuestas grabadas."""
+    from src.utils.pdf_utils import optimizar_payload_ocr
+    return huella_bytes(optimizar_payload_ocr(contenido)[0])
+
+def registrar_respuesta(huella, texto):
+    """Respuesta fija para un documento (corpus sintético con su verdad conocida o grabación previa)."""
+    with _LOCK_SIMULADO:
+        _respuestas[huella] = texto
+
+def _respuesta_grabada(huella):
+    with _LOCK_SIMULADO:
+        if huella in _respuestas: return _respuestas[huella]
+    carpeta = _config["respuestas_dir"]
+    ruta = os.path.join(carpeta, f"{huella}.json") if carpeta and huella else ""
+    if ruta and os.path.exists(ruta):
+        with open(ruta, encoding="utf-8") as f:
+            return json.load(f)["texto"]
+    return None
+
+def _respuesta_documento(huella):
+    """Grabada si existe; si no, la respuesta genérica."""
+    grabada = _respuesta_grabada(huella) if huella else None
+    if grabada is not None:
+        try:
+            return json.loads(grabada)
+        except ValueError:
+            pass
+    return dict(RESPUESTA_GUIA)
+
+def _rng_llamada(nombre_modelo, huellas):
+    """
+    Generador propio por (semilla, modelo, documentos, n-ésima llamada): la latencia y el error que recibe cada
+    llamada no dependen del orden en que los hilos lleguen al simulado. Lo que sí puede variar entre corridas
+    es qué llamadas se hacen (cobertura y cortacircuitos dependen de los tiempos reales de los hilos).
+    """
+    clave = f"{nombre_modelo}|{'|'.join(huellas)}"
+    with _LOCK_SIMULADO:
+        n = _llamadas_por_documento.get(clave, 0)
+        _llamadas_por_documento[clave] = n + 1
+    return random.Random(f"{_config['semilla']}|{clave}|{n}")
+
+class ModeloSimulado:
+    """
+    Misma interfaz que GenerativeModel para lo que usa vertex_service (generate_content_async).
+    La system_instruction es un prefijo estable, pero solo cuenta como caché si se usa un cached_content explícito
+    o si el modelo tiene caché implícita y el prefijo alcanza su mínimo (MINIMO_TOKENS_CACHE), desde la segunda llamada.
+    Sin ella, el prompt va detrás del documento (que cambia en cada llamada) y no hay prefijo reutilizable.
+    Los errores inyectados llevan el mismo texto que los de Vertex ('404 ... not found', '429 Resource exhausted')
+    para que el cortacircuitos y el AIMD los clasifiquen igual que en producción.
+    """
+    def __init__(self, nombre_modelo, system_instruction=None, escala=None, cached_content=None):
+        self.nombre_modelo = nombre_modelo
+        self.system_instruction = system_instruction
+        self.cached_content = cached_content
+        self._escala = escala
+        self._prefijo_visto = False
+
+    @property
+    def escala(self):
+        return _config["escala"] if self._escala is None else self._escala
+
+    async def generate_content_async(self, partes, generation_config=None):
+        huellas = [huella_bytes(b) for b in (_bytes_documento(p) for p in partes) if b is not None]
+        rng = _rng_llamada(self.nombre_modelo, huellas)
+        extra_s = muestrear_latencia(rng)
+
+        if self.nombre_modelo in _config["modelos_404"] or rng.random() < _config["tasa_404"]:
+            _contar_inyectado("404")
+            await asyncio.sleep((TTFT_BASE_S + 0.1 * extra_s) * self.escala) # Los errores vuelven antes que una respuesta
+            raise RuntimeError(f"404 Publisher Model `{self.nombre_modelo}` was not found or your project does not have access to it.")
+        if rng.random() < _config["tasa_429"]:
+            _contar_inyectado("429")
+            await asyncio.sleep((TTFT_BASE_S + 0.1 * extra_s) * self.escala)
+            raise RuntimeError("429 Resource exhausted. Please try again later. (RESOURCE_EXHAUSTED)")
+
+        t_sistema = estimar_tokens(self.system_instruction)
+        t_llamada = sum(estimar_tokens(p) for p in partes)
+        minimo = minimo_tokens_cache(self.nombre_modelo)
+        cacheable = minimo is not None and bool(self.system_instruction) and t_sistema >= minimo
+        if self.cached_content is not None:
+            t_cache = t_sistema
+        else:
+            t_cache = t_sistema if cacheable and self._prefijo_visto else 0
+        self._prefijo_visto = self._prefijo_visto or cacheable
+
+        n_docs = sum(1 for p in partes if isinstance(p, str) and p.startswith("DOCUMENTO "))
+        if n_docs:
+            faltantes = [None] * max(0, n_docs - len(huellas))
+            docs = [dict(_respuesta_documento(h), ix=i) for i, h in enumerate(huellas[:n_docs] + faltantes)]
+            texto = json.dumps(docs, ensure_ascii=False)
+        else:
+            texto = json.dumps(_respuesta_documento(huellas[0] if huellas else None), ensure_ascii=False)
+        if rng.random() < _config["tasa_malformado"]:
+            _contar_inyectado("malformado")
+            texto = texto[:len(texto) // 2] # JSON cortado a la mitad: ni reparar_json lo recupera
+        t_salida = estimar_tokens(texto)
+
+        ttft = TTFT_BASE_S + PREFILL_S_POR_TOKEN * (t_sistema + t_llamada - t_cache * (1 - FACTOR_PREFILL_CACHE))
+        await asyncio.sleep((ttft + DECODIFICACION_S_POR_TOKEN * t_salida + extra_s) * self.escala)
+        return _RespuestaSimulada(texto, _UsoSimulado(t_sistema + t_llamada, t_salida, t_cache), ttft)
+
+class ModeloGrabador:
+    """
+    Envoltorio del GenerativeModel real (VERTEX_GRABAR_DIR): guarda la respuesta de cada llamada de un solo documento
+    en <huella>.json, que luego reproduce el simulado con SIMULADO_RESPUESTAS_DIR apuntando a la misma carpeta.
+    """
+    def __init__(self, modelo, nombre_modelo, carpeta=VERTEX_GRABAR_DIR):
+        self._modelo = modelo
+        self.nombre_modelo = nombre_modelo
+        self.carpeta = carpeta
+
+    async def generate_content_async(self, partes, generation_config=None):
+        response = await self._modelo.generate_content_async(partes, generation_config=generation_config)
+        documentos = [b for b in (_bytes_documento(p) for p in partes) if b is not None]
+        if len(documentos) == 1:
+            try:
+                os.makedirs(self.carpeta, exist_ok=True)
+                with open(os.path.join(self.carpeta, f"{huella_bytes(documentos[0])}.json"), "w", encoding="utf-8") as f:
+                    json.dump({"modelo": self.nombre_modelo, "texto": response.text}, f, ensure_ascii=False)
+            except Exception as e:
+                print(f"No se pudo grabar la respuesta de Vertex: {e}")
+        return response
+
+# ====================================================================
+# --- BLOQUE 3: Comparación Prompt Completo vs system_instruction ---
+# ====================================================================
+def comparar_instruccion_sistema(n_llamadas=20, paginas=1, escala=0.01, modelo="gemini-2.0-flash-001"):
+    """
+    Arma las peticiones con armar_peticion (igual que la extracción real) en ambos modos y las envía al
+    modelo simulado. Devuelve por modo: tokens en el contenido de cada llamada, tokens de entrada facturados
+    (incluye la system_instruction), servidos desde caché y TTFT medio.
+    """
+    from src.services.vertex_service import SISTEMA_GUIA, INSTRUCCION_LLAMADA, armar_peticion
+
+    async def _corrida(separar):
+        modelos, filas = {}, []
+        for _ in range(n_llamadas):
+            sistema, partes = armar_peticion(SISTEMA_GUIA, [DocumentoSimulado(paginas)], INSTRUCCION_LLAMADA, separar)
+            simulado = modelos.setdefault(sistema, ModeloSimulado(modelo, sistema, escala))
+            t0 = time.time()
+            respuesta = await simulado.generate_content_async(partes)
+            filas.append((sum(estimar_tokens(p) for p in partes), respuesta, time.time() - t0))
+        return filas
+
+    reporte = {}
+    for nombre, separar in (("prompt_completo", False), ("instruccion_sistema", True)):
+        filas = asyncio.run(_corrida(separar))
+        reporte[nombre] = {
+            "tokens_enviados_por_llamada": round(sum(f[0] for f in filas) / n_llamadas),
+            "tokens_entrada": sum(f[1].usage_metadata.prompt_token_count for f in filas),
+            "tokens_entrada_por_llamada": round(sum(f[1].usage_metadata.prompt_token_count for f in filas) / n_llamadas),
+            "tokens_cache": sum(f[1].usage_metadata.cached_content_token_count for f in filas),
+            "ttft_medio_s": round(sum(f[1].ttft_s for f in filas) / n_llamadas, 3),
+        }
+    return reporte
+
+if __name__ == "__main__":
+    for nombre_modelo in ("gemini-2.0-flash-001", "gemini-2.5-flash"):
+        for modo, datos in comparar_instruccion_sistema(modelo=nombre_modelo).items():
+            print(nombre_modelo, modo, json.dumps(datos))
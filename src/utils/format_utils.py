@@ -65,10 +65,26 @@ def normalizar_fecha(fecha_str):
         except: continue
     return fecha_str 
 
+# Serie y número de la guía; el número sin ceros a la izquierda. La serie es el bloque completo antes del guion,
+# como en la limpieza original: sin el ancla, 'FFF01-0001' se leía como 'FF01-1'. numero_guia_canonico usa el mismo patrón.
+RE_NUMERO_GUIA = re.compile(r'(?<![A-Z0-9])([A-Z0-9]+)-0*(\d+)')
+
+def _compactar_guia(numero):
+    """Mayúsculas sin 'N°', espacios ni guiones bajos: 'n° t001 - 00001234' -> 'T001-00001234'."""
+    return re.sub(r'N[°º]\.?|\s|_', '', str(numero or '').upper())
+
 def formatear_guia(serie_str):
-    if not serie_str or '-' not in str(serie_str): return serie_str
-    try:
-        p = str(serie_str).split('-')
-        if len(p) == 2: return f"{p[0].strip()}-{str(int(p[1].strip()))}"
-    except: pass
-    return serie_str
+    """Serie-Número para mostrar y agrupar: 'T001-00001234' -> 'T001-1234'. Sin serie reconocible ('S/N') se devuelve tal cual."""
+    if not serie_str: return serie_str
+    m = RE_NUMERO_GUIA.search(_compactar_guia(serie_str))
+    return f"{m.group(1)}-{m.group(2)}" if m else serie_str
+
+def numero_guia_canonico(numero):
+    """
+    Forma única del número de guía para indexar y comparar: 'T001-00001234', 't001 - 1234' y 'N° T001-1234' -> 'T001-1234'.
+    Sin guion (nombres de archivo, 'T0011234') quedan letras y números en mayúsculas, sin ceros a la izquierda de cada bloque.
+    """
+    t = _compactar_guia(numero)
+    m = RE_NUMERO_GUIA.search(t)
+    if m: return f"{m.group(1)}-{m.group(2)}"
+    return "".join((p.lstrip('0') or '0') if p.isdigit() else p for p in re.findall(r'[A-Z]+|[0-9]+', t))
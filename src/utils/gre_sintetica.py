@@ -0,0 +1,173 @@
+# ====================================================================
+# --- BLOQUE 0: Imports (Pillow es opcional: sin él solo se generan GRE digitales) ---
+# ====================================================================
+import io
+import json
+import random
+import time
+from datetime import date, timedelta
+from src.utils.validacion_utils import FACTORES_RUC
+from src.utils.respuesta_utils import CLAVE_COMPACTA, CLAVES_COMPACTAS_ITEM
+
+try:
+    from PIL import Image, ImageDraw, ImageFont
+except ImportError:
+    Image = ImageDraw = ImageFont = None
+
+# ====================================================================
+# --- BLOQUE 1: Datos Sintéticos de una GRE (con su Verdad Conocida) ---
+# ====================================================================
+# Corpus reproducible para medir el pipeline OCR sin datos de clientes: cada PDF sale con el dict exacto
+# que debería devolver la extracción, en el mismo esquema que procesar_guia_ia_vertex.
+RAZONES_SOCIALES = [
+    "AGRICOLA CERRO PRIETO S.A.C.", "CAMPOSOL S.A.", "DANPER TRUJILLO S.A.C.", "SOCIEDAD AGRICOLA VIRU S.A.",
+    "AGROINDUSTRIAS AIB S.A.", "PROCESADORA LARAN S.A.C.", "COMPLEJO AGROINDUSTRIAL BETA S.A.",
+]
+DESTINATARIOS = ["INECOVE S.A.C.", "ECOLOGISTICA PERU S.A.C.", "RECICLADOS DEL NORTE E.I.R.L.", "PETRAMAS S.A.C."]
+PARTIDAS = ["Fundo Casuarinas Km 512", "Planta Chao Mz B Lt 4", "Fundo Santa Rosa Sector 3", "Av Industrial 450 - Viru"]
+LLEGADAS = ["Relleno Sanitario Milagro", "Planta de Compostaje La Joya", "Km 18 Carretera Salaverry", "EMPACADORA"]
+RESIDUOS = [
+    ("RESIDUOS ORGANICOS", "KILOGRAMOS"), ("PLASTICO AGRICOLA", "KILOGRAMOS"), ("CARTON Y PAPEL", "KILOGRAMOS"),
+    ("ENVASES VACIOS DE AGROQUIMICOS", "UNIDADES"), ("ACEITE RESIDUAL", "GALONES"),
+]
+UNIDAD_GUIA = {"KILOGRAMOS": "KG", "UNIDADES": "UNID", "GALONES": "GLN"}
+
+def ruc_sintetico(rng):
+    """RUC de persona jurídica (prefijo 20) con dígito verificador válido."""
+    base = "20" + "".join(str(rng.randint(0, 9)) for _ in range(8))
+    resto = 11 - sum(int(d) * f for d, f in zip(base, FACTORES_RUC)) % 11
+    return base + str(resto % 10)
+
+def placa_sintetica(rng):
+    letras = "ABCDEFGHJKLMNPRSTUVWXYZ"
+    return f"{''.join(rng.choice(letras) for _ in range(3))}-{rng.randint(100, 999)}"
+
+def guia_sintetica(rng):
+    """Dict de la guía en el esquema largo; los ítems que no son KG llevan peso 0.00 como en la extracción real."""
+    items = []
+    for desc, unidad in rng.sample(RESIDUOS, rng.randint(1, 3)):
+        cant = f"{rng.randint(1, 40) * 50:.2f}" if unidad == "KILOGRAMOS" else f"{rng.randint(1, 60)}.00"
+        um = UNIDAD_GUIA[unidad]
+        items.append({"desc": desc, "cant": cant, "um": um, "peso": cant if um == "KG" else "0.00"})
+    fecha = date(2025, 1, 1) + timedelta(days=rng.randint(0, 364))
+    return {
+        "cliente": rng.choice(RAZONES_SOCIALES),
+        "ruc_cliente": ruc_sintetico(rng),
+        "fecha": fecha.strftime("%d/%m/%Y"),
+        "serie": f"T{rng.randint(1, 9):03d}-{rng.randint(1, 99999999):08d}",
+        "vehiculo": placa_sintetica(rng),
+        "punto_partida": rng.choice(PARTIDAS),
+        "punto_llegada": rng.choice(LLEGADAS),
+        "destinatario": rng.choice(DESTINATARIOS),
+        "documentos_relacionados": "",
+        "items": items,
+    }
+
+def lineas_guia(guia, pagina=1, total=1):
+    """Texto de una página con la maquetación SUNAT que leen las reglas de gre_utils."""
+    cabecera = ["GUIA DE REMISION ELECTRONICA REMITENTE", guia["serie"], f"Pagina {pagina} de {total}"]
+    if pagina > 1:
+        return cabecera + ["Informacion adicional del traslado", "Modalidad de transporte: Privado"]
+    unidades = {"KG": "KILOGRAMOS", "UNID": "UNIDADES", "GLN": "GALONES"}
+    lineas = cabecera + [
+        f"Fecha de emision: {guia['fecha']}",
+        f"Remitente: {guia['cliente']}",
+        f"RUC: {guia['ruc_cliente']}",
+        f"Destinatario: {guia['destinatario']}",
+        f"Punto de partida: {guia['punto_partida']}",
+        f"Punto de llegada: {guia['punto_llegada']}",
+        f"Placa: {guia['vehiculo']}",
+        "Bienes por transportar",
+    ]
+    lineas += [f"{i} {it['desc']} {unidades[it['um']]} {it['cant']}" for i, it in enumerate(guia["items"], 1)]
+    peso = sum(float(it["peso"]) for it in guia["items"])
+    return lineas + [f"Peso bruto total (KGM): {peso:.2f}"]
+
+def respuesta_compacta(guia):
+    """La guía con las claves compactas que devuelve Gemini (para registrar_respuesta del modelo simulado)."""
+    corto_item = {largo: corto for corto, largo in CLAVES_COMPACTAS_ITEM.items()}
+    datos = {CLAVE_COMPACTA[k]: v for k, v in guia.items() if k != "items"}
+    datos["it"] = [{corto_item[k]: v for k, v in it.items()} for it in guia["items"]]
+    return json.dumps(datos, ensure_ascii=False)
+
+# ====================================================================
+# --- BLOQUE 2: PDF Digital (Capa de Texto) y Escaneado (Solo Imagen) ---
+# ====================================================================
+def _escapar_pdf(linea):
+    return linea.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+
+def pdf_texto(paginas):
+    """PDF mínimo con una página A4 por lista de líneas (Helvetica, sin dependencias)."""
+    n = len(paginas)
+    id_fuente = 3 + 2 * n
+    objetos = [
+        "<< /Type /Catalog /Pages 2 0 R >>",
+        f"<< /Type /Pages /Kids [{' '.join(f'{3 + 2 * i} 0 R' for i in range(n))}] /Count {n} >>",
+    ]
+    for i, lineas in enumerate(paginas):
+        objetos.append(f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 595 842] "
+                       f"/Resources << /Font << /F1 {id_fuente} 0 R >> >> /Contents {4 + 2 * i} 0 R >>")
+        ops = "BT /F1 10 Tf 50 800 Td 14 TL " + " ".join(f"({_escapar_pdf(l)}) Tj T*" for l in lineas) + " ET"
+        objetos.append(f"<< /Length {len(ops)} >>\nstream\n{ops}\nendstream")
+    objetos.append("<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica /Encoding /WinAnsiEncoding >>")
+
+    salida, offsets = b"%PDF-1.4\n", []
+    for k, obj in enumerate(objetos, 1):
+        offsets.append(len(salida))
+        salida += f"{k} 0 obj\n{obj}\nendobj\n".encode("latin-1")
+    inicio_xref = len(salida)
+    salida += f"xref\n0 {len(objetos) + 1}\n0000000000 65535 f \n".encode()
+    salida += b"".join(f"{o:010d} 00000 n \n".encode() for o in offsets)
+    salida += f"trailer\n<< /Size {len(objetos) + 1} /Root 1 0 R >>\nstartxref\n{inicio_xref}\n%%EOF\n".encode()
+    return salida
+
+def pdf_escaneado(paginas, rng):
+    """Cada página como imagen (sin capa de texto), con leve giro y ruido de escáner: obliga a pasar por Gemini."""
+    if Image is None:
+        raise RuntimeError("Pillow no está instalado: no se pueden generar guías escaneadas.")
+    fuente = ImageFont.load_default()
+    imagenes = []
+    for lineas in paginas:
+        img = Image.new("L", (1240, 1754), 255) # A4 a 150 dpi
+        dibujo = ImageDraw.Draw(img)
+        for i, linea in enumerate(lineas):
+            dibujo.text((100, 120 + 28 * i), linea, fill=0, font=fuente)
+        for _ in range(400):
+            dibujo.point((rng.randrange(1240), rng.randrange(1754)), fill=rng.randint(120, 220))
+        imagenes.append(img.rotate(rng.uniform(-1.5, 1.5), fillcolor=255).convert("RGB"))
+    salida = io.BytesIO()
+    fecha_fija = time.gmtime(1735689600) # 01/01/2025. Sin la fecha actual en los metadatos: misma semilla, mismos bytes
+    imagenes[0].save(salida, "PDF", save_all=True, append_images=imagenes[1:], resolution=150.0,
+                     creationDate=fecha_fija, modDate=fecha_fija)
+    return salida.getvalue()
+
+def generar_pdf_guias(guias, escaneada=False, paginas_por_guia=1, rng=None):
+    """Un PDF con las guías en orden (varias guías = el caso que parte separar_guias_multipagina)."""
+    rng = rng or random.Random(0)
+    paginas = [lineas_guia(g, p, paginas_por_guia) for g in guias for p in range(1, paginas_por_guia + 1)]
+    return pdf_escaneado(paginas, rng) if escaneada else pdf_texto(paginas)
+
+# ====================================================================
+# --- BLOQUE 3: Corpus Reproducible ---
+# ====================================================================
+def corpus_sintetico(n_documentos, semilla=0, proporcion_escaneadas=0.5, proporcion_multiguia=0.1,
+                     proporcion_multipagina=0.2):
+    """
+    Lista de {nombre, contenido, guias, escaneada}: 'guias' es la verdad de cada guía del PDF, en orden.
+    Los PDF con varias guías son digitales (la separación por cabecera necesita capa de texto).
+    Misma semilla -> mismos bytes, mismas guías.
+    """
+    rng = random.Random(semilla)
+    corpus = []
+    for i in range(n_documentos):
+        multiguia = rng.random() < proporcion_multiguia
+        escaneada = not multiguia and Image is not None and rng.random() < proporcion_escaneadas
+        paginas = 2 if rng.random() < proporcion_multipagina else 1
+        guias = [guia_sintetica(rng) for _ in range(rng.randint(2, 3) if multiguia else 1)]
+        corpus.append({
+            "nombre": f"gre_sintetica_{i + 1:04d}.pdf",
+            "contenido": generar_pdf_guias(guias, escaneada, paginas, rng),
+            "guias": guias,
+            "escaneada": escaneada,
+        })
+    return corpus
@@ -0,0 +1,141 @@
+# ====================================================================
+# --- BLOQUE 0: Imports ---
+# ====================================================================
+import re
+from src.utils.respuesta_utils import numero_como_texto
+
+# ====================================================================
+# --- BLOQUE 1: Patrones de la Guía de Remisión Electrónica (SUNAT) ---
+# ====================================================================
+# Todos los patrones trabajan sobre el texto del PDF tal como lo entrega la capa de texto
+# El código de serie va en mayúsculas y termina en dígito (T001, EG07, V001): 'Telf-…' o 'Vent-…' no son series
+RE_SERIE = re.compile(r'\b((?-i:(?:T|EG|V)[A-Z0-9]{1,2}\d))\s*(?:-|N\s*(?:RO|°|º)?\.?)\s*(\d{1,8})\b', re.IGNORECASE)
+RE_FECHA_EMISION = re.compile(r'Fecha\s*(?:y\s*hora\s*)?de\s*emisi[oó]n\s*:?\s*(\d{1,2}[/-]\d{1,2}[/-]\d{4})', re.IGNORECASE)
+RE_FECHA_TRASLADO = re.compile(r'Fecha\s*de\s*inicio\s*de\s*traslado\s*:?\s*(\d{1,2}[/-]\d{1,2}[/-]\d{4})', re.IGNORECASE)
+RE_FECHA = re.compile(r'\b(\d{1,2}/\d{1,2}/\d{4})\b')
+RE_RUC = re.compile(r'\bR\.?\s*U\.?\s*C\.?\s*(?:N[°º]?\.?)?\s*:?\s*(\d{11})\b', re.IGNORECASE)
+RE_REMITENTE = re.compile(r'(?:Datos\s*del\s*remitente|Remitente|Raz[oó]n\s*social)\s*:\s*(.+)', re.IGNORECASE)
+RE_DESTINATARIO = re.compile(r'(?:Datos\s*del\s*destinatario|Destinatario)\s*:?\s*(.+)', re.IGNORECASE)
+RE_PARTIDA = re.compile(r'Punto\s*de\s*partida\s*:?\s*(.+)', re.IGNORECASE)
+RE_LLEGADA = re.compile(r'Punto\s*de\s*llegada\s*:?\s*(.+)', re.IGNORECASE)
+RE_PLACA = re.compile(
+    r'(?:N[°º]?\s*de\s*placa|Placa(?:\s*del\s*veh[ií]culo)?|Datos\s*del\s*veh[ií]culo[^:\n]*)\s*:?\s*'
+    r'(?:Principal\s*:?\s*)?([A-Z0-9]{3}-?[A-Z0-9]{3})\b', re.IGNORECASE
+)
+RE_OBSERVACIONES = re.compile(r'Observaci[oó]n(?:es)?\s*:?\s*(.+)', re.IGNORECASE)
+RE_DOC_RELACIONADOS = re.compile(r'(Documentos\s*Relacionados\s*:.+)', re.IGNORECASE)
+RE_PESO_BRUTO = re.compile(r'Peso\s*bruto\s*total[^:\n]*:?\s*([\d.,]+)', re.IGNORECASE)
+RE_PRIMERA_PAGINA = re.compile(r'\bP[aá]g(?:ina)?\.?\s*(?:N[°º]?\s*)?1\s*(?:de|/)\s*\d+', re.IGNORECASE)
+
+# Fila de la tabla "Bienes por transportar": Nro | (Código) Descripción | Unidad | Cantidad
+RE_ITEM = re.compile(
+    r'^\s*(\d{1,3})\s+(.+?)\s+(KILOGRAMOS?|KGM|KG|TONELADAS?|TNE|TN|UNIDAD(?:ES)?|NIU|UND|UNID|GAL[OÓ]N(?:ES)?|GLN|GLL)\s+([\d.,]+)\s*$',
+    re.IGNORECASE | re.MULTILINE
+)
+
+SUFIJOS_EMPRESA = re.compile(r'\b(S\.?A\.?C\.?|S\.?A\.?A\.?|S\.?A\.?|S\.?R\.?L\.?|E\.?I\.?R\.?L\.?)\s*$', re.IGNORECASE)
+
+# ====================================================================
+# --- BLOQUE 2: Utilidades de Limpieza ---
+# ====================================================================
+def _primera(regex, texto):
+    m = regex.search(texto)
+    return m.group(1).strip() if m else ""
+
+def _cortar_etiquetas(valor):
+    """Corta el valor capturado donde empieza la siguiente etiqueta 'Algo:' de la misma línea."""
+    valor = re.split(r'\s{2,}[A-ZÁÉÍÓÚÑ][\w\s.°º]{2,30}:', valor)[0]
+    return valor.strip(" -:")
+
+def _normalizar_fecha(f):
+    p = re.split(r'[/-]', f)
+    if len(p) != 3: return f
+    return f"{p[0].zfill(2)}/{p[1].zfill(2)}/{p[2]}"
+
+def _unidad(um):
+    u = um.upper()
+    if u.startswith("KILO") or u in ("KGM", "KG"): return "KG"
+    if u.startswith("TONE") or u in ("TNE", "TN"): return "TN"
+    if u.startswith("GAL") or u in ("GLN", "GLL"): return "GLN"
+    return "UNID"
+
+# ====================================================================
+# --- BLOQUE 3: Extracción por Reglas (Mismo Esquema JSON que Vertex) ---
+# ====================================================================
+def extraer_guia_desde_texto(texto):
+    """
+    Lee una GRE digital con reglas deterministas y devuelve el mismo dict que procesar_guia_ia_vertex.
+    Los campos que no se encuentran quedan vacíos: el llamador valida y decide si escala a Vertex.
+    """
+    if not texto or not texto.strip(): return {}
+    # En la GRE Transportista el RUC del encabezado es el de la empresa de transportes: se deja a Vertex
+    if "TRANSPORTISTA" in texto[:300].upper(): return {}
+
+    m_serie = RE_SERIE.search(texto)
+    serie = f"{m_serie.group(1).upper()}-{m_serie.group(2)}" if m_serie else ""
+
+    fecha = _primera(RE_FECHA_EMISION, texto) or _primera(RE_FECHA_TRASLADO, texto) or _primera(RE_FECHA, texto)
+
+    # Remitente: etiqueta explícita o, en el formato SUNAT, la razón social que encabeza el documento antes del primer RUC
+    rucs = RE_RUC.findall(texto)
+    ruc_cliente = rucs[0] if rucs else ""
+    cliente = _cortar_etiquetas(_primera(RE_REMITENTE, texto))
+    if not cliente and rucs:
+        previo = texto[:RE_RUC.search(texto).start()]
+        candidatas = [l.strip() for l in previo.splitlines() if SUFIJOS_EMPRESA.search(l.strip())]
+        cliente = candidatas[-1] if candidatas else ""
+    cliente = re.sub(r'\s*-?\s*R\.?U\.?C\.?.*$', '', cliente, flags=re.IGNORECASE).strip(" -")
+
+    destinatario = _cortar_etiquetas(_primera(RE_DESTINATARIO, texto))
+    destinatario = re.split(r'\s*-\s*(?:Registro|R\.?U\.?C|DNI|Documento)', destinatario, flags=re.IGNORECASE)[0].strip(" -")
+
+    partida = _cortar_etiquetas(_primera(RE_PARTIDA, texto))
+    observaciones = _cortar_etiquetas(_primera(RE_OBSERVACIONES, texto))
+    if observaciones and observaciones.upper() not in partida.upper():
+        # Misma regla de oro del prompt: el predio de 'Observaciones' se concatena a la partida
+        partida = f"{partida} - {observaciones}" if partida else observaciones
+
+    items = []
+    for _, desc, um, cant in RE_ITEM.findall(texto):
+        unidad = _unidad(um)
+        cantidad = numero_como_texto(cant)
+        items.append({
+            "desc": desc.strip(),
+            "cant": cantidad,
+            "um": unidad,
+            "peso": cantidad if unidad == "KG" else "0.00"
+        })
+    peso_bruto = _primera(RE_PESO_BRUTO, texto)
+    if len(items) == 1 and items[0]["peso"] == "0.00" and peso_bruto:
+        items[0]["peso"] = numero_como_texto(peso_bruto)
+
+    return {
+        "cliente": cliente,
+        "ruc_cliente": ruc_cliente,
+        "fecha": _normalizar_fecha(fecha) if fecha else "",
+        "serie": serie,
+        "vehiculo": _primera(RE_PLACA, texto).upper(),
+        "punto_partida": partida,
+        "punto_llegada": _cortar_etiquetas(_primera(RE_LLEGADA, texto)),
+        "destinatario": destinatario,
+        "documentos_relacionados": _primera(RE_DOC_RELACIONADOS, texto),
+        "items": items
+    }
+
+# ====================================================================
+# --- BLOQUE 4: Cabecera por Página (PDFs con Varias Guías) ---
+# ====================================================================
+def serie_cabecera(texto_pagina):
+    """
+    Serie-Número que encabeza la página ('T001-1234', sin ceros a la izquierda) o "".
+    Se ignoran las líneas de 'Documentos Relacionados', que citan la serie de otra guía.
+    """
+    for linea in texto_pagina.splitlines():
+        if "RELACIONAD" in linea.upper(): continue
+        m = RE_SERIE.search(linea)
+        if m: return f"{m.group(1).upper()}-{int(m.group(2))}"
+    return ""
+
+def es_primera_pagina(texto_pagina):
+    """La página declara 'Página 1 de N': empieza una guía aunque no se lea su serie."""
+    return bool(RE_PRIMERA_PAGINA.search(texto_pagina))
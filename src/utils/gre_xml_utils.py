@@ -0,0 +1,242 @@
+# ====================================================================
+# --- BLOQUE 0: Imports ---
+# ====================================================================
+import io
+import os
+import re
+import zipfile
+import xml.etree.ElementTree as ET
+
+# ====================================================================
+# --- BLOQUE 1: Rutas UBL 2.1 (DespatchAdvice SUNAT) -> Campos de la Guía ---
+# ====================================================================
+# Las rutas se comparan por nombre local (sin namespace) y como sufijo de la pila de etiquetas abiertas,
+# así cubren tanto el formato GRE 2022 como el UBL 2.0 anterior.
+RUTAS_CAMPOS = {
+    "serie": [("DespatchAdvice", "ID")],
+    "fecha": [("DespatchAdvice", "IssueDate")],
+    "observaciones": [("DespatchAdvice", "Note")],
+    "cliente": [("DespatchSupplierParty", "Party", "PartyLegalEntity", "RegistrationName")],
+    "ruc_cliente": [
+        ("DespatchSupplierParty", "Party", "PartyIdentification", "ID"),
+        ("DespatchSupplierParty", "CustomerAssignedAccountID"),
+    ],
+    "destinatario": [("DeliveryCustomerParty", "Party", "PartyLegalEntity", "RegistrationName")],
+    "vehiculo": [
+        ("TransportHandlingUnit", "TransportEquipment", "ID"),
+        ("RoadTransport", "LicensePlateID"),
+    ],
+    "punto_partida": [
+        ("Despatch", "DespatchAddress", "AddressLine", "Line"),
+        ("Shipment", "OriginAddress", "StreetName"),
+    ],
+    "punto_llegada": [
+        ("Delivery", "DeliveryAddress", "AddressLine", "Line"),
+        ("Delivery", "DeliveryAddress", "StreetName"),
+    ],
+    "peso_bruto": [("Shipment", "GrossWeightMeasure")],
+}
+
+UNIDADES_UBL = {"KGM": "KG", "TNE": "TN", "NIU": "UNID", "GLL": "GLN", "GLI": "GLN"}
+
+def _local(tag):
+    return tag.rsplit("}", 1)[-1]
+
+def _termina_en(pila, ruta):
+    return len(pila) >= len(ruta) and tuple(pila[-len(ruta):]) == ruta
+
+def _fecha_ubl(valor):
+    """2024-03-05 -> 05/03/2024"""
+    p = str(valor).strip().split("-")
+    return f"{p[2]}/{p[1]}/{p[0]}" if len(p) == 3 else str(valor).strip()
+
+# ====================================================================
+# --- BLOQUE 2: Parser en Streaming (Memoria Constante) ---
+# ====================================================================
+def parsear_despatch_advice(fuente):
+    """
+    Convierte un XML UBL DespatchAdvice en el mismo dict que devuelve procesar_guia_ia_vertex.
+    'fuente' puede ser bytes o un archivo abierto. Se recorre con iterparse y se liberan los nodos
+    al cerrarlos, así el consumo de memoria no depende del tamaño del XML (firma, extensiones, líneas).
+    """
+    if isinstance(fuente, (bytes, bytearray)):
+        fuente = io.BytesIO(fuente)
+
+    campos = {}
+    items = []
+    documentos = []
+    item_actual = None
+    doc_actual = None
+    pila = []
+    raiz = None
+
+    for evento, elem in ET.iterparse(fuente, events=("start", "end")):
+        nombre = _local(elem.tag)
+        if evento == "start":
+            if raiz is None: raiz = elem
+            pila.append(nombre)
+            if nombre == "DespatchLine":
+                item_actual = {}
+            elif nombre == "AdditionalDocumentReference":
+                doc_actual = {}
+            continue
+
+        texto = (elem.text or "").strip()
+
+        if item_actual is not None and "DespatchLine" in pila:
+            if nombre in ("DeliveredQuantity", "Quantity") and texto:
+                item_actual["cant"] = texto
+                item_actual["unidad"] = elem.get("unitCode", "")
+            elif nombre == "Description" and texto and pila[-2:-1] == ["Item"]:
+                item_actual["desc"] = f"{item_actual.get('desc', '')} {texto}".strip()
+        elif doc_actual is not None and "AdditionalDocumentReference" in pila:
+            if nombre == "ID" and pila[-2] == "AdditionalDocumentReference" and texto:
+                doc_actual["id"] = texto
+            elif nombre == "DocumentType" and texto:
+                doc_actual["tipo"] = texto
+            elif nombre == "DocumentTypeCode" and texto and not doc_actual.get("tipo"):
+                doc_actual["tipo"] = texto
+            elif nombre == "ID" and "IssuerParty" in pila and texto:
+                doc_actual["ruc"] = texto
+        elif texto:
+            for campo, rutas in RUTAS_CAMPOS.items():
+                if campo not in campos and any(_termina_en(pila, r) for r in rutas):
+                    campos[campo] = texto
+                    if campo == "peso_bruto": campos["unidad_peso"] = elem.get("unitCode", "")
+                    break
+
+        if nombre == "DespatchLine" and item_actual is not None:
+            items.append(item_actual)
+            item_actual = None
+        elif nombre == "AdditionalDocumentReference" and doc_actual is not None:
+            documentos.append(doc_actual)
+            doc_actual = None
+
+        pila.pop()
+        elem.clear()
+        if len(pila) == 1:
+            # Hijo directo de la raíz cerrado: se suelta para que la raíz no acumule nodos vacíos
+            raiz.clear()
+
+    return _armar_guia(campos, items, documentos)
+
+def _armar_guia(campos, items, documentos):
+    partida = campos.get("punto_partida", "")
+    obs = campos.get("observaciones", "")
+    if obs and obs.upper() not in partida.upper():
+        # Regla de oro del prompt OCR: el predio de 'Observaciones' se concatena a la partida
+        partida = f"{partida} - {obs}" if partida else obs
+
+    items_guia = []
+    for it in items:
+        unidad = UNIDADES_UBL.get(it.get("unidad", "").upper(), it.get("unidad", "").upper() or "UNID")
+        cant = it.get("cant", "0")
+        items_guia.append({
+            "desc": it.get("desc", ""),
+            "cant": cant,
+            "um": unidad,
+            "peso": cant if unidad == "KG" else "0.00"
+        })
+    if len(items_guia) == 1 and items_guia[0]["peso"] == "0.00" and campos.get("peso_bruto") and campos.get("unidad_peso", "KGM") == "KGM":
+        items_guia[0]["peso"] = campos["peso_bruto"]
+
+    doc_rel = " / ".join(
+        f"Documentos Relacionados: {d.get('tipo', 'Documento')} N° {d['id']}" + (f" - RUC N° {d['ruc']}" if d.get("ruc") else "")
+        for d in documentos if d.get("id")
+    )
+
+    return {
+        "cliente": campos.get("cliente", ""),
+        "ruc_cliente": campos.get("ruc_cliente", ""),
+        "fecha": _fecha_ubl(campos["fecha"]) if campos.get("fecha") else "",
+        "serie": campos.get("serie", ""),
+        "vehiculo": campos.get("vehiculo", ""),
+        "punto_partida": partida,
+        "punto_llegada": campos.get("punto_llegada", ""),
+        "destinatario": campos.get("destinatario", ""),
+        "documentos_relacionados": doc_rel,
+        "items": items_guia
+    }
+
+# ====================================================================
+# --- BLOQUE 3: Detección de Tipo y Expansión de ZIP (XML + PDF) ---
+# ====================================================================
+RE_COMENTARIO_XML = re.compile(rb'<!--.*?-->', re.DOTALL)
+RE_PRIMERA_ETIQUETA = re.compile(rb'<(?![?!])(?:[\w.-]+:)?([\w.-]+)')
+
+def es_xml(contenido):
+    """XML cuya raíz es un DespatchAdvice (GRE UBL); cualquier otro XML o texto que empiece con '<' no cuenta."""
+    cabeza = bytes(contenido[:4096]).lstrip(b"\xef\xbb\xbf \t\r\n")
+    if not cabeza.startswith(b"<"): return False
+    raiz = RE_PRIMERA_ETIQUETA.search(RE_COMENTARIO_XML.sub(b"", cabeza))
+    return bool(raiz) and raiz.group(1) == b"DespatchAdvice"
+
+def es_zip(contenido):
+    return bytes(contenido[:4]) == b"PK\x03\x04"
+
+def extraer_guia_desde_xml(contenido):
+    """Devuelve la guía si el contenido es un DespatchAdvice válido, si no None."""
+    try:
+        datos = parsear_despatch_advice(contenido)
+        return datos if datos.get("serie") else None
+    except ET.ParseError as e:
+        print(f"XML de guía inválido: {e}")
+        return None
+
+def _expandir_zip(archivo_zip, nombre):
+    with zipfile.ZipFile(archivo_zip) as zf:
+        miembros = [m for m in zf.infolist() if not m.is_dir() and not m.filename.startswith("__MACOSX")]
+        # Primero los XML (pequeños): el PDF gemelo solo se descarta si su XML es de verdad una guía legible
+        guias_xml = {}
+        for m in miembros:
+            if not m.filename.lower().endswith(".xml"): continue
+            with zf.open(m) as f:
+                if not es_xml(f.read(4096)): continue
+            with zf.open(m) as f:
+                try:
+                    datos = parsear_despatch_advice(f)
+                except ET.ParseError as e:
+                    print(f"XML inválido en {nombre}/{m.filename}: {e}")
+                    continue
+            if datos.get("serie"):
+                guias_xml[m.filename] = datos
+        bases_xml = {os.path.splitext(n)[0].lower() for n in guias_xml}
+        for m in miembros:
+            base, ext = os.path.splitext(m.filename)
+            ext = ext.lower()
+            if m.filename in guias_xml:
+                yield {"nombre": m.filename, "datos": guias_xml[m.filename]}
+            elif ext in (".pdf", ".jpg", ".jpeg", ".png") and base.lower() not in bases_xml:
+                # Cada miembro se descomprime recién cuando el consumidor lo pide
+                yield {"nombre": m.filename, "contenido": zf.read(m)}
+
+def expandir_archivos_guia(archivos):
+    """
+    Recorre los archivos subidos o descargados y produce un documento por guía, en orden:
+      {"nombre": ..., "datos": dict}       -> XML ya interpretado (cero llamadas a Gemini)
+      {"nombre": ..., "contenido": bytes}  -> PDF/imagen que debe pasar por OCR
+    Dentro de un ZIP, si una guía trae XML y PDF con el mismo nombre base, el PDF se descarta.
+    Es un generador: un ZIP se lee desde el archivo abierto (sin copiarlo entero a memoria) y sus miembros
+    se descomprimen de uno en uno, a medida que se consumen.
+    """
+    for arc in archivos:
+        nombre = getattr(arc, "name", "archivo")
+        cabeza = arc.read(4)
+
+        if es_zip(cabeza) and hasattr(arc, "seek"):
+            arc.seek(0)
+            yield from _expandir_zip(arc, nombre)
+            continue
+
+        contenido = cabeza + arc.read()
+        if es_zip(contenido):
+            yield from _expandir_zip(io.BytesIO(contenido), nombre)
+            continue
+
+        if nombre.lower().endswith(".xml") or es_xml(contenido):
+            datos = extraer_guia_desde_xml(contenido)
+            if datos:
+                yield {"nombre": nombre, "datos": datos}
+                continue
+
+        yield {"nombre": nombre, "contenido": contenido}
@@ -0,0 +1,313 @@
+# ====================================================================
+# --- BLOQUE 0: Imports (pypdf y Pillow son opcionales: sin ellos se omite la optimización) ---
+# ====================================================================
+import io
+import hashlib
+import threading
+from collections import OrderedDict
+from src.config.settings import OCR_OPTIMIZAR_PAYLOAD, OCR_IMAGEN_MAX_PX, OCR_IMAGEN_CALIDAD_JPEG, OCR_DIVIDIR_MULTIGUIA
+from src.utils.gre_utils import serie_cabecera, es_primera_pagina
+
+try:
+    from pypdf import PdfReader, PdfWriter
+except ImportError:
+    PdfReader = PdfWriter = None
+
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+
+# ====================================================================
+# --- BLOQUE 1: Lectura Única del PDF (Texto por Página, Lector y Perfil) ---
+# ====================================================================
+# Una guía pasa por la división por guía, la vía rápida por texto, el perfil de complejidad y la poda del payload:
+# el PDF se abre una sola vez y cada etapa reutiliza el mismo lector y el texto ya extraído de cada página.
+ANALISIS_MAX = 64 # Análisis recientes por contenido (cubre de sobra una ventana de OCR_VENTANA_DOCUMENTOS)
+_analisis = OrderedDict()
+_LOCK_ANALISIS = threading.Lock()
+
+class AnalisisPdf:
+    """PDF leído una vez: lector de pypdf, texto de cada página y perfil se calculan al primer uso y quedan guardados."""
+
+    def __init__(self, contenido, textos=None):
+        self.contenido = contenido
+        self.mime = detectar_mime(contenido)
+        self.es_pdf = PdfReader is not None and bool(contenido) and bytes(contenido[:5]).startswith(b"%PDF")
+        self.lock = threading.RLock() # pypdf no es seguro entre hilos: una etapa a la vez por documento
+        self.perfil = None
+        self._lector = None
+        self._textos = textos
+
+    @property
+    def lector(self):
+        with self.lock:
+            if self._lector is None and self.es_pdf:
+                self._lector = PdfReader(io.BytesIO(self.contenido))
+            return self._lector
+
+    @property
+    def textos(self):
+        """Texto de cada página (lista vacía si es un escaneo sin capa de texto, no es PDF o pypdf falta)."""
+        with self.lock:
+            if self._textos is None:
+                try:
+                    self._textos = [pagina.extract_text() or "" for pagina in self.lector.pages] if self.es_pdf else []
+                except Exception as e:
+                    print(f"Error leyendo capa de texto del PDF: {e}")
+                    self._textos = []
+            return self._textos
+
+def _recordar_analisis(analisis):
+    clave = hashlib.sha256(analisis.contenido).digest()
+    with _LOCK_ANALISIS:
+        _analisis[clave] = analisis
+        _analisis.move_to_end(clave)
+        while len(_analisis) > ANALISIS_MAX:
+            _analisis.popitem(last=False)
+    return analisis
+
+def analizar_pdf(contenido):
+    """El AnalisisPdf de este contenido; si ya se leyó (en cualquier etapa), el mismo objeto."""
+    clave = hashlib.sha256(contenido).digest()
+    with _LOCK_ANALISIS:
+        analisis = _analisis.get(clave)
+        if analisis is not None:
+            _analisis.move_to_end(clave)
+            return analisis
+    return _recordar_analisis(AnalisisPdf(contenido))
+
+def extraer_texto_pdf(pdf_bytes, analisis=None):
+    """Texto embebido del PDF (vacío si es un escaneo, no es PDF o pypdf no está instalado)."""
+    if not pdf_bytes: return ""
+    return "\n".join((analisis or analizar_pdf(pdf_bytes)).textos)
+
+# ====================================================================
+# --- BLOQUE 2: Detección del Tipo Real (Magic Bytes) ---
+# ====================================================================
+def detectar_mime(contenido):
+    """MIME real según la cabecera del archivo; Drive entrega JPG/PNG que antes viajaban como PDF."""
+    cabeza = bytes(contenido[:12])
+    if cabeza.startswith(b"%PDF"): return "application/pdf"
+    if cabeza.startswith(b"\xff\xd8\xff"): return "image/jpeg"
+    if cabeza.startswith(b"\x89PNG\r\n\x1a\n"): return "image/png"
+    if cabeza[:4] == b"RIFF" and cabeza[8:12] == b"WEBP": return "image/webp"
+    if cabeza[:4] in (b"II*\x00", b"MM\x00*"): return "image/tiff"
+    if cabeza.startswith(b"GIF8"): return "image/gif"
+    return "application/pdf"
+
+# ====================================================================
+# --- BLOQUE 3: Poda de Páginas y Recompresión de Imágenes ---
+# ====================================================================
+def _reducir_imagen(img):
+    """Baja la imagen al lado máximo útil para OCR y la deja en un modo que JPEG acepta."""
+    if max(img.size) > OCR_IMAGEN_MAX_PX:
+        img.thumbnail((OCR_IMAGEN_MAX_PX, OCR_IMAGEN_MAX_PX))
+    if img.mode not in ("RGB", "L"):
+        img = img.convert("RGB")
+    return img
+
+def _optimizar_imagen(contenido):
+    if Image is None: return contenido, None
+    with Image.open(io.BytesIO(contenido)) as img:
+        img = _reducir_imagen(img)
+        salida = io.BytesIO()
+        img.save(salida, format="JPEG", quality=OCR_IMAGEN_CALIDAD_JPEG, optimize=True)
+    return salida.getvalue(), "image/jpeg"
+
+def _huella_pagina(pagina):
+    """Huella del contenido visible: flujo de dibujo + datos de las imágenes que referencia."""
+    h = hashlib.sha256()
+    contenido = pagina.get_contents()
+    h.update(contenido.get_data() if contenido is not None else b"")
+    recursos = pagina.get("/Resources")
+    xobjs = recursos.get_object().get("/XObject") if recursos else None
+    if xobjs:
+        for nombre in sorted(xobjs.get_object().keys()):
+            try:
+                h.update(xobjs.get_object()[nombre].get_object().get_data())
+            except Exception:
+                h.update(str(nombre).encode())
+    return h.hexdigest()
+
+def _pagina_en_blanco(pagina, texto):
+    recursos = pagina.get("/Resources")
+    tiene_xobjs = bool(recursos and recursos.get_object().get("/XObject"))
+    if tiene_xobjs or texto.strip(): return False
+    contenido = pagina.get_contents()
+    return contenido is None or len(contenido.get_data().strip()) < 64
+
+def _optimizar_pdf(analisis):
+    """Devuelve (pdf_optimizado, páginas_eliminadas). Sin pypdf, el PDF queda igual."""
+    pdf_bytes = analisis.contenido
+    if not analisis.es_pdf: return pdf_bytes, 0
+    with analisis.lock:
+        textos = analisis.textos
+        escritor = PdfWriter()
+        vistas = set()
+        eliminadas = 0
+
+        for i, pagina in enumerate(analisis.lector.pages):
+            huella = _huella_pagina(pagina)
+            if huella in vistas or _pagina_en_blanco(pagina, textos[i] if i < len(textos) else ""):
+                eliminadas += 1
+                continue
+            vistas.add(huella)
+            escritor.add_page(pagina)
+
+    if not escritor.pages: return pdf_bytes, 0
+
+    if Image is not None:
+        for pagina in escritor.pages:
+            for imagen in pagina.images:
+                try:
+                    original = imagen.image
+                    if max(original.size) > OCR_IMAGEN_MAX_PX:
+                        imagen.replace(_reducir_imagen(original), quality=OCR_IMAGEN_CALIDAD_JPEG)
+                except Exception as e:
+                    print(f"No se pudo recomprimir imagen '{imagen.name}': {e}")
+
+    if hasattr(escritor, "compress_identical_objects"):
+        escritor.compress_identical_objects()
+    salida = io.BytesIO()
+    escritor.write(salida)
+    return salida.getvalue(), eliminadas
+
+def optimizar_payload_ocr(contenido, analisis=None):
+    """
+    Prepara el archivo antes de enviarlo a Gemini (reutiliza el AnalisisPdf si la guía ya se leyó).
+    Devuelve (bytes, mime_type, reporte) con reporte = {mime, bytes_originales, bytes_finales, bytes_ahorrados, paginas_eliminadas}.
+    Si la versión optimizada no es más pequeña (o algo falla) se envía el original con su MIME real.
+    """
+    mime = detectar_mime(contenido)
+    final, mime_final, eliminadas = contenido, mime, 0
+
+    if OCR_OPTIMIZAR_PAYLOAD:
+        try:
+            if mime == "application/pdf":
+                candidato, eliminadas = _optimizar_pdf(analisis or analizar_pdf(contenido))
+                mime_candidato = mime
+            else:
+                candidato, mime_candidato = _optimizar_imagen(contenido)
+            if mime_candidato and len(candidato) < len(contenido):
+                final, mime_final = candidato, mime_candidato
+            else:
+                eliminadas = 0
+        except Exception as e:
+            print(f"Optimización de payload omitida ({mime}): {e}")
+            eliminadas = 0
+
+    reporte = {
+        "mime": mime_final,
+        "bytes_originales": len(contenido),
+        "bytes_finales": len(final),
+        "bytes_ahorrados": len(contenido) - len(final),
+        "paginas_eliminadas": eliminadas
+    }
+    return final, mime_final, reporte
+
+# ====================================================================
+# --- BLOQUE 4: Perfil del Documento (para Elegir Modelo por Complejidad) ---
+# ====================================================================
+def _pagina_con_imagen(pagina):
+    recursos = pagina.get("/Resources")
+    xobjs = recursos.get_object().get("/XObject") if recursos else None
+    if not xobjs: return False
+    return any(xobjs.get_object()[n].get_object().get("/Subtype") == "/Image" for n in xobjs.get_object().keys())
+
+def perfil_documento(contenido, analisis=None):
+    """
+    Señales locales y baratas de cuán difícil será el OCR:
+    {mime, bytes, paginas, paginas_con_texto, proporcion_imagen}. Una imagen suelta cuenta como una página escaneada.
+    """
+    mime = detectar_mime(contenido)
+    perfil = {"mime": mime, "bytes": len(contenido), "paginas": 1, "paginas_con_texto": 0, "proporcion_imagen": 1.0}
+    if mime != "application/pdf" or PdfReader is None:
+        return perfil
+    analisis = analisis or analizar_pdf(contenido)
+    with analisis.lock:
+        if analisis.perfil is not None: return dict(analisis.perfil)
+        try:
+            paginas = analisis.lector.pages
+            n = len(paginas) or 1
+            perfil["paginas"] = n
+            perfil["paginas_con_texto"] = sum(1 for t in analisis.textos if len(t.strip()) >= 50)
+            perfil["proporcion_imagen"] = round(sum(1 for p in paginas if _pagina_con_imagen(p)) / n, 2)
+        except Exception as e:
+            print(f"Perfil de documento incompleto: {e}")
+        analisis.perfil = perfil
+    return dict(perfil)
+
+# ====================================================================
+# --- BLOQUE 5: División de PDFs con Varias Guías (una por página o por par de páginas) ---
+# ====================================================================
+def limites_guias(textos_paginas):
+    """
+    Agrupa los índices de página por guía usando la capa de texto: empieza una guía nueva cuando
+    la cabecera trae una serie distinta a la actual o la página dice 'Página 1 de N'.
+    Las páginas sin cabecera (reverso, anexo) se quedan con la guía anterior.
+    """
+    grupos, serie_actual = [], ""
+    for i, texto in enumerate(textos_paginas):
+        serie = serie_cabecera(texto)
+        if not grupos:
+            nueva = True
+        elif serie:
+            # Una guía cuya primera página no dejó leer la serie la adopta de la siguiente
+            nueva = bool(serie_actual) and serie != serie_actual
+        else:
+            nueva = es_primera_pagina(texto)
+        if nueva:
+            grupos.append([i])
+            serie_actual = serie
+        else:
+            grupos[-1].append(i)
+            serie_actual = serie_actual or serie
+    return grupos
+
+def dividir_pdf_por_guia(contenido, analisis=None):
+    """
+    Lista de PDFs, uno por guía. Sin capa de texto, sin pypdf o con una sola guía devuelve [contenido].
+    Cada segmento queda registrado con el texto de sus páginas: las etapas siguientes no vuelven a extraerlo.
+    """
+    if PdfReader is None or detectar_mime(contenido) != "application/pdf": return [contenido]
+    analisis = analisis or analizar_pdf(contenido)
+    try:
+        with analisis.lock:
+            lector = analisis.lector
+            if lector is None or len(lector.pages) < 2: return [contenido]
+            textos = analisis.textos
+            if not any(t.strip() for t in textos): return [contenido] # Escaneo: sin cabeceras legibles localmente
+            grupos = limites_guias(textos)
+            if len(grupos) < 2: return [contenido]
+
+            segmentos = []
+            for indices in grupos:
+                escritor = PdfWriter()
+                for i in indices:
+                    escritor.add_page(lector.pages[i])
+                salida = io.BytesIO()
+                escritor.write(salida)
+                segmentos.append(salida.getvalue())
+                _recordar_analisis(AnalisisPdf(segmentos[-1], textos=[textos[i] for i in indices]))
+        return segmentos
+    except Exception as e:
+        print(f"División por guía omitida: {e}")
+        return [contenido]
+
+def separar_guias_multipagina(documentos):
+    """
+    Recorre los documentos de expandir_archivos_guia y parte los PDF que traen varias guías:
+    cada guía sale como un documento propio y se extrae en paralelo como cualquier otro.
+    """
+    for doc in documentos:
+        if not OCR_DIVIDIR_MULTIGUIA or "contenido" not in doc:
+            yield doc
+            continue
+        segmentos = dividir_pdf_por_guia(doc["contenido"])
+        if len(segmentos) == 1:
+            yield doc
+            continue
+        print(f"{doc['nombre']}: {len(segmentos)} guías detectadas en un solo PDF")
+        for n, segmento in enumerate(segmentos, start=1):
+            yield {"nombre": f"{doc['nombre']} [{n}/{len(segmentos)}]", "contenido": segmento}
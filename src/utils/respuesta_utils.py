@@ -0,0 +1,154 @@
+# ====================================================================
+# --- BLOQUE 0: Imports ---
+# ====================================================================
+import re
+import json
+
+# ====================================================================
+# --- BLOQUE 1: Esquema de Respuesta con Claves Compactas ---
+# ====================================================================
+# Gemini responde con claves cortas (menos tokens de salida); aquí se traducen al esquema de siempre
+CLAVES_COMPACTAS = {
+    "cl": "cliente",
+    "ruc": "ruc_cliente",
+    "fe": "fecha",
+    "se": "serie",
+    "ve": "vehiculo",
+    "pp": "punto_partida",
+    "pl": "punto_llegada",
+    "de": "destinatario",
+    "dr": "documentos_relacionados",
+    "it": "items",
+    "ix": "indice",
+}
+CLAVES_COMPACTAS_ITEM = {"d": "desc", "c": "cant", "u": "um", "p": "peso"}
+CLAVE_COMPACTA = {largo: corto for corto, largo in CLAVES_COMPACTAS.items()}
+
+def _texto():
+    return {"type": "STRING"}
+
+ESQUEMA_ITEM = {
+    "type": "OBJECT",
+    "properties": {c: _texto() for c in CLAVES_COMPACTAS_ITEM},
+    "required": list(CLAVES_COMPACTAS_ITEM),
+}
+
+def construir_esquema_guia(campos, lote=False):
+    """
+    response_schema (subconjunto OpenAPI de Vertex) para los campos pedidos.
+    En modo lote la respuesta es un arreglo y cada guía añade 'ix' con su índice.
+    """
+    propiedades = {}
+    for campo in campos:
+        corta = CLAVE_COMPACTA[campo]
+        propiedades[corta] = {"type": "ARRAY", "items": ESQUEMA_ITEM} if campo == "items" else _texto()
+    if lote:
+        propiedades["ix"] = {"type": "INTEGER"}
+    objeto = {
+        "type": "OBJECT",
+        "properties": propiedades,
+        "required": list(propiedades),
+    }
+    return {"type": "ARRAY", "items": objeto} if lote else objeto
+
+def instrucciones_claves_compactas(campos):
+    """Línea para el prompt que asocia cada clave compacta con el campo descrito en la ESTRUCTURA."""
+    pares = [f'"{CLAVE_COMPACTA[c]}"={c}' for c in campos]
+    pares_item = [f'"{corta}"={larga}' for corta, larga in CLAVES_COMPACTAS_ITEM.items()]
+    return (
+        "\n    CLAVES DE SALIDA: responde usando estas claves compactas en lugar de los nombres de la ESTRUCTURA: "
+        + ", ".join(pares) + ". Dentro de cada item: " + ", ".join(pares_item) + ".\n    "
+    )
+
+# ====================================================================
+# --- BLOQUE 2: Reparación Local del JSON (sin volver a llamar al modelo) ---
+# ====================================================================
+RE_CERCO = re.compile(r'^\s*```(?:json|JSON)?\s*|\s*```\s*$')
+RE_COMA_FINAL = re.compile(r',\s*([}\]])')
+
+def reparar_json(texto):
+    """
+    Intenta leer la respuesta del modelo aunque venga con cercos ```json, texto alrededor
+    o comas finales. Devuelve el objeto/arreglo o None si no hay forma de recuperarlo.
+    """
+    if not texto: return None
+    t = RE_CERCO.sub('', str(texto).strip())
+    try:
+        return json.loads(t)
+    except ValueError:
+        pass
+
+    inicios = [i for i in (t.find('{'), t.find('[')) if i >= 0]
+    if not inicios: return None
+    inicio = min(inicios)
+    fin = t.rfind('}' if t[inicio] == '{' else ']')
+    if fin <= inicio: return None
+    t = RE_COMA_FINAL.sub(r'\1', t[inicio:fin + 1])
+    try:
+        return json.loads(t)
+    except ValueError:
+        return None
+
+# ====================================================================
+# --- BLOQUE 3: Normalización al Esquema de la Guía ---
+# ====================================================================
+# Subir al cambiar la reparación o la normalización: forma parte de la versión de la caché de extracciones
+VERSION_NORMALIZACION = 1
+
+def numero_como_texto(valor):
+    """'1,500.00 KG' -> '1500.00'; '1.500,5' -> '1500.5'; vacío o ilegible -> '0.00'."""
+    v = re.sub(r'[^\d.,-]', '', str(valor if valor is not None else ''))
+    if ',' in v and '.' in v:
+        # El separador que aparece al final es el decimal
+        v = v.replace('.', '').replace(',', '.') if v.rfind(',') > v.rfind('.') else v.replace(',', '')
+    elif ',' in v:
+        v = v.replace(',', '.')
+    if v.count('.') > 1:
+        partes = v.split('.')
+        v = "".join(partes[:-1]) + '.' + partes[-1]
+    try:
+        float(v)
+        return v
+    except ValueError:
+        return "0.00"
+
+def _expandir(obj, mapa):
+    return {mapa.get(k, k): v for k, v in obj.items()}
+
+def normalizar_guia(obj):
+    """Claves compactas -> esquema largo, textos sin espacios sobrantes y cantidades/pesos numéricos."""
+    if not isinstance(obj, dict): return None
+    datos = _expandir(obj, CLAVES_COMPACTAS)
+    for campo, valor in list(datos.items()):
+        if campo == "items" or campo == "indice": continue
+        datos[campo] = "" if valor is None else str(valor).strip()
+
+    items = datos.get("items")
+    if isinstance(items, dict): items = [items]
+    items_norm = []
+    for it in (items if isinstance(items, list) else []):
+        if not isinstance(it, dict): continue
+        it = _expandir(it, CLAVES_COMPACTAS_ITEM)
+        items_norm.append({
+            "desc": str(it.get("desc") or "").strip(),
+            "cant": numero_como_texto(it.get("cant")),
+            "um": str(it.get("um") or "").strip().upper(),
+            "peso": numero_como_texto(it.get("peso")),
+        })
+    if "items" in datos or items_norm:
+        datos["items"] = items_norm
+    return datos
+
+def interpretar_respuesta_guia(texto):
+    """Texto del modelo -> dict de la guía normalizado, o None si el JSON es irrecuperable."""
+    obj = reparar_json(texto)
+    if isinstance(obj, list) and len(obj) == 1: obj = obj[0]
+    return normalizar_guia(obj)
+
+def interpretar_respuesta_lote(texto):
+    """Texto del modelo en modo lote -> lista de dicts normalizados (vacía si es irrecuperable)."""
+    obj = reparar_json(texto)
+    if isinstance(obj, dict):
+        obj = obj.get("documentos") or obj.get("guias") or [obj]
+    if not isinstance(obj, list): return []
+    return [g for g in (normalizar_guia(o) for o in obj) if g]
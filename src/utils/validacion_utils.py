@@ -0,0 +1,91 @@
+# ====================================================================
+# --- BLOQUE 0: Imports ---
+# ====================================================================
+import re
+from datetime import datetime
+
+# ====================================================================
+# --- BLOQUE 1: Validadores de Campos de la Guía (GRE) ---
+# ====================================================================
+CAMPOS_OBLIGATORIOS_GUIA = [
+    "cliente", "ruc_cliente", "fecha", "serie", "vehiculo",
+    "punto_partida", "punto_llegada", "destinatario", "items"
+]
+
+FACTORES_RUC = [5, 4, 3, 2, 7, 6, 5, 4, 3, 2]
+
+def ruc_valido(ruc):
+    """RUC peruano: 11 dígitos, prefijo de contribuyente conocido y dígito verificador módulo 11 (SUNAT)."""
+    r = re.sub(r'\D', '', str(ruc or ''))
+    if len(r) != 11 or r[:2] not in ("10", "15", "16", "17", "20"): return False
+    resto = 11 - sum(int(d) * f for d, f in zip(r[:10], FACTORES_RUC)) % 11
+    return int(r[10]) == resto % 10
+
+def fecha_valida(fecha):
+    try:
+        datetime.strptime(str(fecha or '').strip(), "%d/%m/%Y")
+        return True
+    except ValueError:
+        return False
+
+def serie_valida(serie):
+    """Serie-Número de guía. Ejemplo: T001-000000, EG07-00001221."""
+    return bool(re.fullmatch(r'[A-Z0-9]{4}-\d{1,8}', str(serie or '').strip().upper()))
+
+# Placas peruanas: ABC-123 (antigua), A1B-123 / AB1-123 (actual) y motos 1234-AB / AB-1234
+RE_PLACA_PERU = re.compile(r'(?<![A-Z0-9])(?:[A-Z0-9]{3}-?\d{3}|\d{4}-?[A-Z]{2}|[A-Z]{2}-?\d{4})(?![A-Z0-9])')
+
+def placa_valida(placa):
+    """Al menos una placa peruana reconocible (el campo puede traer tracto y carreta: 'ABC-123 / XYZ-456')."""
+    return bool(RE_PLACA_PERU.search(str(placa or '').upper().strip()))
+
+def numero_valido(valor):
+    try:
+        float(str(valor).replace(',', ''))
+        return True
+    except (TypeError, ValueError):
+        return False
+
+def items_validos(items):
+    """Lista no vacía; cada item con descripción y cantidad / peso numéricos."""
+    if not isinstance(items, list) or not items: return False
+    for it in items:
+        if not isinstance(it, dict) or not str(it.get('desc', '')).strip(): return False
+        if not numero_valido(it.get('cant')) or not numero_valido(it.get('peso')): return False
+    return True
+
+# ====================================================================
+# --- BLOQUE 2: Revisión Completa de una Extracción ---
+# ====================================================================
+# Subir al cambiar un validador: forma parte de la versión de la caché de extracciones (la revisión depende de ellos)
+VERSION_VALIDADORES = 1
+
+VALIDADORES_CAMPO = {
+    "ruc_cliente": ruc_valido,
+    "fecha": fecha_valida,
+    "serie": serie_valida,
+    "vehiculo": placa_valida,
+    "items": items_validos,
+}
+
+# Regla de cada campo, en palabras, para pedir al modelo que lo vuelva a leer
+REGLAS_CAMPO = {
+    "ruc_cliente": "RUC de 11 dígitos con dígito verificador válido",
+    "fecha": "fecha en formato dd/mm/yyyy",
+    "serie": "Serie-Número de la guía, ej. T001-000000",
+    "vehiculo": "placa peruana, ej. ABC-123 o A1B-123",
+    "items": "cada item con descripción y cantidad / peso numéricos",
+}
+
+def campos_invalidos_guia(datos, campos=None):
+    """Devuelve la lista de campos vacíos o que no pasan su validador."""
+    if not isinstance(datos, dict): return list(campos or CAMPOS_OBLIGATORIOS_GUIA)
+    invalidos = []
+    for campo in (campos or CAMPOS_OBLIGATORIOS_GUIA):
+        valor = datos.get(campo)
+        validador = VALIDADORES_CAMPO.get(campo)
+        if validador:
+            if not validador(valor): invalidos.append(campo)
+        elif not str(valor or '').strip():
+            invalidos.append(campo)
+    return invalidos
@@ -0,0 +1,15 @@
+import os
+import sys
+
+# Los módulos se importan como en la app (src.…), desde la raíz del repositorio
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Antes del primer import de src.config.settings: modelo simulado, caché y métricas en una carpeta temporal
+# y esperas acortadas (las pruebas miden el comportamiento, no los segundos de espera)
+os.environ.setdefault("SIMULADO_ESCALA", "0.01")
+os.environ.setdefault("VERTEX_BACKOFF_BASE_S", "0.01")
+os.environ.setdefault("VERTEX_BACKOFF_MAX_S", "0.05")
+os.environ["COLA_ESCRITURA_DIR"] = ""
+os.environ.setdefault("GCP_PROJECT_ID", "proyecto-pruebas") # Sin .streamlit/secrets.toml: settings no consulta st.secrets
+from src.services.benchmark_ocr import preparar_entorno
+preparar_entorno()
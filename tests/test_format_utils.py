@@ -0,0 +1,35 @@
+import pytest
+
+from src.utils.format_utils import formatear_guia, numero_guia_canonico
+
+@pytest.mark.parametrize("numero, esperado", [
+    ("EG01-00000045", "EG01-45"),
+    ("T01-0001234", "T01-1234"),
+    ("FF-0007", "FF-7"),
+    ("T001-00001234", "T001-1234"),
+    ("FFF01-0001", "FFF01-1"),
+])
+def test_formatear_guia_conserva_la_serie_completa(numero, esperado):
+    assert formatear_guia(numero) == esperado
+
+def test_formatear_guia_no_recorta_la_serie():
+    # Regresión: sin ancla, la serie se tomaba desde el segundo carácter ('FF01-1')
+    assert formatear_guia("FFF01-0001") == "FFF01-1"
+    assert formatear_guia("N° EG01-0001") == "EG01-1"
+
+def test_formatear_guia_sin_serie_se_devuelve_igual():
+    assert formatear_guia("S/N") == "S/N"
+    assert formatear_guia("") == ""
+
+@pytest.mark.parametrize("numero", ["T001-00001234", "t001 - 1234", "N° T001-1234", "n° t001_-_00001234"])
+def test_numero_guia_canonico_unifica_variantes(numero):
+    assert numero_guia_canonico(numero) == "T001-1234"
+
+@pytest.mark.parametrize("numero, esperado", [
+    ("EG-0012", "EG-12"), ("V01-0003", "V01-3"), ("EG01-0045", "EG01-45"), ("FFF01-0001", "FFF01-1"),
+])
+def test_numero_guia_canonico_conserva_la_serie_completa(numero, esperado):
+    assert numero_guia_canonico(numero) == esperado
+
+def test_numero_guia_canonico_sin_guion():
+    assert numero_guia_canonico("T0011234.pdf") == "T11234PDF"
@@ -0,0 +1,42 @@
+from src.utils.gre_utils import extraer_guia_desde_texto, serie_cabecera
+
+GUIA = """GUIA DE REMISION ELECTRONICA REMITENTE
+T001-00000123
+Fecha de emision: 5/3/2025
+Remitente: CAMPOSOL S.A.
+RUC: 20340584237
+Bienes por transportar
+{items}
+Peso bruto total (KGM): {peso}"""
+
+def test_cantidades_con_separador_de_miles_europeo():
+    guia = extraer_guia_desde_texto(GUIA.format(items="1 RESIDUOS ORGANICOS KILOGRAMOS 1.500,50", peso="1.500,50"))
+    assert guia["items"][0]["cant"] == "1500.50"
+    assert guia["items"][0]["peso"] == "1500.50"
+
+def test_cantidades_con_separador_de_miles_ingles():
+    guia = extraer_guia_desde_texto(GUIA.format(items="1 CARTON KILOGRAMOS 2,000.25", peso="2,000.25"))
+    assert guia["items"][0]["cant"] == "2000.25"
+
+def test_item_no_kg_toma_el_peso_bruto():
+    guia = extraer_guia_desde_texto(GUIA.format(items="1 ENVASES VACIOS UNIDADES 12", peso="1.250,00"))
+    item = guia["items"][0]
+    assert (item["um"], item["cant"], item["peso"]) == ("UNID", "12", "1250.00")
+
+def test_serie_y_fecha_normalizadas():
+    guia = extraer_guia_desde_texto(GUIA.format(items="1 CARTON KILOGRAMOS 10", peso="10"))
+    assert guia["fecha"] == "05/03/2025"
+    assert guia["serie"].startswith("T001-")
+
+def test_texto_vacio():
+    assert extraer_guia_desde_texto("   ") == {}
+
+def test_telefono_o_texto_no_es_serie():
+    texto = "Telf-1234567\nVent-001\n" + GUIA.replace("T001-00000123", "Guía sin serie legible").format(
+        items="1 CARTON KILOGRAMOS 10", peso="10")
+    assert extraer_guia_desde_texto(texto)["serie"] == ""
+    assert serie_cabecera("Telf-1234567") == serie_cabecera("VENT-001") == ""
+
+def test_variantes_de_serie_sunat():
+    assert serie_cabecera("EG07-00000012") == "EG07-12"
+    assert serie_cabecera("V001 Nro. 55") == "V001-55"
@@ -0,0 +1,86 @@
+import io
+import zipfile
+from src.utils.gre_xml_utils import es_xml, es_zip, extraer_guia_desde_xml, parsear_despatch_advice, expandir_archivos_guia
+
+XML = b"""<?xml version="1.0" encoding="UTF-8"?>
+<!-- GRE de prueba -->
+<DespatchAdvice xmlns="urn:oasis:names:specification:ubl:schema:xsd:DespatchAdvice-2"
+    xmlns:cac="urn:oasis:names:specification:ubl:schema:xsd:CommonAggregateComponents-2"
+    xmlns:cbc="urn:oasis:names:specification:ubl:schema:xsd:CommonBasicComponents-2">
+  <cbc:ID>T001-00000123</cbc:ID>
+  <cbc:IssueDate>2025-03-05</cbc:IssueDate>
+  <cbc:Note>Fundo Casuarinas</cbc:Note>
+  <cac:AdditionalDocumentReference>
+    <cbc:ID>F001-456</cbc:ID>
+    <cbc:DocumentType>Factura</cbc:DocumentType>
+    <cac:IssuerParty><cac:PartyIdentification><cbc:ID>20100070970</cbc:ID></cac:PartyIdentification></cac:IssuerParty>
+  </cac:AdditionalDocumentReference>
+  <cac:DespatchSupplierParty><cac:Party>
+    <cac:PartyIdentification><cbc:ID>20340584237</cbc:ID></cac:PartyIdentification>
+    <cac:PartyLegalEntity><cbc:RegistrationName>CAMPOSOL S.A.</cbc:RegistrationName></cac:PartyLegalEntity>
+  </cac:Party></cac:DespatchSupplierParty>
+  <cac:DeliveryCustomerParty><cac:Party>
+    <cac:PartyLegalEntity><cbc:RegistrationName>INECOVE S.A.C.</cbc:RegistrationName></cac:PartyLegalEntity>
+  </cac:Party></cac:DeliveryCustomerParty>
+  <cac:Shipment>
+    <cbc:GrossWeightMeasure unitCode="KGM">350.00</cbc:GrossWeightMeasure>
+    <cac:Delivery><cac:DeliveryAddress><cac:AddressLine><cbc:Line>Relleno Sanitario Milagro</cbc:Line></cac:AddressLine></cac:DeliveryAddress></cac:Delivery>
+    <cac:TransportHandlingUnit><cac:TransportEquipment><cbc:ID>ABC-123</cbc:ID></cac:TransportEquipment></cac:TransportHandlingUnit>
+    <cac:Delivery><cac:Despatch><cac:DespatchAddress><cac:AddressLine><cbc:Line>Planta Chao</cbc:Line></cac:AddressLine></cac:DespatchAddress></cac:Despatch></cac:Delivery>
+  </cac:Shipment>
+  <cac:DespatchLine>
+    <cbc:DeliveredQuantity unitCode="NIU">12</cbc:DeliveredQuantity>
+    <cac:Item><cbc:Description>ENVASES VACIOS</cbc:Description></cac:Item>
+  </cac:DespatchLine>
+</DespatchAdvice>"""
+
+def _archivo(nombre, contenido):
+    f = io.BytesIO(contenido)
+    f.name = nombre
+    return f
+
+def test_es_xml_solo_con_raiz_despatch_advice():
+    assert es_xml(XML)
+    assert es_xml(b"\xef\xbb\xbf  " + XML)
+    assert not es_xml(b'<?xml version="1.0"?><Invoice><ID>F001-1</ID></Invoice>')
+    assert not es_xml(b"<html><body>DespatchAdvice</body></html>")
+    assert not es_xml(b"%PDF-1.4")
+
+def test_es_zip():
+    assert es_zip(b"PK\x03\x04resto")
+    assert not es_zip(b"%PDF")
+
+def test_campos_de_la_guia():
+    guia = parsear_despatch_advice(XML)
+    assert guia["serie"] == "T001-00000123"
+    assert guia["fecha"] == "05/03/2025"
+    assert (guia["cliente"], guia["ruc_cliente"]) == ("CAMPOSOL S.A.", "20340584237")
+    assert guia["destinatario"] == "INECOVE S.A.C."
+    assert guia["vehiculo"] == "ABC-123"
+    assert guia["punto_partida"] == "Planta Chao - Fundo Casuarinas"
+    assert guia["punto_llegada"] == "Relleno Sanitario Milagro"
+    assert guia["documentos_relacionados"] == "Documentos Relacionados: Factura N° F001-456 - RUC N° 20100070970"
+
+def test_item_unico_no_kg_toma_el_peso_bruto():
+    assert parsear_despatch_advice(XML)["items"] == [{"desc": "ENVASES VACIOS", "cant": "12", "um": "UNID", "peso": "350.00"}]
+
+def test_xml_invalido_o_sin_serie():
+    assert extraer_guia_desde_xml(b"<DespatchAdvice><ID>T001-1</ID>") is None
+    assert extraer_guia_desde_xml(b"<DespatchAdvice></DespatchAdvice>") is None
+    assert extraer_guia_desde_xml(XML)["serie"] == "T001-00000123"
+
+def test_zip_descarta_el_pdf_gemelo_del_xml():
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w") as zf:
+        zf.writestr("T001-123.xml", XML)
+        zf.writestr("T001-123.pdf", b"%PDF-1.4 gemelo")
+        zf.writestr("T001-124.pdf", b"%PDF-1.4 sin xml")
+        zf.writestr("__MACOSX/._T001-124.pdf", b"basura")
+    docs = list(expandir_archivos_guia([_archivo("lote.zip", buffer.getvalue())]))
+    assert [d["nombre"] for d in docs] == ["T001-123.xml", "T001-124.pdf"]
+    assert docs[0]["datos"]["serie"] == "T001-00000123"
+    assert docs[1]["contenido"] == b"%PDF-1.4 sin xml"
+
+def test_archivos_sueltos():
+    docs = list(expandir_archivos_guia([_archivo("guia.xml", XML), _archivo("guia.pdf", b"%PDF-1.4 x")]))
+    assert "datos" in docs[0] and docs[1] == {"nombre": "guia.pdf", "contenido": b"%PDF-1.4 x"}
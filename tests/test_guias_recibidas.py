@@ -0,0 +1,11 @@
+from datetime import datetime
+from src.services.guias_recibidas import MARCA_PROCESADA, texto_marca, mes_de_fecha
+
+def test_marca_de_la_columna_h_con_el_formato_de_siempre():
+    marca = texto_marca(datetime(2025, 3, 5, 14, 7))
+    assert marca == "✅ Nuevo: 05/03/2025 14:07"
+    assert MARCA_PROCESADA in marca
+
+def test_mes_de_fecha():
+    assert mes_de_fecha("15/03/2025") == "Marzo 2025"
+    assert mes_de_fecha("") == "Sin Fecha"
@@ -0,0 +1,59 @@
+import random
+from src.utils.pdf_utils import limites_guias, dividir_pdf_por_guia, separar_guias_multipagina, extraer_texto_pdf
+from src.utils.gre_sintetica import guia_sintetica, generar_pdf_guias, lineas_guia, pdf_texto
+
+def _cabecera(serie, pagina=None, total=None):
+    texto = f"GUIA DE REMISION ELECTRONICA REMITENTE\n{serie}"
+    return texto + (f"\nPagina {pagina} de {total}" if pagina else "")
+
+def test_una_guia_por_serie():
+    assert limites_guias([_cabecera("T001-1"), _cabecera("T001-2"), _cabecera("T001-3")]) == [[0], [1], [2]]
+
+def test_misma_serie_en_varias_paginas():
+    textos = [_cabecera("T001-00000010", 1, 2), _cabecera("T001-10", 2, 2), _cabecera("T001-11", 1, 1)]
+    assert limites_guias(textos) == [[0, 1], [2]]
+
+def test_pagina_sin_cabecera_se_queda_con_la_anterior():
+    assert limites_guias([_cabecera("T001-1"), "Anexo: fotos del traslado", _cabecera("T002-1")]) == [[0, 1], [2]]
+
+def test_pagina_1_de_n_sin_serie_empieza_guia():
+    assert limites_guias([_cabecera("T001-1"), "Pagina 1 de 1\nRemitente: X"]) == [[0], [1]]
+
+def test_primera_pagina_sin_serie_adopta_la_siguiente():
+    assert limites_guias(["Pagina 1 de 2\nserie ilegible", _cabecera("T001-5", 2, 2)]) == [[0, 1]]
+
+def test_serie_de_documentos_relacionados_no_parte():
+    textos = [_cabecera("T001-1", 1, 2), "Documentos Relacionados: T009-77\nPeso bruto total (KGM): 10"]
+    assert limites_guias(textos) == [[0, 1]]
+
+def test_telefono_en_pagina_de_continuacion_no_parte():
+    textos = [_cabecera("T001-1", 1, 2), "Contacto Telf-1234567\nVent-001\nInformacion adicional del traslado"]
+    assert limites_guias(textos) == [[0, 1]]
+
+def test_sin_paginas():
+    assert limites_guias([]) == []
+
+def test_dividir_pdf_con_tres_guias():
+    rng = random.Random(3)
+    guias = [guia_sintetica(rng) for _ in range(3)]
+    segmentos = dividir_pdf_por_guia(generar_pdf_guias(guias, paginas_por_guia=2))
+    assert len(segmentos) == 3
+    for guia, segmento in zip(guias, segmentos):
+        assert guia["serie"] in extraer_texto_pdf(segmento)
+
+def test_pdf_de_una_guia_con_telefono_no_se_divide():
+    guia = guia_sintetica(random.Random(5))
+    contenido = pdf_texto([lineas_guia(guia, 1, 2), ["Contacto Telf-1234567", "Vent-001", "Anexo del traslado"]])
+    assert dividir_pdf_por_guia(contenido) == [contenido]
+
+def test_separar_deja_intactos_xml_y_pdf_de_una_guia():
+    rng = random.Random(4)
+    unica = generar_pdf_guias([guia_sintetica(rng)], paginas_por_guia=2)
+    doble = generar_pdf_guias([guia_sintetica(rng), guia_sintetica(rng)])
+    docs = list(separar_guias_multipagina([
+        {"nombre": "a.xml", "datos": {"serie": "T001-1"}},
+        {"nombre": "b.pdf", "contenido": unica},
+        {"nombre": "c.pdf", "contenido": doble},
+    ]))
+    assert [d["nombre"] for d in docs] == ["a.xml", "b.pdf", "c.pdf [1/2]", "c.pdf [2/2]"]
+    assert docs[1]["contenido"] == unica
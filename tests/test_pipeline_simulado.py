@@ -0,0 +1,24 @@
+from src.services.benchmark_ocr import ejecutar_benchmark
+
+def test_exactitud_y_cache_en_la_segunda_pasada():
+    r = ejecutar_benchmark(n_documentos=12, semilla=1, pasadas=2, latencia="fija:0")
+    primera, segunda = r["pasadas"]
+    assert primera["correctas"] == primera["guias"] == r["corpus"]["guias"]
+    assert primera["fallidas"] == 0 and primera["llamadas"] > 0
+    assert segunda["correctas"] == segunda["guias"]
+    assert segunda["llamadas"] == 0 and segunda["tasa_cache"] > 0
+
+def test_404_y_429_se_recuperan_por_otra_ruta():
+    r = ejecutar_benchmark(n_documentos=12, semilla=2, pasadas=1, latencia="fija:0", tasa_429=0.3,
+                           modelos_404=["gemini-2.0-flash-001"])
+    pasada = r["pasadas"][0]
+    assert pasada["correctas"] == pasada["guias"] and pasada["fallidas"] == 0
+    assert r["errores_inyectados"]["404"] >= 1 and r["errores_inyectados"]["429"] >= 1
+    assert pasada["por_resultado"].get("404") and pasada["por_resultado"].get("cuota")
+    assert r["concurrencia"]["rechazos_cuota"] >= 1
+
+def test_pdf_con_varias_guias_se_parte():
+    r = ejecutar_benchmark(n_documentos=6, semilla=5, pasadas=1, proporcion_multiguia=1.0, latencia="fija:0")
+    assert r["corpus"]["guias"] > r["corpus"]["pdfs"]
+    pasada = r["pasadas"][0]
+    assert pasada["guias"] == r["corpus"]["guias"] and pasada["correctas"] == pasada["guias"]
@@ -0,0 +1,60 @@
+import time
+import threading
+from collections import OrderedDict, deque
+from src.services import planificador_ocr as po
+from src.config.settings import OCR_TURNO_MASIVO
+
+class _T:
+    def __init__(self, usuario):
+        self.usuario = usuario
+
+def _colas(interactivo=(), masivo=()):
+    colas = {c: OrderedDict() for c in po.CARRILES}
+    for carril, usuarios in ((po.CARRIL_INTERACTIVO, interactivo), (po.CARRIL_MASIVO, masivo)):
+        for u in usuarios:
+            colas[carril].setdefault(u, deque()).append(_T(u))
+    return colas
+
+def test_carril_vacio():
+    assert po._carril_siguiente(_colas(), 0) is None
+
+def test_interactivo_primero_con_turno_reservado_al_masivo():
+    colas = _colas(interactivo=["a"] * 10, masivo=["b"] * 10)
+    carriles = [po._carril_siguiente(colas, d) for d in range(2 * OCR_TURNO_MASIVO)]
+    assert carriles.count(po.CARRIL_MASIVO) == 2
+    assert carriles[OCR_TURNO_MASIVO - 1] == po.CARRIL_MASIVO
+    assert carriles[0] == po.CARRIL_INTERACTIVO or OCR_TURNO_MASIVO == 1
+
+def test_solo_masivo():
+    assert po._carril_siguiente(_colas(masivo=["b"]), 0) == po.CARRIL_MASIVO
+
+def test_round_robin_entre_usuarios():
+    colas = _colas(interactivo=["ana", "ana", "ana", "luis"])
+    orden = [po._sacar(colas, po.CARRIL_INTERACTIVO).usuario for _ in range(4)]
+    assert orden == ["ana", "luis", "ana", "ana"]
+    assert not colas[po.CARRIL_INTERACTIVO]
+
+def test_enviar_trabajo_devuelve_el_resultado_y_la_excepcion():
+    assert po.enviar_trabajo_ocr(sum, [1, 2, 3], usuario="ana").result(timeout=5) == 6
+
+    def falla():
+        raise ValueError("sin guía")
+    futuro = po.enviar_trabajo_ocr(falla, usuario="ana", carril="desconocido")
+    assert isinstance(futuro.exception(timeout=5), ValueError)
+
+def test_posicion_y_cancelacion_mientras_espera():
+    liberar = threading.Event()
+    bloqueos = [po.enviar_trabajo_ocr(liberar.wait, 5, usuario="ocupa") for _ in range(po.OCR_PLANIFICADOR_HILOS)]
+    try:
+        limite = time.time() + 5
+        while po.estado_planificador()["en_ejecucion"] < po.OCR_PLANIFICADOR_HILOS and time.time() < limite:
+            time.sleep(0.01) # Todos los hilos ocupados: el siguiente trabajo queda en cola
+        pendiente = po.enviar_trabajo_ocr(lambda: "hecho", usuario="luis")
+        assert po.posicion_en_cola("luis") == 0
+        assert po.posicion_en_cola("nadie") is None
+        assert pendiente.cancel()
+        assert po.posicion_en_cola("luis") is None
+    finally:
+        liberar.set()
+    for f in bloqueos:
+        f.result(timeout=5)
@@ -0,0 +1,34 @@
+from src.utils.respuesta_utils import interpretar_respuesta_guia, interpretar_respuesta_lote, numero_como_texto
+
+COMPACTA = ('{"cl": " CAMPOSOL S.A. ", "ruc": "20340584237", "fe": "05/03/2025", "se": "T001-123", "ve": "ABC-123",'
+            ' "pp": "Chao", "pl": "Trujillo", "de": "INECOVE", "dr": null,'
+            ' "it": [{"d": "CARTON", "c": "1,500.00 KG", "u": "kg", "p": "1.500,5"}]}')
+
+def test_claves_compactas_al_esquema_largo():
+    guia = interpretar_respuesta_guia(COMPACTA)
+    assert guia["cliente"] == "CAMPOSOL S.A."
+    assert guia["ruc_cliente"] == "20340584237"
+    assert guia["documentos_relacionados"] == ""
+    assert guia["items"] == [{"desc": "CARTON", "cant": "1500.00", "um": "KG", "peso": "1500.5"}]
+
+def test_json_con_cerco_y_coma_final():
+    guia = interpretar_respuesta_guia('Aquí está:\n```json\n{"cl": "X", "it": [{"d": "A", "c": "1", "u": "", "p": "2"},],}\n```')
+    assert guia["cliente"] == "X"
+    assert guia["items"][0]["peso"] == "2"
+
+def test_arreglo_de_un_elemento_e_item_suelto():
+    guia = interpretar_respuesta_guia('[{"cl": "X", "it": {"d": "A", "c": "3", "u": "und", "p": ""}}]')
+    assert guia["items"] == [{"desc": "A", "cant": "3", "um": "UND", "peso": "0.00"}]
+
+def test_json_irrecuperable_devuelve_none():
+    assert interpretar_respuesta_guia('{"cl": "X", "it": [') is None
+    assert interpretar_respuesta_guia("") is None
+
+def test_lote_conserva_indices():
+    guias = interpretar_respuesta_lote('[{"ix": 1, "cl": "B"}, {"ix": 0, "cl": "A"}, "basura"]')
+    assert [(g["indice"], g["cliente"]) for g in guias] == [(1, "B"), (0, "A")]
+
+def test_numero_como_texto():
+    assert numero_como_texto("2,000.25") == "2000.25"
+    assert numero_como_texto("1.500,50") == "1500.50"
+    assert numero_como_texto(None) == "0.00"
@@ -0,0 +1,101 @@
+import pytest
+from src.services import sheets_incremental as si
+from src.config.settings import SHEETS_DELTA_VENTANA
+
+class _Hoja:
+    """Servicio de Sheets falso: una pestaña en memoria y registro de los rangos pedidos."""
+
+    def __init__(self, filas):
+        self.filas = filas
+        self.pedidos = []
+
+    def spreadsheets(self): return self
+    def values(self): return self
+
+    def _rango(self, rango):
+        # 'Pestaña'!A1:J o 'Pestaña'!H1:H20
+        celdas = rango.split("!")[1]
+        ini, fin = celdas.split(":")
+        col_ini = si._indice_columna("".join(c for c in ini if c.isalpha()))
+        col_fin = si._indice_columna("".join(c for c in fin if c.isalpha()))
+        fila_ini = int("".join(c for c in ini if c.isdigit()))
+        dig_fin = "".join(c for c in fin if c.isdigit())
+        fila_fin = int(dig_fin) if dig_fin else len(self.filas)
+        valores = [f[col_ini:col_fin + 1] for f in self.filas[fila_ini - 1:fila_fin]]
+        return {"values": valores}
+
+    def get(self, spreadsheetId, range):
+        self.pedidos.append(("get", [range]))
+        self._respuesta = self._rango(range)
+        return self
+
+    def batchGet(self, spreadsheetId, ranges):
+        self.pedidos.append(("batchGet", list(ranges)))
+        self._respuesta = {"valueRanges": [self._rango(r) for r in ranges]}
+        return self
+
+    def execute(self):
+        return self._respuesta
+
+@pytest.fixture(autouse=True)
+def _limpio():
+    si.reiniciar_sincronizacion()
+    yield
+    si.reiniciar_sincronizacion()
+
+def _filas(n):
+    return [[f"G{i}", "CLIENTE", "Pendiente"] for i in range(n)]
+
+def _sincronizar(hoja, **kw):
+    return si.sincronizar_pestana(hoja, "sid", "historial", "C", columnas_estado=("C",), **kw)
+
+def test_indice_columna():
+    assert [si._indice_columna(c) for c in ("A", "H", "Z", "AA", "AB")] == [0, 7, 25, 26, 27]
+
+def test_letra_columna_inversa():
+    assert [si._letra_columna(i) for i in (0, 10, 25, 26, 51, 52, 701, 702)] == ["A", "K", "Z", "AA", "AZ", "BA", "ZZ", "AAA"]
+    assert all(si._indice_columna(si._letra_columna(i)) == i for i in range(1000))
+
+def test_primera_lectura_completa_y_luego_solo_filas_nuevas():
+    hoja = _Hoja(_filas(SHEETS_DELTA_VENTANA + 10))
+    r = _sincronizar(hoja)
+    assert r["completa"] and len(r["filas"]) == SHEETS_DELTA_VENTANA + 10
+
+    hoja.filas += _filas(SHEETS_DELTA_VENTANA + 13)[-3:]
+    r = _sincronizar(hoja)
+    assert not r["completa"]
+    assert r["desde"] == SHEETS_DELTA_VENTANA + 10 and len(r["filas"]) == SHEETS_DELTA_VENTANA + 13
+    assert hoja.pedidos[-1][0] == "batchGet"
+    estado = si.estado_sincronizacion()["historial"]
+    assert (estado["lecturas_completas"], estado["lecturas_incrementales"]) == (1, 1)
+
+def test_cambio_de_estado_en_fila_antigua():
+    hoja = _Hoja(_filas(SHEETS_DELTA_VENTANA + 5))
+    _sincronizar(hoja)
+    hoja.filas[0] = ["G0", "CLIENTE", "Facturado"]
+    r = _sincronizar(hoja)
+    assert not r["completa"] and r["modificadas"] == [0]
+    assert r["filas"][0][2] == "Facturado"
+
+def test_edicion_en_la_cola_fuerza_recarga():
+    hoja = _Hoja(_filas(SHEETS_DELTA_VENTANA + 5))
+    _sincronizar(hoja)
+    hoja.filas[-1] = ["G-editada", "OTRO", "Pendiente"]
+    r = _sincronizar(hoja)
+    assert r["completa"] and r["filas"][-1][0] == "G-editada"
+
+def test_filas_borradas_fuerzan_recarga():
+    hoja = _Hoja(_filas(SHEETS_DELTA_VENTANA + 5))
+    _sincronizar(hoja)
+    del hoja.filas[-2:]
+    r = _sincronizar(hoja)
+    assert r["completa"] and len(r["filas"]) == SHEETS_DELTA_VENTANA + 3
+
+def test_ttl_evita_la_llamada_hasta_vencer_la_pestana():
+    hoja = _Hoja(_filas(5))
+    _sincronizar(hoja, ttl_s=60)
+    _sincronizar(hoja, ttl_s=60)
+    assert len(hoja.pedidos) == 1
+    si.vencer_pestana("sid", "historial")
+    _sincronizar(hoja, ttl_s=60)
+    assert len(hoja.pedidos) == 2
@@ -0,0 +1,34 @@
+import pytest
+
+from src.utils.validacion_utils import campos_invalidos_guia, placa_valida, ruc_valido, serie_valida
+
+@pytest.mark.parametrize("ruc", ["20100070970", "20340584237", "10467793549", "20.100.070.970"])
+def test_ruc_valido_acepta_digito_verificador_correcto(ruc):
+    assert ruc_valido(ruc)
+
+@pytest.mark.parametrize("ruc", ["20100070971", "2010007097", "30100070970", "", None])
+def test_ruc_valido_rechaza_verificador_largo_o_prefijo(ruc):
+    assert not ruc_valido(ruc)
+
+@pytest.mark.parametrize("placa", ["ABC-123", "A1B-123", "ab1123", "1234-AB", "AB-1234", "ABC-123 / XYZ-456"])
+def test_placa_valida_formatos_peruanos(placa):
+    assert placa_valida(placa)
+
+@pytest.mark.parametrize("placa", ["ABCD-123", "AB-12", "", "S/P", None])
+def test_placa_valida_rechaza_ilegibles(placa):
+    assert not placa_valida(placa)
+
+def test_serie_valida_exige_cuatro_caracteres():
+    assert serie_valida("EG07-00001221")
+    assert not serie_valida("T01-0001")
+
+def test_campos_invalidos_guia_lista_solo_los_que_fallan():
+    datos = {
+        "cliente": "CAMPOSOL S.A.", "ruc_cliente": "20340584237", "fecha": "05/03/2025", "serie": "T001-123",
+        "vehiculo": "ABC-123", "punto_partida": "Chao", "punto_llegada": "Trujillo", "destinatario": "INECOVE",
+        "items": [{"desc": "CARTON", "cant": "10", "peso": "10.00"}],
+    }
+    assert campos_invalidos_guia(datos) == []
+    datos.update(ruc_cliente="20340584230", vehiculo="", items=[])
+    assert campos_invalidos_guia(datos) == ["ruc_cliente", "vehiculo", "items"]
+    assert campos_invalidos_guia(None, ["fecha"]) == ["fecha"]
@@ -0,0 +1,56 @@
+import pytest
+from src.services import vertex_cuota as vc
+from src.config.settings import VERTEX_CONCURRENCIA_MIN, VERTEX_CONCURRENCIA_MAX, VERTEX_BACKOFF_MAX_S
+
+@pytest.fixture(autouse=True)
+def _limite(monkeypatch):
+    monkeypatch.setitem(vc._estado, "limite", 4.0)
+    monkeypatch.setitem(vc._estado, "en_vuelo", 0)
+    monkeypatch.setitem(vc._estado, "ultimo_recorte", 0.0)
+
+def test_es_error_cuota():
+    assert vc.es_error_cuota("429 Too Many Requests")
+    assert vc.es_error_cuota(Exception("RESOURCE_EXHAUSTED: quota"))
+    assert not vc.es_error_cuota("503 UNAVAILABLE")
+
+def test_sin_cupo_no_se_lanza():
+    assert all(vc.intentar_cupo() for _ in range(4))
+    assert not vc.intentar_cupo()
+    assert not vc.adquirir_cupo(plazo_s=0.01)
+    vc.liberar_cupo()
+    assert vc.intentar_cupo()
+
+def test_aumento_aditivo_por_exito():
+    vc.intentar_cupo()
+    vc.liberar_cupo("exito")
+    assert vc._estado["limite"] == pytest.approx(4.25)
+    assert vc._estado["en_vuelo"] == 0
+
+def test_recorte_multiplicativo_una_vez_por_ventana():
+    for _ in range(3):
+        vc.intentar_cupo()
+        vc.liberar_cupo("cuota")
+    assert vc._estado["limite"] == 2.0
+
+def test_limites_del_aimd(monkeypatch):
+    monkeypatch.setitem(vc._estado, "limite", float(VERTEX_CONCURRENCIA_MIN))
+    vc.liberar_cupo("cuota")
+    assert vc._estado["limite"] == VERTEX_CONCURRENCIA_MIN
+    monkeypatch.setitem(vc._estado, "limite", float(VERTEX_CONCURRENCIA_MAX))
+    vc.liberar_cupo("exito")
+    assert vc._estado["limite"] == VERTEX_CONCURRENCIA_MAX
+
+def test_error_ajeno_no_mueve_el_limite():
+    with pytest.raises(RuntimeError):
+        with vc.cupo_vertex():
+            raise RuntimeError("503 UNAVAILABLE")
+    assert vc._estado["limite"] == 4.0 and vc._estado["en_vuelo"] == 0
+
+def test_cupo_vertex_clasifica_el_429():
+    with pytest.raises(RuntimeError):
+        with vc.cupo_vertex():
+            raise RuntimeError("429 RESOURCE_EXHAUSTED")
+    assert vc._estado["limite"] == 2.0
+
+def test_espera_reintento_acotada():
+    assert all(0 <= vc.espera_reintento(i) <= VERTEX_BACKOFF_MAX_S for i in range(12))
@@ -0,0 +1,68 @@
+import pytest
+from src.services import vertex_health as vh
+from src.config.settings import VERTEX_FALLOS_PARA_ABRIR
+
+REGIONES = ["us-central1", "us-east4"]
+NIVELES = [["flash"], ["pro"]]
+
+@pytest.fixture(autouse=True)
+def _limpio(monkeypatch):
+    monkeypatch.setattr(vh, "_rutas", {})
+    monkeypatch.setattr(vh, "_regiones", {})
+    monkeypatch.setattr(vh, "_muestras", {})
+    monkeypatch.setattr(vh, "_ultima_ruta_exitosa", {"ruta": None})
+
+def test_orden_original_sin_historial():
+    assert vh.ordenar_rutas(REGIONES, NIVELES) == [
+        ("us-central1", "flash"), ("us-east4", "flash"), ("us-central1", "pro"), ("us-east4", "pro")]
+
+def test_404_abre_el_circuito_de_inmediato():
+    vh.registrar_fallo_ruta("us-central1", "flash", "404 NOT_FOUND model retired")
+    assert ("us-central1", "flash") not in vh.ordenar_rutas(REGIONES, NIVELES)
+
+def test_fallos_consecutivos_abren_y_un_exito_cierra():
+    for _ in range(VERTEX_FALLOS_PARA_ABRIR - 1):
+        vh.registrar_fallo_ruta("us-central1", "flash", "500 INTERNAL")
+    rutas = vh.ordenar_rutas(REGIONES, NIVELES)
+    assert rutas.index(("us-east4", "flash")) < rutas.index(("us-central1", "flash"))
+    vh.registrar_fallo_ruta("us-central1", "flash", "500 INTERNAL")
+    assert ("us-central1", "flash") not in vh.ordenar_rutas(REGIONES, NIVELES)
+    vh.registrar_exito_ruta("us-central1", "flash", 1.0)
+    assert ("us-central1", "flash") in vh.ordenar_rutas(REGIONES, NIVELES)
+
+def test_timeouts_abren_la_region():
+    for _ in range(VERTEX_FALLOS_PARA_ABRIR):
+        vh.registrar_fallo_ruta("us-east4", "flash", "DEADLINE_EXCEEDED")
+    assert [r for r in vh.ordenar_rutas(REGIONES, NIVELES) if r[0] == "us-east4"] == []
+
+def test_todas_abiertas_half_open_por_reapertura():
+    vh.registrar_fallo_ruta("us-central1", "flash", "404")
+    for region, modelo in [("us-east4", "flash"), ("us-central1", "pro"), ("us-east4", "pro")]:
+        for _ in range(VERTEX_FALLOS_PARA_ABRIR):
+            vh.registrar_fallo_ruta(region, modelo, "500 INTERNAL")
+    rutas = vh.ordenar_rutas(REGIONES, NIVELES)
+    assert len(rutas) == 4 and rutas[-1] == ("us-central1", "flash")
+
+def test_ultima_exitosa_primero_dentro_del_nivel():
+    vh.registrar_exito_ruta("us-central1", "flash", 1.0)
+    vh.registrar_exito_ruta("us-east4", "flash", 3.0)
+    assert vh.obtener_ultima_ruta_exitosa() == ("us-east4", "flash")
+    assert vh.ordenar_rutas(REGIONES, NIVELES)[:2] == [("us-east4", "flash"), ("us-central1", "flash")]
+
+def test_ultima_exitosa_no_salta_de_nivel():
+    vh.registrar_exito_ruta("us-central1", "pro", 1.0)
+    assert vh.ordenar_rutas(REGIONES, NIVELES)[0] == ("us-central1", "flash")
+
+def test_mas_rapida_primero_entre_las_demas():
+    vh.registrar_exito_ruta("us-central1", "flash", 3.0)
+    vh.registrar_exito_ruta("us-east4", "flash", 1.0)
+    vh.registrar_exito_ruta("us-central1", "pro", 1.0)
+    assert vh.ordenar_rutas(REGIONES, NIVELES)[:2] == [("us-east4", "flash"), ("us-central1", "flash")]
+
+def test_latencia_p95():
+    for s in range(1, vh.MIN_MUESTRAS_P95):
+        vh.registrar_exito_ruta("us-central1", "flash", float(s))
+    assert vh.latencia_p95("us-central1", "flash") is None
+    for s in range(vh.MIN_MUESTRAS_P95, 21):
+        vh.registrar_exito_ruta("us-central1", "flash", float(s))
+    assert vh.latencia_p95("us-central1", "flash") == 20.0